@@ -0,0 +1,256 @@
+# app/analytics.py
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Optional
+
+from .runlog import iter_segments
+from .sketch import QuantileSketch
+
+STATE_VERSION = 1
+ALLOW_ACTIONS = ("ALLOW", "ALLOW_WITH_GUARDRAILS")
+
+
+# ---------------------------
+# Row normalisation
+# ---------------------------
+
+def row_day(row: Dict[str, Any]) -> str:
+    """YYYY-MM-DD from an ISO timestamp or the legacy 20260212_002315 form."""
+    ts = str(row.get("timestamp") or "")
+    if len(ts) >= 10 and ts[4] == "-" and ts[7] == "-":
+        return ts[:10]
+    if len(ts) >= 8 and ts[:8].isdigit():
+        return f"{ts[:4]}-{ts[4:6]}-{ts[6:8]}"
+    return "unknown"
+
+
+def _number(value: Any) -> Optional[float]:
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    return float(value)
+
+
+# ---------------------------
+# Aggregates
+# ---------------------------
+
+@dataclass
+class GroupStats:
+    runs: int = 0
+    allow: int = 0
+    block: int = 0
+    degraded: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    risk: QuantileSketch = field(default_factory=QuantileSketch)
+    latency_ms: QuantileSketch = field(default_factory=QuantileSketch)
+
+    def add(self, action: str, row: Dict[str, Any]) -> None:
+        self.runs += 1
+        if action == "BLOCK":
+            self.block += 1
+        elif action in ALLOW_ACTIONS:
+            self.allow += 1
+        if row.get("degraded"):
+            self.degraded += 1
+        self.prompt_tokens += int(_number(row.get("prompt_tokens")) or 0)
+        self.completion_tokens += int(_number(row.get("completion_tokens")) or 0)
+        risk = _number(row.get("risk_score"))
+        if risk is not None:
+            self.risk.add(risk)
+        latency = _number(row.get("total_ms", row.get("latency_ms")))
+        if latency is not None:
+            self.latency_ms.add(latency)
+
+    def merge(self, other: "GroupStats") -> None:
+        for name in ("runs", "allow", "block", "degraded", "prompt_tokens", "completion_tokens"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.risk.merge(other.risk)
+        self.latency_ms.merge(other.latency_ms)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "runs": self.runs,
+            "allow": self.allow,
+            "block": self.block,
+            "degraded": self.degraded,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "risk_score": self.risk.summary((0.5, 0.9, 0.99)),
+            "latency_ms": self.latency_ms.summary((0.5, 0.95, 0.99)),
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            k: getattr(self, k) for k in ("runs", "allow", "block", "degraded", "prompt_tokens", "completion_tokens")
+        }
+        out["risk"] = self.risk.to_dict()
+        out["latency_ms"] = self.latency_ms.to_dict()
+        return out
+
+    @classmethod
+    def from_state(cls, data: Dict[str, Any]) -> "GroupStats":
+        g = cls(**{k: int(data.get(k, 0)) for k in ("runs", "allow", "block", "degraded", "prompt_tokens", "completion_tokens")})
+        g.risk = QuantileSketch.from_dict(data.get("risk") or {})
+        g.latency_ms = QuantileSketch.from_dict(data.get("latency_ms") or {})
+        return g
+
+
+class RunAnalytics:
+    """
+    Single-pass aggregation over run-log rows: overall, and grouped by intent, action
+    and day. Memory is bounded by the number of groups and sketch buckets, not by the
+    number of rows. Rows with missing or malformed fields are counted, not fatal.
+    """
+
+    def __init__(self) -> None:
+        self.overall = GroupStats()
+        self.groups: Dict[str, Dict[str, GroupStats]] = {"intent": {}, "action": {}, "day": {}}
+        self.bad_lines = 0
+        self.missing_action = 0
+
+    def add(self, row: Dict[str, Any]) -> None:
+        action = str(row.get("action") or "").strip().upper()
+        if not action:
+            self.missing_action += 1
+            action = "UNKNOWN"
+        keys = {
+            "intent": str(row.get("intent") or "UNKNOWN").upper(),
+            "action": action,
+            "day": row_day(row),
+        }
+        self.overall.add(action, row)
+        for dim, key in keys.items():
+            group = self.groups[dim].get(key)
+            if group is None:
+                group = self.groups[dim][key] = GroupStats()
+            group.add(action, row)
+
+    def add_line(self, line: bytes) -> None:
+        line = line.strip()
+        if not line:
+            return
+        try:
+            row = json.loads(line)
+        except ValueError:
+            self.bad_lines += 1
+            return
+        if isinstance(row, dict):
+            self.add(row)
+        else:
+            self.bad_lines += 1
+
+    def merge(self, other: "RunAnalytics") -> None:
+        self.overall.merge(other.overall)
+        for dim, groups in other.groups.items():
+            mine = self.groups.setdefault(dim, {})
+            for key, g in groups.items():
+                mine.setdefault(key, GroupStats()).merge(g)
+        self.bad_lines += other.bad_lines
+        self.missing_action += other.missing_action
+
+    def report(self) -> Dict[str, Any]:
+        o = self.overall
+        mean_risk = o.risk.mean()
+        return {
+            # Fields kept from the original eval_report.json
+            "total_runs": o.runs,
+            "allow_count": o.allow,
+            "block_count": o.block,
+            "avg_risk_score": round(mean_risk, 3) if mean_risk is not None else None,
+            "overall": o.summary(),
+            "by_intent": {k: g.summary() for k, g in sorted(self.groups["intent"].items())},
+            "by_action": {k: g.summary() for k, g in sorted(self.groups["action"].items())},
+            "by_day": {k: g.summary() for k, g in sorted(self.groups["day"].items())},
+            "bad_lines": self.bad_lines,
+            "missing_action": self.missing_action,
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            "overall": self.overall.to_state(),
+            "groups": {dim: {k: g.to_state() for k, g in gs.items()} for dim, gs in self.groups.items()},
+            "bad_lines": self.bad_lines,
+            "missing_action": self.missing_action,
+        }
+
+    @classmethod
+    def from_state(cls, data: Dict[str, Any]) -> "RunAnalytics":
+        a = cls()
+        a.overall = GroupStats.from_state(data.get("overall") or {})
+        for dim, gs in (data.get("groups") or {}).items():
+            a.groups[dim] = {k: GroupStats.from_state(g) for k, g in gs.items()}
+        a.bad_lines = int(data.get("bad_lines", 0))
+        a.missing_action = int(data.get("missing_action", 0))
+        return a
+
+
+# ---------------------------
+# Streaming over log segments
+# ---------------------------
+
+def _open_binary(path: Path) -> BinaryIO:
+    return gzip.open(path, "rb") if path.suffix == ".gz" else path.open("rb")  # type: ignore[return-value]
+
+
+def _head_hash(path: Path) -> Optional[str]:
+    """Identity of a segment: hash of its first line (survives rename and gzip)."""
+    with _open_binary(path) as f:
+        first = f.readline()
+    return hashlib.sha256(first).hexdigest() if first.endswith(b"\n") else None
+
+
+def _consume(f: BinaryIO, start: int, analytics: RunAnalytics) -> int:
+    """Feed complete lines from byte offset start; return the offset after the last one."""
+    if start:
+        f.seek(start)  # gzip streams emulate seek by decompressing forward
+    pos = start
+    for line in f:
+        if not line.endswith(b"\n"):
+            break  # a writer is mid-flush; pick this line up next time
+        analytics.add_line(line)
+        pos += len(line)
+    return pos
+
+
+def scan_log(
+    path: Path,
+    analytics: RunAnalytics,
+    checkpoint: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Stream every segment of a run log (rotated .jsonl.gz / .jsonl, then the live file)
+    into analytics and return a new checkpoint.
+
+    With a checkpoint, only new data is read: rotated segments already consumed are
+    skipped by name, and the segment that was live last time (recognised by the hash of
+    its first line, even after rotation and compression) resumes at the saved offset.
+    """
+    cp = checkpoint or {}
+    done = set(cp.get("segments_done") or [])
+    live_cp = cp.get("live") or {}
+    new_live: Dict[str, Any] = {}
+
+    for seg in iter_segments(path):
+        is_live = seg == path
+        # A rotated segment is gzipped after rotation; both names are the same segment.
+        name = seg.name[:-3] if seg.name.endswith(".gz") else seg.name
+        if not is_live and name in done:
+            continue
+        head = _head_hash(seg)
+        start = int(live_cp.get("offset", 0)) if head is not None and head == live_cp.get("head") else 0
+        with _open_binary(seg) as f:
+            end = _consume(f, start, analytics)
+        if is_live:
+            if head is not None:
+                new_live = {"head": head, "offset": end}
+        else:
+            done.add(name)
+
+    return {"version": STATE_VERSION, "segments_done": sorted(done), "live": new_live}
+
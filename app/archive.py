@@ -0,0 +1,363 @@
+# app/archive.py
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Set, Tuple
+
+# Record layout in a segment file:
+#   MAGIC | header_len:u32 | body_len:u64 | crc32(header+body):u32 | header (JSON) | body
+# The header lists each artifact as [name, offset, length, status] into the body.
+MAGIC = b"CAR1"
+_PREFIX = struct.Struct("<4sIQI")
+SEGMENT_GLOB = "seg-*.car"
+INDEX_NAME = "index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cases (
+    case_id    TEXT PRIMARY KEY,
+    ts         REAL NOT NULL,
+    intent     TEXT,
+    action     TEXT,
+    risk_score INTEGER,
+    status     TEXT,
+    segment    TEXT NOT NULL,
+    offset     INTEGER NOT NULL,
+    length     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cases_ts ON cases (ts);
+CREATE INDEX IF NOT EXISTS cases_intent ON cases (intent, ts);
+CREATE INDEX IF NOT EXISTS cases_action ON cases (action, ts);
+"""
+
+
+class ArchiveError(RuntimeError):
+    """Unknown case id or a damaged record."""
+
+
+@dataclass
+class ArchivedCase:
+    case_id: str
+    ts: float
+    meta: Dict[str, Any]
+    status: str
+    artifacts: Dict[str, Dict[str, Any]]
+    files: Dict[str, bytes]
+
+
+def _segment_name(n: int) -> str:
+    return f"seg-{n:06d}.car"
+
+
+def _encode(header: Dict[str, Any], body: bytes) -> bytes:
+    head = json.dumps(header, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    crc = zlib.crc32(body, zlib.crc32(head))
+    return _PREFIX.pack(MAGIC, len(head), len(body), crc) + head + body
+
+
+def _read_record(f: Any) -> Optional[Tuple[Dict[str, Any], bytes, int]]:
+    """Read one record at the current position; None at a clean end or a torn tail."""
+    prefix = f.read(_PREFIX.size)
+    if len(prefix) < _PREFIX.size:
+        return None
+    magic, head_len, body_len, crc = _PREFIX.unpack(prefix)
+    if magic != MAGIC:
+        return None
+    head = f.read(head_len)
+    body = f.read(body_len)
+    if len(head) < head_len or len(body) < body_len or zlib.crc32(body, zlib.crc32(head)) != crc:
+        return None
+    return json.loads(head), body, _PREFIX.size + head_len + body_len
+
+
+class CaseArchive:
+    """
+    Append-only store for case artifacts: one record per case in rolling segment files
+    (seg-000001.car, ...) plus a sqlite index (case_id -> segment/offset, with timestamp,
+    intent and action columns for queries).
+
+    Replaces one directory of small files per case. Segments roll over at segment_bytes.
+    The record is written before its index row, so after a crash open() re-indexes any
+    complete records past the last indexed one and truncates a torn tail.
+
+    readonly=True is for inspecting an archive a writer may be appending to: there is no
+    append handle, and an incomplete tail is left alone (only complete records are
+    indexed), since it may be a record still being written.
+    """
+
+    def __init__(self, root: Path, segment_bytes: int = 64 * 1024 * 1024, fsync: bool = False, readonly: bool = False):
+        self.root = root
+        self.segment_bytes = max(1, segment_bytes)
+        self.fsync = fsync
+        self.readonly = readonly
+        if readonly:
+            if not self.root.is_dir():
+                raise ArchiveError(f"no archive at {self.root}")
+        else:
+            self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._reserved: Set[str] = set()
+        self._db = sqlite3.connect(str(self.root / INDEX_NAME), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._recover()
+        self._seg: Optional[BinaryIO] = None
+        if not readonly:
+            segments = self.segments()
+            self._seg_no = int(segments[-1].stem.split("-")[1]) if segments else 1
+            self._seg = (self.root / _segment_name(self._seg_no)).open("ab")
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+
+    def reserve(self, name: str) -> str:
+        """Return an unused case id based on name (name, name_2, ...) and hold it until append()."""
+        with self._lock:
+            n = 1
+            while True:
+                case_id = name if n == 1 else f"{name}_{n}"
+                if case_id not in self._reserved and not self._exists(case_id):
+                    self._reserved.add(case_id)
+                    return case_id
+                n += 1
+
+    def release(self, case_id: str) -> None:
+        """Give back a reserved id whose case failed before it was appended."""
+        with self._lock:
+            self._reserved.discard(case_id)
+
+    def append(
+        self,
+        case_id: str,
+        files: Dict[str, bytes],
+        meta: Optional[Dict[str, Any]] = None,
+        artifacts: Optional[Dict[str, Dict[str, Any]]] = None,
+    ) -> Tuple[str, int]:
+        """
+        Append one case. artifacts carries per-file status (e.g. errors for files that
+        were never produced); files without an entry are recorded as done.
+        Returns (segment name, offset).
+        """
+        meta = dict(meta or {})
+        statuses = dict(artifacts or {})
+        entries: List[List[Any]] = []
+        parts: List[bytes] = []
+        pos = 0
+        for name in sorted(set(files) | set(statuses)):
+            data = files.get(name, b"")
+            status = statuses.get(name, {}).get("status", "done")
+            entry: List[Any] = [name, pos, len(data), status]
+            if "error" in statuses.get(name, {}):
+                entry.append(statuses[name]["error"])
+            entries.append(entry)
+            parts.append(data)
+            pos += len(data)
+        status = "failed" if any(e[3] == "error" for e in entries) else "complete"
+        ts = time.time()
+        header = {"case_id": case_id, "ts": ts, "status": status, "meta": meta, "files": entries}
+        record = _encode(header, b"".join(parts))
+
+        with self._lock:
+            if self._seg is None:
+                raise ArchiveError(f"{self.root} is open read-only")
+            if self._exists(case_id):
+                raise ArchiveError(f"case {case_id!r} is already archived")
+            if self._seg.tell() > 0 and self._seg.tell() + len(record) > self.segment_bytes:
+                self._roll()
+            segment = _segment_name(self._seg_no)
+            offset = self._seg.tell()
+            self._seg.write(record)
+            self._seg.flush()
+            if self.fsync:
+                os.fsync(self._seg.fileno())
+            self._index(header, segment, offset, len(record))
+            self._db.commit()
+            self._reserved.discard(case_id)
+        return segment, offset
+
+    def _roll(self) -> None:
+        assert self._seg is not None
+        self._seg.close()
+        self._seg_no += 1
+        self._seg = (self.root / _segment_name(self._seg_no)).open("ab")
+
+    def _index(self, header: Dict[str, Any], segment: str, offset: int, length: int) -> None:
+        meta = header.get("meta") or {}
+        self._db.execute(
+            "INSERT OR REPLACE INTO cases VALUES (?,?,?,?,?,?,?,?,?)",
+            (
+                header["case_id"],
+                header["ts"],
+                meta.get("intent"),
+                meta.get("action"),
+                meta.get("risk_score"),
+                header.get("status"),
+                segment,
+                offset,
+                length,
+            ),
+        )
+
+    def _exists(self, case_id: str) -> bool:
+        return self._db.execute("SELECT 1 FROM cases WHERE case_id=?", (case_id,)).fetchone() is not None
+
+    # ---------------------------
+    # Reading
+    # ---------------------------
+
+    def get(self, case_id: str) -> ArchivedCase:
+        with self._lock:
+            row = self._db.execute("SELECT segment, offset FROM cases WHERE case_id=?", (case_id,)).fetchone()
+        if row is None:
+            raise ArchiveError(f"unknown case {case_id!r}")
+        segment, offset = row
+        with (self.root / segment).open("rb") as f:
+            f.seek(offset)
+            rec = _read_record(f)
+        if rec is None:
+            raise ArchiveError(f"damaged record for {case_id!r} in {segment}@{offset}")
+        header, body, _ = rec
+        files: Dict[str, bytes] = {}
+        artifacts: Dict[str, Dict[str, Any]] = {}
+        for entry in header["files"]:
+            name, pos, length, status = entry[:4]
+            artifacts[name] = {"status": status, "bytes": length}
+            if len(entry) > 4:
+                artifacts[name]["error"] = entry[4]
+            if status == "done":
+                files[name] = body[pos : pos + length]
+        return ArchivedCase(
+            case_id=header["case_id"],
+            ts=header["ts"],
+            meta=header.get("meta") or {},
+            status=header.get("status", "complete"),
+            artifacts=artifacts,
+            files=files,
+        )
+
+    def read_file(self, case_id: str, name: str) -> bytes:
+        case = self.get(case_id)
+        if name not in case.files:
+            raise ArchiveError(f"{case_id!r} has no artifact {name!r}")
+        return case.files[name]
+
+    def query(
+        self,
+        intent: Optional[str] = None,
+        action: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        limit: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Index rows (newest first) filtered by intent, action and a [since, until) time range."""
+        where: List[str] = []
+        params: List[Any] = []
+        for col, value in (("intent", intent), ("action", action)):
+            if value:
+                where.append(f"{col}=?")
+                params.append(value.upper())
+        if since is not None:
+            where.append("ts>=?")
+            params.append(since)
+        if until is not None:
+            where.append("ts<?")
+            params.append(until)
+        sql = "SELECT case_id, ts, intent, action, risk_score, status, segment, offset FROM cases"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        cols = ("case_id", "ts", "intent", "action", "risk_score", "status", "segment", "offset")
+        with self._lock:
+            return [dict(zip(cols, r)) for r in self._db.execute(sql, params)]
+
+    def export(self, case_id: str, dest_root: Path) -> Path:
+        """Materialise a classic case folder (artifacts + manifest.json) under dest_root."""
+        from .artifacts import MANIFEST_NAME, write_json
+
+        case = self.get(case_id)
+        case_dir = dest_root / case.case_id
+        case_dir.mkdir(parents=True, exist_ok=True)
+        for name, data in case.files.items():
+            (case_dir / name).write_bytes(data)
+        manifest = {
+            "status": case.status,
+            "updated": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(case.ts)),
+            "artifacts": case.artifacts,
+            "meta": case.meta,
+        }
+        write_json(case_dir / MANIFEST_NAME, manifest)
+        return case_dir
+
+    def segments(self) -> List[Path]:
+        return sorted(self.root.glob(SEGMENT_GLOB))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            (cases,) = self._db.execute("SELECT COUNT(*) FROM cases").fetchone()
+        segments = self.segments()
+        return {"cases": cases, "segments": len(segments), "bytes": sum(p.stat().st_size for p in segments)}
+
+    # ---------------------------
+    # Recovery / maintenance
+    # ---------------------------
+
+    def _scan(self, path: Path, start: int = 0) -> Iterator[Tuple[Dict[str, Any], int, int]]:
+        """Yield (header, offset, length) for complete records from start; stops at a torn tail."""
+        with path.open("rb") as f:
+            f.seek(start)
+            offset = start
+            while True:
+                rec = _read_record(f)
+                if rec is None:
+                    return
+                header, _, length = rec
+                yield header, offset, length
+                offset += length
+
+    def _recover(self) -> None:
+        segments = self.segments()
+        for i, path in enumerate(segments):
+            (end,) = self._db.execute(
+                "SELECT COALESCE(MAX(offset + length), 0) FROM cases WHERE segment=?", (path.name,)
+            ).fetchone()
+            size = path.stat().st_size
+            if size <= end:
+                continue
+            good = end
+            for header, offset, length in self._scan(path, end):
+                self._index(header, path.name, offset, length)
+                good = offset + length
+            if good < size and i == len(segments) - 1 and not self.readonly:
+                with path.open("r+b") as f:
+                    f.truncate(good)  # torn write from a crash mid-append
+        self._db.commit()
+
+    def reindex(self) -> int:
+        """Rebuild the index from the segments alone. Returns the number of cases."""
+        with self._lock:
+            if self.readonly:
+                raise ArchiveError(f"{self.root} is open read-only")
+            self._db.execute("DELETE FROM cases")
+            n = 0
+            for path in self.segments():
+                for header, offset, length in self._scan(path):
+                    self._index(header, path.name, offset, length)
+                    n += 1
+            self._db.commit()
+            return n
+
+    def close(self) -> None:
+        with self._lock:
+            if self._seg is not None:
+                self._seg.close()
+            self._db.close()
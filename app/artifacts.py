@@ -0,0 +1,369 @@
+# app/artifacts.py
+from __future__ import annotations
+
+import atexit
+import json
+import threading
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+if TYPE_CHECKING:
+    from .archive import CaseArchive
+    from .pdfcache import PDFCache
+
+MANIFEST_NAME = "manifest.json"
+
+
+def write_text(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content, encoding="utf-8")
+
+
+def write_json(path: Path, obj: Any) -> None:
+    write_text(path, json.dumps(obj, indent=2, ensure_ascii=False))
+
+
+def render_pdf(md: str, path: Path, title: str) -> None:
+    # Imported here so worker processes (and text-only callers) only load reportlab when needed.
+    from .pdfgen import markdown_to_pdf
+
+    markdown_to_pdf(md, path, title=title)
+
+
+def render_pdf_bytes(md: str, title: str) -> bytes:
+    from .pdfgen import render_pdf_bytes as _render
+
+    return _render(md, title=title)
+
+
+@dataclass
+class _CaseState:
+    artifacts: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    pending: int = 0
+    closed: bool = False
+    done: threading.Event = field(default_factory=threading.Event)
+    manifest_lock: threading.Lock = field(default_factory=threading.Lock)
+    blobs: Dict[str, bytes] = field(default_factory=dict)  # archive mode only
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+
+class ArtifactWriter:
+    """
+    Writes case artifacts (markdown, JSON, PDF) off the response path.
+
+    Jobs run on a bounded thread or process pool; submit() blocks once max_pending jobs
+    are queued, so a slow renderer applies backpressure instead of growing memory.
+    After close_case(), the case folder gets a manifest.json that is rewritten with
+    status "complete" (or "failed") once its last job finishes.
+
+    background=False runs every job inline at submit time (same API, no threads), which
+    is what run_one uses when no writer is passed.
+
+    With a pdf_cache, pdf() first looks the content up in the cache on the calling thread
+    (hash + link, no rendering); only misses are queued for rendering.
+
+    With an archive, nothing is written to case_dir: text/json/pdf artifacts are kept in
+    memory until the case is closed and complete, then appended to the CaseArchive as one
+    record (case_dir.name is the case id). submit() is directory-only.
+    """
+
+    def __init__(
+        self,
+        workers: int = 2,
+        max_pending: int = 64,
+        background: bool = True,
+        processes: bool = False,
+        pdf_cache: Optional["PDFCache"] = None,
+        archive: Optional["CaseArchive"] = None,
+    ):
+        self.background = background
+        self.pdf_cache = pdf_cache
+        self.archive = archive
+        self._executor: Optional[Executor] = None
+        if background:
+            pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+            self._executor = pool(max_workers=max(1, workers))
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._lock = threading.Lock()
+        self._progress = threading.Condition(self._lock)
+        self._cases: Dict[Path, _CaseState] = {}
+        self._closed = False
+        if background:
+            atexit.register(self.shutdown)
+
+    # ---------------------------
+    # Job submission
+    # ---------------------------
+
+    def text(self, case_dir: Path, name: str, content: str) -> None:
+        if self.archive is not None:
+            self._capture(case_dir, name, content.encode("utf-8"))
+            return
+        self.submit(case_dir, name, write_text, case_dir / name, content)
+
+    def json(self, case_dir: Path, name: str, obj: Any) -> None:
+        if self.archive is not None:
+            self._capture(case_dir, name, json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8"))
+            return
+        self.submit(case_dir, name, write_json, case_dir / name, obj)
+
+    def pdf(self, case_dir: Path, name: str, md: str, title: str) -> None:
+        if self.archive is not None:
+            self._pdf_bytes(case_dir, name, md, title)
+            return
+        cache = self.pdf_cache
+        if cache is None:
+            self.submit(case_dir, name, render_pdf, md, case_dir / name, title)
+            return
+        from .pdfcache import render_into_cache
+
+        key = cache.key(md, title)
+        if cache.try_link(key, case_dir / name):
+            self._register(case_dir, name)
+            self._finished(case_dir, name, None)
+            return
+        cache.note_miss()
+        self.submit(case_dir, name, render_into_cache, md, title, cache.blob_path(key), case_dir / name, cache.link_mode)
+
+    def _pdf_bytes(self, case_dir: Path, name: str, md: str, title: str) -> None:
+        cache = self.pdf_cache
+        if cache is None:
+            self._dispatch(case_dir, name, render_pdf_bytes, (md, title), keep=True)
+            return
+        from .pdfcache import render_bytes_into_cache
+
+        key = cache.key(md, title)
+        data = cache.read(key)
+        if data is not None:
+            self._capture(case_dir, name, data)
+            return
+        cache.note_miss()
+        self._dispatch(case_dir, name, render_bytes_into_cache, (md, title, cache.blob_path(key)), keep=True)
+
+    def submit(self, case_dir: Path, name: str, fn: Callable[..., Any], *args: Any) -> None:
+        """Run fn(*args) to produce case_dir/name. fn must be picklable for process pools."""
+        if self.archive is not None:
+            raise ValueError("archive-backed writers only take text/json/pdf artifacts")
+        self._dispatch(case_dir, name, fn, args, keep=False)
+
+    def close_case(self, case_dir: Path, meta: Optional[Dict[str, Any]] = None) -> None:
+        """
+        No more artifacts will be submitted for case_dir; write the manifest (or, with an
+        archive, append the case once its artifacts exist). meta (intent, action, ...) is
+        stored with the archived record and indexed.
+        """
+        with self._lock:
+            state = self._cases.setdefault(case_dir, _CaseState())
+            state.closed = True
+            state.meta.update(meta or {})
+            complete = state.pending == 0
+        if self.archive is None:
+            self._write_manifest(case_dir, state)
+        if complete:
+            self._complete(case_dir, state)
+
+    def discard_case(self, case_dir: Path) -> None:
+        """
+        The case failed before close_case(): forget it. Jobs already running still finish,
+        but no manifest or archive record is written for the case, and its reserved
+        archive id is released.
+        """
+        with self._lock:
+            state = self._cases.pop(case_dir, None)
+            self._progress.notify_all()
+        if self.archive is not None:
+            self.archive.release(case_dir.name)
+        if state is not None:
+            state.done.set()
+
+    # ---------------------------
+    # Waiting / shutdown
+    # ---------------------------
+
+    def wait_case(self, case_dir: Path, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            state = self._cases.get(case_dir)
+        return True if state is None else state.done.wait(timeout)
+
+    def wait_artifact(self, case_dir: Path, name: str, timeout: Optional[float] = None) -> bool:
+        """Wait for one artifact (e.g. a small JSON file) without waiting for the PDFs."""
+        with self._progress:
+            return self._progress.wait_for(
+                lambda: (self._cases.get(case_dir) is None)
+                or self._cases[case_dir].artifacts.get(name, {}).get("status") != "pending",
+                timeout,
+            )
+
+    def artifacts(self, case_dir: Path) -> List[str]:
+        """Artifact paths for a case, whether or not they have been written yet."""
+        with self._lock:
+            state = self._cases.get(case_dir)
+            names = list(state.artifacts) if state else []
+        if not names and self.archive is not None:
+            from .archive import ArchiveError
+
+            try:
+                names = list(self.archive.get(case_dir.name).artifacts)
+            except ArchiveError:
+                names = []
+        elif not names:
+            try:
+                names = list(json.loads((case_dir / MANIFEST_NAME).read_text(encoding="utf-8"))["artifacts"])
+            except (OSError, ValueError, KeyError):
+                names = []
+        return sorted(str(case_dir / n) for n in names)
+
+    def read_text(self, case_dir: Path, name: str) -> str:
+        """Contents of a finished artifact, from memory, the archive or case_dir."""
+        with self._lock:
+            state = self._cases.get(case_dir)
+            data = state.blobs.get(name) if state else None
+        if data is None and self.archive is not None:
+            data = self.archive.read_file(case_dir.name, name)
+        if data is None:
+            return (case_dir / name).read_text(encoding="utf-8")
+        return data.decode("utf-8")
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every submitted job has finished. Returns False on timeout."""
+        end = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                busy = any(s.pending for s in self._cases.values())
+            if not busy:
+                return True
+            if end is not None and time.monotonic() >= end:
+                return False
+            time.sleep(0.01)
+
+    def shutdown(self) -> None:
+        """Finish queued jobs, finalise manifests and stop the pool (no-op when inline)."""
+        if self._closed or not self.background:
+            return
+        self._closed = True
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        with self._lock:
+            leftovers = [(c, s) for c, s in self._cases.items() if not s.closed]
+        for case_dir, state in leftovers:
+            self.close_case(case_dir)
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+
+    def _dispatch(self, case_dir: Path, name: str, fn: Callable[..., Any], args: tuple, keep: bool) -> None:
+        # keep=True: fn returns the artifact's bytes, which are held for the archive record.
+        if self._closed:
+            raise RuntimeError("ArtifactWriter is shut down")
+        self._register(case_dir, name)
+
+        if self._executor is None:
+            try:
+                result = fn(*args)
+                self._finished(case_dir, name, None, result if keep else None)
+            except Exception as e:  # noqa: BLE001 - recorded in the manifest, then re-raised
+                self._finished(case_dir, name, e)
+                raise
+            return
+
+        self._slots.acquire()
+        try:
+            fut = self._executor.submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        fut.add_done_callback(lambda f, c=case_dir, n=name: self._on_done(c, n, f, keep))
+
+    def _capture(self, case_dir: Path, name: str, data: bytes) -> None:
+        if self._closed:
+            raise RuntimeError("ArtifactWriter is shut down")
+        self._register(case_dir, name)
+        self._finished(case_dir, name, None, data)
+
+    def _register(self, case_dir: Path, name: str) -> None:
+        with self._lock:
+            state = self._cases.setdefault(case_dir, _CaseState())
+            state.artifacts[name] = {"status": "pending"}
+            state.pending += 1
+
+    def _on_done(self, case_dir: Path, name: str, fut: Future, keep: bool = False) -> None:
+        self._slots.release()
+        error = fut.exception()
+        self._finished(case_dir, name, error, fut.result() if keep and error is None else None)
+
+    def _finished(
+        self,
+        case_dir: Path,
+        name: str,
+        error: Optional[BaseException],
+        data: Optional[bytes] = None,
+    ) -> None:
+        with self._lock:
+            state = self._cases.get(case_dir)
+            if state is None:
+                return  # discarded
+            if data is not None:
+                state.blobs[name] = data
+            if error is None:
+                state.artifacts[name] = {"status": "done"}
+            else:
+                state.artifacts[name] = {"status": "error", "error": f"{type(error).__name__}: {error}"}
+            state.pending -= 1
+            complete = state.closed and state.pending == 0
+            self._progress.notify_all()
+        if complete:
+            if self.archive is None:
+                self._write_manifest(case_dir, state)
+            self._complete(case_dir, state)
+
+    def _complete(self, case_dir: Path, state: _CaseState) -> None:
+        if self.archive is None:
+            self._retire(case_dir, state)
+            return
+        with self._lock:
+            blobs = dict(state.blobs)
+            artifacts = {k: dict(v) for k, v in state.artifacts.items()}
+            meta = dict(state.meta)
+        try:
+            # Blobs stay readable (read_text) until the record is in the archive.
+            self.archive.append(case_dir.name, blobs, meta=meta, artifacts=artifacts)
+        finally:
+            self._retire(case_dir, state)
+
+    def _retire(self, case_dir: Path, state: _CaseState) -> None:
+        with self._lock:
+            if self._cases.get(case_dir) is state and state.pending == 0:
+                del self._cases[case_dir]
+        state.done.set()
+
+    def _write_manifest(self, case_dir: Path, state: _CaseState) -> None:
+        # Snapshot + write under the case's manifest lock, so a late "pending" write can
+        # never land on top of the final "complete" one.
+        with state.manifest_lock:
+            self._write_manifest_locked(case_dir, state)
+
+    def _write_manifest_locked(self, case_dir: Path, state: _CaseState) -> None:
+        with self._lock:
+            artifacts = {k: dict(v) for k, v in state.artifacts.items()}
+            pending = state.pending
+        if pending:
+            status = "pending"
+        elif any(a["status"] == "error" for a in artifacts.values()):
+            status = "failed"
+        else:
+            status = "complete"
+        for name, meta in artifacts.items():
+            p = case_dir / name
+            if meta["status"] == "done" and p.exists():
+                meta["bytes"] = p.stat().st_size
+        manifest = {"status": status, "updated": time.strftime("%Y-%m-%dT%H:%M:%S"), "artifacts": artifacts}
+        tmp = case_dir / (MANIFEST_NAME + ".tmp")
+        write_json(tmp, manifest)
+        tmp.replace(case_dir / MANIFEST_NAME)
+
+
+INLINE = ArtifactWriter(background=False)
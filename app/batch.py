@@ -0,0 +1,187 @@
+# app/batch.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+
+@dataclass
+class BatchReport:
+    total: int = 0               # cases read from the input file
+    skipped: int = 0             # already finished in a previous (checkpointed) run
+    completed: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+    latencies_ms: List[float] = field(default_factory=list)
+
+    @property
+    def throughput(self) -> float:
+        done = self.completed + self.failed
+        return done / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "skipped": self.skipped,
+            "completed": self.completed,
+            "failed": self.failed,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "throughput_per_s": round(self.throughput, 3),
+            "latency_ms": {
+                "p50": round(percentile(self.latencies_ms, 50), 1),
+                "p90": round(percentile(self.latencies_ms, 90), 1),
+                "p99": round(percentile(self.latencies_ms, 99), 1),
+                "max": round(max(self.latencies_ms), 1) if self.latencies_ms else 0.0,
+            },
+        }
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """
+    Linear-interpolated percentile (pct in 0..100). Returns 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    xs = sorted(values)
+    if len(xs) == 1:
+        return float(xs[0])
+    pos = (len(xs) - 1) * (pct / 100.0)
+    lo = int(pos)
+    hi = min(lo + 1, len(xs) - 1)
+    return float(xs[lo] + (xs[hi] - xs[lo]) * (pos - lo))
+
+
+def load_cases(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Stream cases from a JSONL file. Each row needs "user_prompt"; "case_id" is optional
+    and defaults to the line number so reruns over the same file resume correctly.
+    """
+    with path.open("r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            row = json.loads(line)
+            if not isinstance(row, dict) or not str(row.get("user_prompt", "")).strip():
+                continue
+            row.setdefault("case_id", f"line_{lineno}")
+            row["case_id"] = str(row["case_id"])
+            yield row
+
+
+def load_checkpoint(out_path: Path) -> Set[str]:
+    """
+    The output JSONL doubles as the checkpoint: every case_id that finished without an
+    error is considered done. A torn last line from a crash is ignored (and retried).
+    """
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+    with out_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(row, dict) and row.get("case_id") and not row.get("error"):
+                done.add(str(row["case_id"]))
+    return done
+
+
+def _trim_torn_tail(out_path: Path) -> None:
+    """Cut a torn last line (no trailing newline) so the next row starts on a line of its own."""
+    if not out_path.exists():
+        return
+    with out_path.open("rb+") as f:
+        pos = f.seek(0, os.SEEK_END)
+        if not pos:
+            return
+        f.seek(pos - 1)
+        if f.read(1) == b"\n":
+            return
+        while pos > 0:
+            step = min(64 * 1024, pos)
+            pos -= step
+            f.seek(pos)
+            i = f.read(step).rfind(b"\n")
+            if i >= 0:
+                f.truncate(pos + i + 1)
+                return
+        f.truncate(0)
+
+
+def run_batch(
+    cases: Iterable[Dict[str, Any]],
+    handler: Callable[[Dict[str, Any]], Dict[str, Any]],
+    out_path: Path,
+    workers: int = 4,
+    resume: bool = True,
+    on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+) -> BatchReport:
+    """
+    Run handler(case) over cases on a thread pool and append one JSON line per finished
+    case to out_path as soon as it completes.
+
+    - resume=True skips case_ids already recorded (without error) in out_path
+    - at most 2 * workers cases are in flight, so large inputs are never fully buffered
+    - handler exceptions are recorded as {"error": ...} rows and retried on the next run
+    - a line torn by a crash is cut off before appending (that case is retried)
+    """
+    workers = max(1, int(workers))
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    done = load_checkpoint(out_path) if resume else set()
+    _trim_torn_tail(out_path)
+
+    report = BatchReport()
+    lock = threading.Lock()
+    t0 = time.perf_counter()
+
+    def _one(case: Dict[str, Any]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        try:
+            result = dict(handler(case))
+            result.pop("error", None)
+        except Exception as e:  # noqa: BLE001 - one bad case must not stop the batch
+            result = {"error": f"{type(e).__name__}: {e}"}
+        latency_ms = (time.perf_counter() - started) * 1000.0
+        row = {"case_id": case["case_id"], "user_prompt": case["user_prompt"], **result, "latency_ms": round(latency_ms, 1)}
+        return row
+
+    with out_path.open("a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=workers) as pool:
+
+        def _collect(fut: Future) -> None:
+            row = fut.result()
+            with lock:
+                out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                out.flush()
+                if row.get("error"):
+                    report.failed += 1
+                else:
+                    report.completed += 1
+                    report.latencies_ms.append(row["latency_ms"])
+            if on_result:
+                on_result(row)
+
+        pending: Set[Future] = set()
+        for case in cases:
+            report.total += 1
+            if case["case_id"] in done:
+                report.skipped += 1
+                continue
+            if len(pending) >= 2 * workers:
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    _collect(fut)
+            pending.add(pool.submit(_one, case))
+
+        for fut in wait(pending).done:
+            _collect(fut)
+
+    report.elapsed_s = time.perf_counter() - t0
+    return report
@@ -0,0 +1,74 @@
+# app/cascade.py
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+STAGES = ("intent", "triage", "repair", "generation")
+
+
+@dataclass(frozen=True)
+class ModelPlan:
+    """
+    Which model serves each pipeline stage.
+
+    generation is the large model; intent / triage / repair fall back to it when empty, so
+    ModelPlan.single(m) is the old one-model behaviour. With a smaller model on the
+    classification stages, triage escalates to the generation model when the small model's
+    risk_score is inside escalate_band (exclusive; the triage rubric's clear ALLOW and
+    BLOCK ranges lie outside it), when its action contradicts its score, or when its
+    output cannot be parsed/validated.
+    """
+
+    generation: str
+    intent: str = ""
+    triage: str = ""
+    repair: str = ""
+    escalate_band: Tuple[int, int] = (25, 80)
+
+    @classmethod
+    def single(cls, model: str) -> "ModelPlan":
+        return cls(generation=model)
+
+    @classmethod
+    def from_args(
+        cls,
+        model: str,
+        small: str = "",
+        intent: str = "",
+        triage: str = "",
+        repair: str = "",
+        band: str = "25,80",
+    ) -> "ModelPlan":
+        lo, sep, hi = band.partition(",")
+        if not sep:
+            raise ValueError(f"escalation band must be LO,HI, got {band!r}")
+        return cls(
+            generation=model,
+            intent=intent or small,
+            triage=triage or small,
+            repair=repair or small,
+            escalate_band=(int(lo), int(hi)),
+        )
+
+    def for_stage(self, stage: str) -> str:
+        if stage not in STAGES:
+            raise ValueError(f"unknown stage {stage!r}")
+        return getattr(self, stage) or self.generation
+
+    def can_escalate(self, stage: str) -> bool:
+        return self.for_stage(stage) != self.generation
+
+    def triage_escalation(self, action: str, risk_score: int) -> Optional[str]:
+        """Why a small-model triage verdict should be re-asked of the large model, if at all."""
+        if not self.can_escalate("triage"):
+            return None
+        lo, hi = self.escalate_band
+        if lo < risk_score < hi:
+            return "ambiguous_risk"
+        if (action == "BLOCK" and risk_score <= lo) or (action == "ALLOW" and risk_score >= hi):
+            return "inconsistent_verdict"
+        return None
+
+    def to_dict(self) -> Dict[str, str]:
+        return {stage: self.for_stage(stage) for stage in STAGES}
@@ -0,0 +1,127 @@
+# app/deadline.py
+from __future__ import annotations
+
+import math
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List
+
+from .tracing import span
+
+STAGES = ("intent", "retrieval", "triage", "generation", "export")
+
+# Share of the overall deadline each stage may use. Time a stage leaves unused is handed
+# on to the stages after it (see Deadline.stage).
+DEFAULT_STAGE_SHARES: Dict[str, float] = {
+    "intent": 0.10,
+    "retrieval": 0.05,
+    "triage": 0.20,
+    "generation": 0.55,
+    "export": 0.10,
+}
+
+
+class DeadlineExceeded(TimeoutError):
+    """A stage ran out of budget. Callers degrade to their deterministic fallback."""
+
+    def __init__(self, stage: str, message: str = ""):
+        super().__init__(message or f"{stage}: latency budget exhausted")
+        self.stage = stage
+
+
+@dataclass
+class StageBudget:
+    name: str
+    budget_s: float
+    started: float
+    clock: Callable[[], float] = time.monotonic
+
+    def remaining(self) -> float:
+        return self.budget_s - (self.clock() - self.started)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def bounded(self) -> bool:
+        return math.isfinite(self.budget_s)
+
+    def call_timeout(self) -> float:
+        """Upper bound for one model call inside this stage."""
+        return max(0.001, self.remaining())
+
+    def check(self) -> None:
+        if self.expired():
+            raise DeadlineExceeded(self.name)
+
+
+@dataclass
+class Deadline:
+    """
+    Overall latency budget for one run_one call, split into per-stage budgets.
+
+    A stage's budget is its share of whatever time is still left, relative to the shares
+    of the stages that have not run yet, so a fast intent call leaves more for generation.
+    Misses (stage over budget, or a degraded fallback) are collected for deadline.json.
+    total_s=math.inf gives unbounded stages, so callers need no separate no-deadline path.
+    """
+
+    total_s: float
+    shares: Dict[str, float] = field(default_factory=lambda: dict(DEFAULT_STAGE_SHARES))
+    clock: Callable[[], float] = time.monotonic
+    started: float = 0.0
+    stages: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    misses: List[Dict[str, Any]] = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self.started = self.clock()
+
+    def remaining(self) -> float:
+        return self.total_s - (self.clock() - self.started)
+
+    def bounded(self) -> bool:
+        return math.isfinite(self.total_s)
+
+    def budget_for(self, name: str) -> float:
+        left = max(0.0, self.remaining())
+        pending = [s for s in STAGES if s not in self.stages]
+        if name not in pending:
+            pending.append(name)
+        weight = sum(self.shares.get(s, 0.0) for s in pending)
+        if weight <= 0:
+            return left
+        return left * self.shares.get(name, 0.0) / weight
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageBudget]:
+        budget = StageBudget(name=name, budget_s=self.budget_for(name), started=self.clock(), clock=self.clock)
+        try:
+            with span(f"stage.{name}"):
+                yield budget
+        finally:
+            elapsed = self.clock() - budget.started
+            self.stages[name] = {
+                "budget_s": round(budget.budget_s, 3),
+                "elapsed_s": round(elapsed, 3),
+                "over_budget": elapsed > budget.budget_s,
+            }
+            if elapsed > budget.budget_s and not any(m["stage"] == name for m in self.misses):
+                self.miss(name, "over_budget")
+
+    def miss(self, stage: str, fallback: str, detail: str = "") -> None:
+        self.misses.append(
+            {
+                "stage": stage,
+                "fallback": fallback,
+                "detail": detail,
+                "at_s": round(self.clock() - self.started, 3),
+            }
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "total_s": self.total_s,
+            "elapsed_s": round(self.clock() - self.started, 3),
+            "stages": self.stages,
+            "misses": self.misses,
+        }
@@ -0,0 +1,183 @@
+# app/dedup.py
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+import sqlite3
+import struct
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple, Union
+
+INDEX_NAME = ".dedup.sqlite"
+
+NUM_PERM = 64
+BANDS = 16                 # 16 bands x 4 rows: pairs above ~0.5 Jaccard usually share a bucket
+ROWS = NUM_PERM // BANDS
+SHINGLE = 5                # words per shingle
+
+_P = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMS = [(_rng.randrange(1, _P), _rng.randrange(0, _P)) for _ in range(NUM_PERM)]
+_WORD = re.compile(r"[a-z0-9]+")
+# ingest_url.py prefixes pages with their URL; mirrors differ only there.
+_SOURCE_LINE = re.compile(r"\A\s*# Source:[^\n]*\n")
+_SIG = struct.Struct(f"<{NUM_PERM}Q")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS docs (
+    doc_id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    sig BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_sha ON docs(sha256);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    doc_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bands_lookup ON bands(band, bucket);
+CREATE INDEX IF NOT EXISTS bands_doc ON bands(doc_id);
+"""
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(_SOURCE_LINE.sub("", text).lower())
+
+
+def content_hash(text: str) -> str:
+    """Hash of the normalised word sequence: case, punctuation and spacing do not matter."""
+    return hashlib.sha256(" ".join(words(text)).encode("utf-8")).hexdigest()
+
+
+def minhash(text: str) -> Tuple[int, ...]:
+    toks = words(text)
+    return minhash_shingles(" ".join(toks[i:i + SHINGLE]) for i in range(max(1, len(toks) - SHINGLE + 1)))
+
+
+def minhash_shingles(shingles: Iterable[str]) -> Tuple[int, ...]:
+    """NUM_PERM-value MinHash signature of a set of shingles (any tokenisation)."""
+    ids = {zlib.crc32(s.encode("utf-8")) for s in shingles} or {0}
+    return tuple(min((a * x + b) % _P for x in ids) for a, b in _PERMS)
+
+
+def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    """MinHash estimate of the Jaccard similarity of the two documents' shingle sets."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def band_buckets(sig: Tuple[int, ...]) -> List[int]:
+    """One LSH bucket per band; signatures sharing any bucket are candidate matches."""
+    out = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<{ROWS}Q", *sig[band * ROWS:(band + 1) * ROWS])
+        out.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "big", signed=True))
+    return out
+
+
+@dataclass
+class Duplicate:
+    doc_id: str
+    kind: str            # "exact" | "near"
+    similarity: float
+
+
+class SignatureIndex:
+    """
+    On-disk MinHash/LSH index of KB documents for exact and near-duplicate checks.
+
+    Each document stores its normalised content hash and a 64-value MinHash signature;
+    the signature is split into 16 bands whose hashes are indexed, so a lookup reads only
+    documents sharing a band bucket (sub-linear in corpus size) and then confirms them by
+    estimated Jaccard similarity >= threshold. Signatures are reused by content hash, so
+    re-indexing an unchanged corpus computes nothing. path=":memory:" gives a throwaway index.
+    """
+
+    def __init__(self, path: Union[Path, str], threshold: float = 0.8):
+        self.path = path
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        if str(path) != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def signature(self, text: str) -> Tuple[str, Tuple[int, ...]]:
+        sha = content_hash(text)
+        with self._lock:
+            row = self._db.execute("SELECT sig FROM docs WHERE sha256=? LIMIT 1", (sha,)).fetchone()
+        return sha, (_SIG.unpack(row[0]) if row else minhash(text))
+
+    def matches(self, text: str, exclude: Optional[str] = None) -> List[Duplicate]:
+        """Indexed documents that are exact or near duplicates of text, most similar first."""
+        sha, sig = self.signature(text)
+        found = {}
+        with self._lock:
+            for (doc_id,) in self._db.execute("SELECT doc_id FROM docs WHERE sha256=?", (sha,)):
+                found[doc_id] = Duplicate(doc_id, "exact", 1.0)
+            candidates: Set[str] = set()
+            for band, bucket in enumerate(band_buckets(sig)):
+                rows = self._db.execute("SELECT doc_id FROM bands WHERE band=? AND bucket=?", (band, bucket))
+                candidates.update(r[0] for r in rows)
+            for doc_id in candidates - set(found):
+                row = self._db.execute("SELECT sig FROM docs WHERE doc_id=?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                sim = similarity(sig, _SIG.unpack(row[0]))
+                if sim >= self.threshold:
+                    found[doc_id] = Duplicate(doc_id, "near", round(sim, 3))
+        found.pop(exclude, None)
+        return sorted(found.values(), key=lambda d: (-d.similarity, d.doc_id))
+
+    def add(self, doc_id: str, text: str) -> None:
+        sha, sig = self.signature(text)
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM docs WHERE doc_id=?", (doc_id,)).fetchone()
+            if row is not None and row[0] == sha:
+                return
+            self._remove(doc_id)
+            self._db.execute("INSERT INTO docs (doc_id, sha256, sig) VALUES (?, ?, ?)", (doc_id, sha, _SIG.pack(*sig)))
+            self._db.executemany(
+                "INSERT INTO bands (band, bucket, doc_id) VALUES (?, ?, ?)",
+                [(band, bucket, doc_id) for band, bucket in enumerate(band_buckets(sig))],
+            )
+            self._db.commit()
+
+    def _remove(self, doc_id: str) -> None:
+        self._db.execute("DELETE FROM docs WHERE doc_id=?", (doc_id,))
+        self._db.execute("DELETE FROM bands WHERE doc_id=?", (doc_id,))
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+            self._db.commit()
+
+    def retain(self, doc_ids: Iterable[str]) -> int:
+        """Drop every document not in doc_ids (files deleted from the KB). Returns how many."""
+        keep = set(doc_ids)
+        with self._lock:
+            stale = [d for (d,) in self._db.execute("SELECT doc_id FROM docs") if d not in keep]
+            for doc_id in stale:
+                self._remove(doc_id)
+            self._db.commit()
+        return len(stale)
+
+    def __len__(self) -> int:
+        with self._lock:
+            (n,) = self._db.execute("SELECT COUNT(*) FROM docs").fetchone()
+        return int(n)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+def open_index(kb_dir: Path, threshold: float = 0.8) -> SignatureIndex:
+    """The KB's signature index, or an in-memory one when kb_dir is not writable."""
+    try:
+        return SignatureIndex(kb_dir / INDEX_NAME, threshold)
+    except sqlite3.Error:
+        return SignatureIndex(":memory:", threshold)
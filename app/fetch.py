@@ -0,0 +1,176 @@
+# app/fetch.py
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "llm-demo-ingestor/1.0"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    sha256 TEXT,
+    http_status INTEGER,
+    fetched_at REAL
+);
+"""
+
+
+@dataclass
+class FetchResult:
+    url: str
+    status: str                 # "fetched" | "not_modified" | "unchanged" | "error"
+    http_status: int = 0
+    text: str = ""
+    content_type: str = ""
+    error: str = ""
+    elapsed_ms: float = 0.0
+
+    @property
+    def changed(self) -> bool:
+        """True when the page has new content that needs (re)processing."""
+        return self.status == "fetched"
+
+
+class FetchCache:
+    """
+    Validators (ETag / Last-Modified) and a content hash per URL, in a sqlite file, so a
+    refresh sends conditional GETs and skips pages whose content has not changed.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def get(self, url: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, sha256, http_status, fetched_at FROM pages WHERE url=?", (url,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("etag", "last_modified", "sha256", "http_status", "fetched_at"), row))
+
+    def put(self, url: str, etag: Optional[str], last_modified: Optional[str], sha256: str, http_status: int) -> None:
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO pages (url, etag, last_modified, sha256, http_status, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, etag, last_modified, sha256, http_status, time.time()),
+            )
+            self._db.commit()
+
+    def touch(self, url: str) -> None:
+        with self._lock:
+            self._db.execute("UPDATE pages SET fetched_at=? WHERE url=?", (time.time(), url))
+            self._db.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            (n,) = self._db.execute("SELECT COUNT(*) FROM pages").fetchone()
+        return int(n)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class Fetcher:
+    """
+    Concurrent page fetcher over one pooled requests.Session.
+
+    At most max_workers requests run at once, and at most per_host of them against any
+    one host. With a cache, requests carry If-None-Match / If-Modified-Since from the last
+    fetch: a 304 (or a 200 with identical content) is reported as not_modified/unchanged.
+    """
+
+    def __init__(
+        self,
+        cache: Optional[FetchCache] = None,
+        max_workers: int = 16,
+        per_host: int = 4,
+        timeout: float = 20.0,
+        user_agent: str = USER_AGENT,
+    ):
+        self.cache = cache
+        self.max_workers = max(1, max_workers)
+        self.per_host = max(1, per_host)
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+        self._hosts: Dict[str, threading.Semaphore] = {}
+        self._hosts_lock = threading.Lock()
+
+    def _host_slot(self, url: str) -> threading.Semaphore:
+        host = urlparse(url).netloc.lower()
+        with self._hosts_lock:
+            sem = self._hosts.get(host)
+            if sem is None:
+                sem = self._hosts[host] = threading.Semaphore(self.per_host)
+            return sem
+
+    def fetch(self, url: str, conditional: bool = True) -> FetchResult:
+        """
+        Fetch one URL. conditional=False ignores stored validators (e.g. when the
+        processed output is missing and the body is needed regardless).
+        """
+        started = time.monotonic()
+        cached = self.cache.get(url) if self.cache is not None and conditional else None
+        headers: Dict[str, str] = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        def done(**kw: Any) -> FetchResult:
+            return FetchResult(url=url, elapsed_ms=round((time.monotonic() - started) * 1000, 1), **kw)
+
+        try:
+            with self._host_slot(url):
+                r = self.session.get(url, headers=headers, timeout=self.timeout)
+            if r.status_code == 304 and cached:
+                self.cache.touch(url)  # type: ignore[union-attr]
+                return done(status="not_modified", http_status=304)
+            r.raise_for_status()
+        except requests.RequestException as e:
+            return done(status="error", error=f"{type(e).__name__}: {e}")
+
+        text = r.text
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if self.cache is not None:
+            self.cache.put(url, r.headers.get("ETag"), r.headers.get("Last-Modified"), digest, r.status_code)
+        status = "unchanged" if cached and cached.get("sha256") == digest else "fetched"
+        return done(status=status, http_status=r.status_code, text=text, content_type=r.headers.get("Content-Type", ""))
+
+    def fetch_many(self, urls: Iterable[str], conditional: Optional[Dict[str, bool]] = None) -> Iterator[FetchResult]:
+        """Fetch concurrently; results are yielded as they complete (not in input order)."""
+        conditional = conditional or {}
+        unique = list(dict.fromkeys(u.strip() for u in urls if u.strip()))
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch") as pool:
+            futures = [pool.submit(self.fetch, u, conditional.get(u, True)) for u in unique]
+            for fut in as_completed(futures):
+                yield fut.result()
+
+    def close(self) -> None:
+        self.session.close()
+
@@ -1,4 +1,7 @@
 import re
+import zlib
+from typing import Iterable, List, Optional, Set
+
 from .schemas import TriageOutput, AnswerOutput
 
 INJECTION_KEYWORDS = [
@@ -36,6 +39,42 @@ SECRET_PATTERNS = [
     r"-----BEGIN (?:RSA|EC|OPENSSH) PRIVATE KEY-----",
 ]
 
+# All secret patterns as one alternation: one pass over the text instead of one per pattern.
+SECRET_RE = re.compile("|".join(f"(?:{p})" for p in SECRET_PATTERNS))
+
+# Retrieved text that tries to dictate outcomes ("must result in penalties") rather than inform.
+OVERRIDE_PATTERNS = [
+    r"\b(?:must|shall|should) (?:automatically|always|immediately)\b",
+    r"\bmust result in\b",
+    r"\b(?:all|any) [\w\s-]{0,40}?\b(?:must|should) be (?:rejected|treated|penali[sz]ed|blocked)\b",
+    r"\b(?:this|these) (?:instructions?|polic(?:y|ies)) (?:supersedes?|overrides?)\b",
+    r"\b(?:disregard|ignore) (?:all |any )?(?:previous|prior|other) (?:instructions|rules|guidance)\b",
+    r"\byou (?:must|are required to) (?:now )?(?:comply|obey|follow)\b",
+]
+
+_INJECTION_RE = re.compile(r"\b(?:" + "|".join(re.escape(k) for k in INJECTION_KEYWORDS) + r")\b", re.IGNORECASE)
+_OVERRIDE_RE = re.compile("|".join(f"(?:{p})" for p in OVERRIDE_PATTERNS), re.IGNORECASE)
+
+RISK_WEIGHTS = {"secret": 100, "injection": 30, "override": 25}
+
+
+def passage_risk(text: str) -> List[str]:
+    """
+    Index-time risk annotation for one KB passage: sorted, de-duplicated flags such as
+    "injection:system override", "override:must result in" or "secret". Empty means clean.
+    """
+    injection = {m.group(0).lower() for m in _INJECTION_RE.finditer(text)}
+    override = {" ".join(m.group(0).lower().split()) for m in _OVERRIDE_RE.finditer(text)} - injection
+    flags = {f"injection:{k}" for k in injection} | {f"override:{k}" for k in override}
+    if SECRET_RE.search(text):
+        flags.add("secret")
+    return sorted(flags)
+
+
+def risk_score(flags: Iterable[str]) -> int:
+    """0-100 from passage_risk flags: any secret is 100, each distinct phrase adds its weight."""
+    return min(100, sum(RISK_WEIGHTS[f.split(":", 1)[0]] for f in flags))
+
 
 def simple_screen(text: str) -> bool:
     t = text.lower()
@@ -65,6 +104,102 @@ def enforce_answer(answer: AnswerOutput) -> None:
     files = "\n".join(f.content for f in (answer.files_to_generate or []))
     full = (answer.final_answer or "") + "\n" + checklist + "\n" + files
 
-    for pat in SECRET_PATTERNS:
-        if re.search(pat, full):
-            raise ValueError("Secret-like content detected in output.")
+    if SECRET_RE.search(full):
+        raise ValueError("Secret-like content detected in output.")
+
+
+# ---------------------------
+# Streaming output guard
+# ---------------------------
+
+class StreamAborted(Exception):
+    """Raised from StreamGuard.feed (i.e. inside on_token), which cancels the model request."""
+
+    def __init__(self, kind: str, detail: str, chars: int):
+        super().__init__(f"generation aborted: {kind} ({detail})")
+        self.kind = kind          # "secret" | "kb_dump"
+        self.detail = detail
+        self.chars = chars        # characters streamed before the abort
+
+    def to_dict(self) -> dict:
+        return {"kind": self.kind, "detail": self.detail, "chars_streamed": self.chars}
+
+
+def _redact(secret: str) -> str:
+    return secret[:6] + "..." if len(secret) > 10 else "..."
+
+
+class StreamGuard:
+    """
+    Incremental output scanner for streamed generations; feed() every piece from on_token.
+
+    Secrets: SECRET_RE runs over each new piece plus a CARRY-char tail of earlier text, so a
+    key split across pieces is still seen, and nothing is rescanned more than once past
+    that window. KB dumps: the retrieved snippets are indexed as hashed SHINGLE-word
+    windows; once dump_words consecutive streamed words continue those windows verbatim,
+    the answer is copying the KB rather than using it. Either way feed() raises
+    StreamAborted, which aborts the HTTP stream before the rest of the tokens are paid for.
+
+    feed() returns the text that is safe to forward: everything but the last CARRY chars,
+    which could still be the start of a secret. flush() returns that tail once the stream
+    has completed cleanly.
+    """
+
+    CARRY = 64       # longer than the shortest match of every SECRET_PATTERNS entry
+    SHINGLE = 8
+
+    def __init__(self, kb_texts: Iterable[str] = (), dump_words: int = 60):
+        self.dump_words = dump_words
+        self._shingles: Set[int] = set()
+        for text in kb_texts:
+            toks = text.lower().split()
+            for i in range(len(toks) - self.SHINGLE + 1):
+                self._shingles.add(zlib.crc32(" ".join(toks[i:i + self.SHINGLE]).encode("utf-8")))
+        self._tail = ""
+        self._partial = ""           # last word, possibly continued by the next piece
+        self._window: List[str] = []
+        self._run = 0                # streamed words covered by verbatim KB shingles
+        self.chars = 0
+        self.aborted: Optional[StreamAborted] = None
+
+    def feed(self, piece: str) -> str:
+        self.chars += len(piece)
+        buf = self._tail + piece
+        m = SECRET_RE.search(buf)
+        if m:
+            self._abort("secret", f"secret-like span {_redact(m.group(0))!r}")
+        if self._shingles:
+            self._scan_words(piece)
+        # A match starting before the tail would already have been found (CARRY is longer
+        # than the shortest one), so only the tail is held back.
+        self._tail = buf[-self.CARRY:]
+        return buf[:-self.CARRY]
+
+    def flush(self) -> str:
+        """The held-back tail, once the stream is complete and no match can still form."""
+        tail, self._tail = self._tail, ""
+        return tail
+
+    def _scan_words(self, piece: str) -> None:
+        words = (self._partial + piece).split()
+        if not piece[-1:].isspace() and words:
+            self._partial = words.pop()
+        else:
+            self._partial = ""
+        for w in words:
+            self._window.append(w.lower())
+            if len(self._window) > self.SHINGLE:
+                del self._window[0]
+            if len(self._window) < self.SHINGLE:
+                continue
+            if zlib.crc32(" ".join(self._window).encode("utf-8")) in self._shingles:
+                # The first matching shingle covers SHINGLE words, each later one adds one.
+                self._run = self._run + 1 if self._run else self.SHINGLE
+                if self._run >= self.dump_words:
+                    self._abort("kb_dump", f"{self._run} consecutive words copied verbatim from retrieved sources")
+            else:
+                self._run = 0
+
+    def _abort(self, kind: str, detail: str) -> None:
+        self.aborted = StreamAborted(kind, detail, self.chars)
+        raise self.aborted
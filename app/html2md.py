@@ -0,0 +1,198 @@
+# app/html2md.py
+from __future__ import annotations
+
+import re
+from html.parser import HTMLParser
+from typing import Callable, Iterable, List, Optional, Tuple
+
+# Content inside these is dropped entirely (code, styling, page chrome).
+SKIP_TAGS = frozenset(
+    {"script", "style", "noscript", "template", "svg", "math", "head", "nav", "footer", "iframe", "form", "button", "select"}
+)
+HEADINGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 4, "h5": 5, "h6": 6}
+BLOCK_TAGS = frozenset(
+    {
+        "p", "div", "section", "article", "main", "header", "aside", "blockquote", "figure", "figcaption",
+        "table", "thead", "tbody", "tfoot", "ul", "ol", "dl", "dt", "dd", "hr", "address", "details", "summary",
+        "caption", "center",
+    }
+)
+_WS = re.compile(r"\s+")
+_BR = "\x00"
+
+
+class HTMLToMarkdown(HTMLParser):
+    """
+    Single-pass, streaming HTML -> markdown converter on the stdlib HTMLParser.
+
+    feed() accepts the page in chunks of any size and write() receives finished markdown
+    blocks as soon as they close, so memory is bounded by the largest single block (one
+    paragraph, table row or <pre>), not the page. Headings are kept as '#' lines so the
+    output can be chunked by section; lists become '- ' / '1. ' items, table rows become
+    '|'-separated lines and <pre> becomes a fenced block. Scripts, styles and page chrome
+    (nav, footer, forms) are dropped.
+    """
+
+    def __init__(self, write: Callable[[str], None]):
+        super().__init__(convert_charrefs=True)
+        self.write = write
+        self.title = ""
+        self._skip = 0                      # depth inside SKIP_TAGS
+        self._in_title = False
+        self._pre = 0
+        self._buf: List[str] = []           # text of the block being built
+        self._prefix = ""                   # "## ", "- ", ... until the block's first text
+        self._heading = False
+        self._lists: List[Tuple[str, int]] = []  # ("ul"|"ol", next number)
+        self._cells: Optional[List[str]] = None  # table row being built
+        self._pending_gap = False
+        self._wrote = False
+
+    # ---------------------------
+    # Output
+    # ---------------------------
+
+    def _emit(self, text: str, gap: bool = True) -> None:
+        if not text:
+            return
+        if self._wrote:
+            self.write("\n\n" if (gap or self._pending_gap) else "\n")
+        self.write(text)
+        self._wrote = True
+        self._pending_gap = False
+
+    def _flush(self, gap: bool = True) -> None:
+        raw = "".join(self._buf)
+        self._buf = []
+        if self._pre:
+            text = raw
+        else:
+            # <br> is recorded as _BR so line breaks survive whitespace collapsing.
+            text = "\n".join(t for t in (_WS.sub(" ", part).strip() for part in raw.split(_BR)) if t)
+        if not text:
+            return  # keep the prefix for the first text, e.g. <li><p>item</p></li>
+        prefix, self._prefix = self._prefix, ""
+        if self._cells is not None:
+            self._cells.append(text)
+            return
+        self._emit(prefix + text, gap=gap)
+
+    # ---------------------------
+    # HTMLParser callbacks
+    # ---------------------------
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag in SKIP_TAGS:
+            if tag == "head":
+                return  # <title> lives here; everything else in <head> has no text
+            self._skip += 1
+            return
+        if self._skip:
+            return
+        if tag == "title":
+            self._in_title = True
+        elif tag in HEADINGS:
+            self._flush()
+            self._prefix = "#" * HEADINGS[tag] + " "
+            self._heading = True
+        elif self._heading and tag in BLOCK_TAGS:
+            self._buf.append(" ")  # a heading stays one line, whatever it wraps
+        elif tag in ("ul", "ol"):
+            self._flush(gap=not self._lists)
+            self._pending_gap = self._pending_gap or not self._lists
+            self._lists.append((tag, 1))
+        elif tag == "li":
+            self._flush(gap=False)
+            indent = "  " * max(0, len(self._lists) - 1)
+            if self._lists and self._lists[-1][0] == "ol":
+                kind, n = self._lists[-1]
+                self._lists[-1] = (kind, n + 1)
+                self._prefix = f"{indent}{n}. "
+            else:
+                self._prefix = f"{indent}- "
+        elif tag == "tr":
+            self._flush()
+            self._cells = []
+        elif tag in ("td", "th"):
+            self._flush()
+        elif tag == "pre":
+            self._flush()
+            self._pre += 1
+        elif tag == "br":
+            self._buf.append("\n" if self._pre else _BR)
+        elif tag == "table":
+            self._flush()
+            self._pending_gap = True
+        elif tag in BLOCK_TAGS:
+            self._flush(gap=not self._lists)  # items whose text sits in <p>/<div> stay a tight list
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIP_TAGS:
+            if tag != "head" and self._skip:
+                self._skip -= 1
+            return
+        if self._skip:
+            return
+        if tag == "title":
+            self._in_title = False
+        elif tag in HEADINGS or tag == "li":
+            self._flush(gap=tag != "li")
+            self._prefix = ""
+            self._heading = False
+        elif self._heading and tag in BLOCK_TAGS:
+            self._buf.append(" ")
+        elif tag in ("ul", "ol"):
+            self._flush(gap=False)
+            if self._lists:
+                self._lists.pop()
+            self._pending_gap = not self._lists
+        elif tag in ("td", "th"):
+            self._flush()
+        elif tag == "tr":
+            self._flush()
+            cells, self._cells = self._cells, None
+            if cells:
+                self._emit("| " + " | ".join(c.replace("|", "\\|") for c in cells) + " |", gap=False)
+        elif tag == "pre":
+            raw = "".join(self._buf).strip("\n")
+            self._buf = []
+            self._pre = max(0, self._pre - 1)
+            if raw.strip():
+                self._emit("```\n" + raw + "\n```")
+        elif tag == "table":
+            self._flush()
+            self._pending_gap = True
+        elif tag in BLOCK_TAGS:
+            self._flush(gap=not self._lists)
+
+    def handle_data(self, data: str) -> None:
+        if self._skip:
+            return
+        if self._in_title:
+            self.title += data
+            return
+        self._buf.append(data)
+
+    def close(self) -> None:
+        super().close()
+        self._flush()
+
+
+def convert_stream(chunks: Iterable[str], write: Callable[[str], None]) -> str:
+    """Convert an iterable of HTML chunks, writing markdown as it is produced. Returns the page title."""
+    parser = HTMLToMarkdown(write)
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return _WS.sub(" ", parser.title).strip()
+
+
+def iter_chunks(text: str, size: int = 64 * 1024) -> Iterable[str]:
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def html_to_markdown(html: str) -> str:
+    out: List[str] = []
+    convert_stream(iter_chunks(html), out.append)
+    return "".join(out)
@@ -0,0 +1,415 @@
+# app/index.py
+from __future__ import annotations
+
+import argparse
+import fcntl
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from .dedup import open_index
+from .gates import passage_risk
+
+INDEX_DIR = ".index"
+CURRENT = "CURRENT"
+LOCK = "LOCK"
+
+K1 = 1.5
+B = 0.75
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_HEADING = re.compile(r"^#{1,6}\s")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def chunk_markdown(text: str, max_chars: int = 1200) -> List[str]:
+    """
+    Split markdown into retrieval chunks: a new chunk at every heading, and paragraphs
+    packed up to max_chars within a section. Continuation chunks repeat the section
+    heading so each chunk is understandable on its own.
+    """
+    chunks: List[str] = []
+    heading = ""
+    current: List[str] = []
+    size = 0
+
+    def flush() -> None:
+        nonlocal current, size
+        body = "\n\n".join(current).strip()
+        if body:
+            chunks.append(body if not heading or body.startswith(heading) else f"{heading}\n\n{body}")
+        current, size = [], 0
+
+    for para in re.split(r"\n\s*\n", text):
+        para = para.strip()
+        if not para:
+            continue
+        if _HEADING.match(para):
+            flush()
+            heading = para.splitlines()[0]
+        if current and size + len(para) > max_chars:
+            flush()
+        current.append(para)
+        size += len(para)
+    flush()
+    return chunks
+
+
+# ---------------------------
+# Segments (immutable) and snapshots (one generation)
+# ---------------------------
+
+@dataclass
+class Segment:
+    """
+    Postings for the chunks added in one update. Never modified after it is written.
+    Each chunk also carries its passage_risk() flags, computed once here at index time.
+    """
+
+    name: str
+    docs: List[str]                                # doc name per chunk
+    texts: List[str]
+    lengths: List[int]
+    postings: Dict[str, List[Tuple[int, int]]]     # term -> [(chunk, tf), ...]
+    risks: List[List[str]]
+
+    @classmethod
+    def build(cls, name: str, items: List[Tuple[str, str]]) -> "Segment":
+        docs, texts, lengths, risks = [], [], [], []
+        postings: Dict[str, List[Tuple[int, int]]] = {}
+        for i, (doc, text) in enumerate(items):
+            toks = tokenize(text)
+            docs.append(doc)
+            texts.append(text)
+            lengths.append(len(toks))
+            risks.append(passage_risk(text))
+            for term, tf in Counter(toks).items():
+                postings.setdefault(term, []).append((i, tf))
+        return cls(name, docs, texts, lengths, postings, risks)
+
+    def save(self, path: Path) -> None:
+        tmp = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(
+                {"docs": self.docs, "texts": self.texts, "lengths": self.lengths, "postings": self.postings, "risks": self.risks},
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, name: str, path: Path) -> "Segment":
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            raw = json.load(f)
+        postings = {t: [tuple(p) for p in ps] for t, ps in raw["postings"].items()}
+        risks = raw.get("risks") or [passage_risk(t) for t in raw["texts"]]  # segments written before annotations
+        return cls(name, raw["docs"], raw["texts"], raw["lengths"], postings, risks)  # type: ignore[arg-type]
+
+
+class IndexSnapshot:
+    """
+    A read-only view of one generation. Scoring is BM25 over chunks; a chunk counts only
+    if its document's live copy is in the chunk's segment (replaced/deleted documents
+    leave dead chunks behind until compact()). As in Lucene, document frequencies still
+    include dead chunks until then.
+    """
+
+    def __init__(self, generation: int, segments: List[Segment], live: Mapping[str, str]):
+        self.generation = generation
+        self.segments = segments
+        self.live = dict(live)
+        self._alive = [[self.live.get(d) == seg.name for d in seg.docs] for seg in segments]
+        lengths = [n for seg, alive in zip(segments, self._alive) for n, ok in zip(seg.lengths, alive) if ok]
+        self.n_chunks = len(lengths)
+        self.avgdl = (sum(lengths) / len(lengths)) if lengths else 0.0
+        self._total = sum(len(seg.docs) for seg in segments)
+
+    def doc_names(self) -> List[str]:
+        return sorted(self.live)
+
+    def _idf(self, term: str) -> float:
+        df = sum(len(seg.postings.get(term, ())) for seg in self.segments)
+        return math.log(1 + (self._total - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str) -> List[Tuple[str, str, float, List[str]]]:
+        """(doc, chunk text, score, risk flags) for every live chunk matching query, best first."""
+        if not self.n_chunks:
+            return []
+        hits: List[Tuple[str, str, float, List[str]]] = []
+        terms = list(dict.fromkeys(tokenize(query)))
+        idf = {t: self._idf(t) for t in terms}
+        for seg, alive in zip(self.segments, self._alive):
+            scores: Dict[int, float] = {}
+            for term in terms:
+                for i, tf in seg.postings.get(term, ()):
+                    if not alive[i]:
+                        continue
+                    norm = tf + K1 * (1 - B + B * seg.lengths[i] / self.avgdl)
+                    scores[i] = scores.get(i, 0.0) + idf[term] * tf * (K1 + 1) / norm
+            hits.extend((seg.docs[i], seg.texts[i], s, seg.risks[i]) for i, s in scores.items())
+        hits.sort(key=lambda h: h[2], reverse=True)
+        return hits
+
+
+# ---------------------------
+# Index: writer + generation management
+# ---------------------------
+
+class Index:
+    """
+    Persistent, incrementally updated BM25 chunk index.
+
+    Layout under root: seg-NNNNNN.json.gz (immutable segments), gen-NNNNNN.json
+    (manifest: segments in use and which segment holds each live document + its content
+    hash) and CURRENT (name of the newest manifest, replaced atomically). update()/delete()
+    write one small segment and a new generation; readers pick it up by re-reading CURRENT
+    (see LocalRAG.from_index) while searches on the old snapshot carry on. One writer at a
+    time across processes (flock on LOCK). compact() folds live chunks into one segment.
+    """
+
+    def __init__(self, root: Path, chunk_chars: int = 1200, max_segments: int = 16, keep_generations: int = 2):
+        self.root = root
+        self.chunk_chars = chunk_chars
+        self.max_segments = max_segments
+        self.keep_generations = max(1, keep_generations)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._segments: Dict[str, Segment] = {}   # loaded segments, shared across snapshots
+
+    # ---------------------------
+    # Reading
+    # ---------------------------
+
+    def current_name(self) -> Optional[str]:
+        try:
+            return (self.root / CURRENT).read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    def manifest(self) -> Dict[str, Any]:
+        name = self.current_name()
+        if name is None:
+            return {"generation": 0, "segments": [], "docs": {}}
+        return json.loads((self.root / name).read_text(encoding="utf-8"))
+
+    def generation(self) -> int:
+        return int(self.manifest()["generation"])
+
+    def _segment(self, name: str) -> Segment:
+        seg = self._segments.get(name)
+        if seg is None:
+            seg = self._segments[name] = Segment.load(name, self.root / f"{name}.json.gz")
+        return seg
+
+    def snapshot(self) -> IndexSnapshot:
+        """Load the current generation; segments already loaded by earlier snapshots are reused."""
+        for _ in range(3):
+            m = self.manifest()
+            try:
+                with self._lock:
+                    segments = [self._segment(s) for s in m["segments"]]
+                    for stale in set(self._segments) - set(m["segments"]):
+                        del self._segments[stale]
+            except FileNotFoundError:
+                continue  # a writer garbage-collected this generation mid-load; re-read CURRENT
+            live = {doc: info["segment"] for doc, info in m["docs"].items()}
+            return IndexSnapshot(int(m["generation"]), segments, live)
+        raise RuntimeError(f"index {self.root} kept changing while loading")
+
+    # ---------------------------
+    # Writing
+    # ---------------------------
+
+    @contextmanager
+    def _writer(self) -> Iterator[Dict[str, Any]]:
+        with self._lock, (self.root / LOCK).open("a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield self.manifest()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _commit(self, m: Dict[str, Any], new_segment: Optional[Segment]) -> int:
+        gen = int(m["generation"]) + 1
+        if new_segment is not None:
+            new_segment.save(self.root / f"{new_segment.name}.json.gz")
+            m["segments"].append(new_segment.name)
+        used = {info["segment"] for info in m["docs"].values()}
+        m["segments"] = [s for s in m["segments"] if s in used]
+        m["generation"] = gen
+        m["created"] = time.time()
+        name = f"gen-{gen:06d}.json"
+        tmp = self.root / (name + ".tmp")
+        tmp.write_text(json.dumps(m, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.root / name)
+        tmp = self.root / (CURRENT + ".tmp")
+        tmp.write_text(name, encoding="utf-8")
+        os.replace(tmp, self.root / CURRENT)
+        self._gc(gen)
+        return gen
+
+    def _gc(self, gen: int) -> None:
+        # Keep the last keep_generations manifests (readers may still be loading them)
+        # and every segment they reference.
+        keep_gens = set(range(gen - self.keep_generations + 1, gen + 1))
+        referenced = set()
+        for p in self.root.glob("gen-*.json"):
+            n = int(p.stem.split("-")[1])
+            if n in keep_gens:
+                referenced.update(json.loads(p.read_text(encoding="utf-8"))["segments"])
+            else:
+                p.unlink(missing_ok=True)
+        for p in self.root.glob("seg-*.json.gz"):
+            if p.name[: -len(".json.gz")] not in referenced:
+                p.unlink(missing_ok=True)
+
+    def update(self, docs: Mapping[str, str]) -> int:
+        """Add or replace documents (name -> markdown). Unchanged content is skipped."""
+        with self._writer() as m:
+            changed = {}
+            for name, text in docs.items():
+                sha = hashlib.sha256(text.encode("utf-8")).hexdigest()
+                if m["docs"].get(name, {}).get("sha256") != sha:
+                    changed[name] = (text, sha)
+            if not changed:
+                return int(m["generation"])
+            seg_name = f"seg-{int(m['generation']) + 1:06d}"
+            items = [(name, chunk) for name, (text, _) in changed.items() for chunk in chunk_markdown(text, self.chunk_chars)]
+            segment = Segment.build(seg_name, items)
+            for name, (_, sha) in changed.items():
+                m["docs"][name] = {"segment": seg_name, "sha256": sha, "chunks": sum(1 for d in segment.docs if d == name)}
+            if len(m["segments"]) + 1 > self.max_segments:
+                return self._compact(m, segment)
+            return self._commit(m, segment)
+
+    def delete(self, names: Iterable[str]) -> int:
+        with self._writer() as m:
+            removed = [n for n in names if m["docs"].pop(n, None) is not None]
+            return self._commit(m, None) if removed else int(m["generation"])
+
+    def sync_dir(self, kb_dir: Path, pattern: str = "*.md", dedup: bool = True, dedup_threshold: float = 0.8) -> Dict[str, int]:
+        """
+        Bring the index in line with a KB folder: new/changed files are updated, removed
+        files deleted. Duplicate files are left out exactly as LocalRAG(kb_dir) does.
+        """
+        present: Dict[str, Path] = {}
+        duplicates = 0
+        sig = open_index(kb_dir, dedup_threshold) if dedup else None
+        try:
+            for p in sorted(kb_dir.glob(pattern)):
+                if sig is not None:
+                    txt = p.read_text(encoding="utf-8", errors="ignore")
+                    if any(d.doc_id in present for d in sig.matches(txt, exclude=p.name)):
+                        duplicates += 1
+                        continue
+                    sig.add(p.name, txt)
+                present[p.name] = p
+            if sig is not None:
+                sig.retain(present)
+        finally:
+            if sig is not None:
+                sig.close()
+
+        known = self.manifest()["docs"]
+        texts = {}
+        for name, p in present.items():
+            text = p.read_text(encoding="utf-8", errors="ignore")
+            if known.get(name, {}).get("sha256") != hashlib.sha256(text.encode("utf-8")).hexdigest():
+                texts[name] = text
+        gone = [n for n in known if n not in present]
+        if texts:
+            self.update(texts)
+        if gone:
+            self.delete(gone)
+        return {
+            "updated": len(texts),
+            "deleted": len(gone),
+            "duplicates": duplicates,
+            "docs": len(present),
+            "generation": self.generation(),
+        }
+
+    def compact(self) -> int:
+        with self._writer() as m:
+            return self._compact(m, None)
+
+    def _compact(self, m: Dict[str, Any], pending: Optional[Segment]) -> int:
+        segments = {s: self._segment(s) for s in m["segments"]}
+        if pending is not None:
+            segments[pending.name] = pending
+        items = [
+            (doc, text)
+            for seg in segments.values()
+            for doc, text in zip(seg.docs, seg.texts)
+            if m["docs"].get(doc, {}).get("segment") == seg.name
+        ]
+        # A pending segment is never written, so the merged one can take its name.
+        name = f"seg-{int(m['generation']) + 1:06d}"
+        merged = Segment.build(name, items)
+        for info in m["docs"].values():
+            info["segment"] = name
+        m["segments"] = []
+        return self._commit(m, merged)
+
+    def stats(self) -> Dict[str, Any]:
+        m = self.manifest()
+        return {
+            "generation": m["generation"],
+            "segments": len(m["segments"]),
+            "docs": len(m["docs"]),
+            "chunks": sum(int(d.get("chunks", 0)) for d in m["docs"].values()),
+        }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Persistent incremental retrieval index")
+    ap.add_argument("--index", default="", help=f"Index directory (default: <kb>/{INDEX_DIR})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sync = sub.add_parser("sync", help="Index new/changed KB files and drop removed ones")
+    sync.add_argument("kb", nargs="?", default="knowledge_base")
+    add = sub.add_parser("add", help="Add or replace documents from files")
+    add.add_argument("files", nargs="+")
+    rm = sub.add_parser("delete", help="Remove documents by name")
+    rm.add_argument("names", nargs="+")
+    sub.add_parser("compact", help="Merge segments and drop dead chunks")
+    sub.add_parser("stats")
+    search = sub.add_parser("search")
+    search.add_argument("query")
+    search.add_argument("-k", type=int, default=5)
+    args = ap.parse_args()
+
+    kb = Path(getattr(args, "kb", None) or "knowledge_base")
+    index = Index(Path(args.index) if args.index else kb / INDEX_DIR)
+    if args.cmd == "sync":
+        print(index.sync_dir(kb))
+    elif args.cmd == "add":
+        gen = index.update({Path(f).name: Path(f).read_text(encoding="utf-8", errors="ignore") for f in args.files})
+        print(f"generation {gen}")
+    elif args.cmd == "delete":
+        print(f"generation {index.delete(args.names)}")
+    elif args.cmd == "compact":
+        print(f"generation {index.compact()}")
+    elif args.cmd == "stats":
+        print(json.dumps(index.stats(), indent=2))
+    else:
+        for doc, text, score, risks in index.snapshot().search(args.query)[: args.k]:
+            flagged = f"  [risk: {', '.join(risks)}]" if risks else ""
+            print(f"{score:7.3f}  {doc}: {' '.join(text.split())[:100]}{flagged}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# app/jsonrepair.py
+from __future__ import annotations
+
+import json
+import re
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+# Outside a string only braces and quotes matter; inside one only quotes and backslashes.
+# Jumping between these with re.search keeps extraction off the per-character Python path.
+_STRUCT_RE = re.compile(r'[{}"]')
+_IN_STR_RE = re.compile(r'["\\]')
+_FENCE_RE = re.compile(r"```[a-zA-Z0-9_-]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+
+_TOKEN_RE = re.compile(
+    r"""
+      (?P<dq>"(?:[^"\\]|\\.)*(?:"|\\?$))   # double-quoted string (possibly cut off)
+    | (?P<sq>'(?:[^'\\]|\\.)*(?:'|\\?$))   # single-quoted string
+    | (?P<punct>[{}\[\]:,])
+    | (?P<ws>\s+)
+    | (?P<bare>[^\s{}\[\]:,"']+)           # numbers, literals, unquoted keys
+    """,
+    re.DOTALL | re.VERBOSE,
+)
+_NUMBER_RE = re.compile(r"-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?$")
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_CLOSED_RE = {
+    '"': re.compile(r'"(?:[^"\\]|\\.)*"', re.DOTALL),
+    "'": re.compile(r"'(?:[^'\\]|\\.)*'", re.DOTALL),
+}
+_CONTROL_ESCAPES = str.maketrans({"\n": "\\n", "\r": "\\r", "\t": "\\t"})
+
+
+class JSONRepairError(ValueError):
+    """Local repair could not produce valid JSON; the caller should fall back to the LLM."""
+
+
+@dataclass
+class RepairStats:
+    """Process-wide counters (thread-safe). saved_calls = LLM repair round-trips avoided."""
+
+    parsed: int = 0         # valid JSON after fence stripping / extraction only
+    repaired: int = 0       # needed local rewriting, then parsed
+    failed: int = 0         # local repair gave up -> LLM repair
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+    @property
+    def saved_calls(self) -> int:
+        return self.repaired
+
+    def bump(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"parsed": self.parsed, "repaired": self.repaired, "failed": self.failed, "saved_calls": self.repaired}
+
+
+STATS = RepairStats()
+
+
+def strip_code_fences(text: str) -> str:
+    """Return the body of the first ``` fence if there is one, else the text unchanged."""
+    if "```" not in text:
+        return text
+    m = _FENCE_RE.search(text)
+    return m.group(1) if m else text
+
+
+def extract_json_object(text: str) -> str:
+    """
+    Return the first top-level {...} object in text. If it is never closed (output cut off
+    by num_predict), return everything from the opening brace so repair can close it.
+    Text without any brace is returned unchanged.
+    """
+    start = text.find("{")
+    if start == -1:
+        return text
+
+    depth = 0
+    pos = start
+    n = len(text)
+    while pos < n:
+        m = _STRUCT_RE.search(text, pos)
+        if m is None:
+            break
+        ch = m.group()
+        pos = m.end()
+        if ch == '"':
+            # Skip the string body, honouring escapes.
+            while True:
+                s = _IN_STR_RE.search(text, pos)
+                if s is None:
+                    return text[start:]
+                if s.group() == "\\":
+                    pos = s.end() + 1
+                    continue
+                pos = s.end()
+                break
+        elif ch == "{":
+            depth += 1
+        else:
+            depth -= 1
+            if depth == 0:
+                return text[start:pos]
+    return text[start:]
+
+
+def _requote(body: str, quote: str) -> str:
+    # body excludes the surrounding quotes; emit a valid JSON string literal.
+    if quote == "'":
+        body = body.replace("\\'", "'").replace('"', '\\"')
+    return '"' + body.translate(_CONTROL_ESCAPES) + '"'
+
+
+def _rewrite(text: str) -> str:
+    """
+    Token-level rewrite of almost-JSON into JSON:
+      - single-quoted strings -> double-quoted
+      - raw newlines / tabs inside strings -> escapes
+      - trailing commas before } or ] dropped
+      - Python literals (True/False/None) -> JSON; bare keys quoted
+      - truncated output: open string closed, dangling key/comma/colon fixed, open
+        arrays and objects closed in order
+    """
+    out: List[str] = []
+    stack: List[str] = []
+
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        tok = m.group()
+        if kind == "ws":
+            continue
+        if kind in ("dq", "sq"):
+            quote = tok[0]
+            closed = _CLOSED_RE[quote].fullmatch(tok) is not None
+            body = tok[1:-1] if closed else tok[1:].rstrip("\\")
+            out.append(_requote(body, quote))
+        elif kind == "punct":
+            if tok in "{[":
+                stack.append("}" if tok == "{" else "]")
+                out.append(tok)
+            elif tok in "}]":
+                if out and out[-1] == ",":
+                    out.pop()
+                if stack and stack[-1] == tok:
+                    stack.pop()
+                    out.append(tok)
+                # a stray closer is dropped
+            else:
+                out.append(tok)
+        else:
+            if tok in _LITERALS:
+                out.append(_LITERALS[tok])
+            elif _NUMBER_RE.match(tok):
+                out.append(tok)
+            else:
+                out.append(json.dumps(tok))
+        if not stack and out and out[-1] in ("}", "]"):
+            break  # first complete value done; ignore trailing prose
+
+    # Truncation fix-ups at the tail.
+    while out:
+        last = out[-1]
+        if last == ",":
+            out.pop()
+            continue
+        if last == ":":
+            out.append("null")
+            break
+        if stack and stack[-1] == "}" and last.startswith('"') and len(out) >= 2 and out[-2] in ("{", ","):
+            out.pop()  # key without a value
+            continue
+        break
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parse model output as JSON, repairing common failures locally:
+    code fences, surrounding prose, trailing commas, single quotes, unescaped newlines
+    in strings and output truncated mid-object. Raises JSONRepairError if it cannot.
+    """
+    candidate = extract_json_object(strip_code_fences(text.strip()))
+    try:
+        obj = json.loads(candidate)
+        STATS.bump("parsed")
+        return obj
+    except json.JSONDecodeError as e:
+        err: Exception = e
+
+    # Only rewrite things that look like a JSON container; bare prose must not "repair"
+    # into a JSON string.
+    if candidate.lstrip()[:1] in ("{", "["):
+        try:
+            obj = json.loads(_rewrite(candidate))
+            STATS.bump("repaired")
+            return obj
+        except json.JSONDecodeError as e:
+            err = e
+    STATS.bump("failed")
+    raise JSONRepairError(str(err)) from err
@@ -2,10 +2,20 @@
 from __future__ import annotations
 
 import json
+import re
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
-import requests
+from .tracing import METRICS, span
+from .transcript import Transcript, request_key
+
+
+def _requests() -> Any:
+    # Imported on the first real HTTP call: replayed transcripts and BLOCK-only startup
+    # paths never pay for requests/urllib3.
+    import requests
+
+    return requests
 
 
 @dataclass
@@ -18,11 +28,16 @@ class OllamaClient:
     """
     Minimal Ollama chat client.
     Expects Ollama at http://localhost:11434
+
+    With a transcript in "record" mode every response is also stored under its request
+    hash; in "replay" mode responses come from the transcript and no request is sent
+    (an unknown request raises ReplayMiss).
     """
 
-    def __init__(self, base_url: str = "http://localhost:11434", timeout: int = 120):
+    def __init__(self, base_url: str = "http://localhost:11434", timeout: int = 120, transcript: Optional[Transcript] = None):
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
+        self.transcript = transcript
 
     def chat(
         self,
@@ -31,8 +46,84 @@ class OllamaClient:
         temperature: float = 0.2,
         max_tokens: int = 800,
         stream: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+    ) -> LLMResponse:
+        """
+        Send one chat request.
+
+        timeout caps this call below the client's default (used for per-stage budgets).
+
+        If on_token is given the request is streamed: on_token is called with each text
+        piece as it arrives, and the full text is still returned. Raising from on_token
+        aborts the request (the HTTP connection is closed) and propagates the exception.
+        """
+        METRICS.inc("llm_calls_total", model=model)
+        with span("llm.chat", model=model, stream=stream or on_token is not None) as sp:
+            if self.transcript is not None:
+                key = request_key(model, messages, temperature, max_tokens)
+                if self.transcript.mode == "replay":
+                    resp = self._replay(key, model, messages, on_token)
+                else:
+                    resp = self._record(key, messages, model, temperature, max_tokens, stream, on_token, timeout)
+            else:
+                resp = self._chat(messages, model, temperature, max_tokens, stream, on_token, timeout)
+            sp.set(prompt_tokens=resp.raw.get("prompt_eval_count"), completion_tokens=resp.raw.get("eval_count"))
+        return resp
+
+    def _record(
+        self,
+        key: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool,
+        on_token: Optional[Callable[[str], None]],
+        timeout: Optional[float],
+    ) -> LLMResponse:
+        assert self.transcript is not None
+        if on_token is None:
+            resp = self._chat(messages, model, temperature, max_tokens, stream, None, timeout)
+            self.transcript.record(key, model, resp.text, resp.raw)
+            return resp
+
+        # A consumer that stops the stream (StreamGuard) still gets the pieces it saw
+        # recorded, so a replay feeds it the same text and it stops the same way.
+        seen: List[str] = []
+        stopped = False
+
+        def tap(piece: str) -> None:
+            nonlocal stopped
+            seen.append(piece)
+            try:
+                on_token(piece)  # type: ignore[misc]
+            except BaseException:
+                stopped = True
+                raise
+
+        try:
+            resp = self._chat(messages, model, temperature, max_tokens, stream, tap, timeout)
+        except BaseException as e:
+            if stopped:
+                self.transcript.record(key, model, "".join(seen), {"done": False, "stopped_by": type(e).__name__})
+            raise
+        self.transcript.record(key, model, resp.text, resp.raw)
+        return resp
+
+    def _chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool,
+        on_token: Optional[Callable[[str], None]],
+        timeout: Optional[float],
     ) -> LLMResponse:
         url = f"{self.base_url}/api/chat"
+        stream = stream or on_token is not None
+        timeout = self.timeout if timeout is None else min(float(self.timeout), timeout)
         payload = {
             "model": model,
             "messages": messages,
@@ -44,7 +135,10 @@ class OllamaClient:
             },
         }
 
-        r = requests.post(url, json=payload, timeout=self.timeout)
+        if stream:
+            return self._chat_stream(url, payload, on_token, timeout)
+
+        r = _requests().post(url, json=payload, timeout=timeout)
         r.raise_for_status()
         data = r.json()
 
@@ -56,8 +150,58 @@ class OllamaClient:
 
         return LLMResponse(text=text, raw=data)
 
+    def _chat_stream(
+        self,
+        url: str,
+        payload: Dict[str, Any],
+        on_token: Optional[Callable[[str], None]],
+        timeout: float,
+    ) -> LLMResponse:
+        # Streaming responses are NDJSON: one {"message": {...}, "done": false} per piece,
+        # and a final {"done": true, ...} carrying the usage stats.
+        parts: List[str] = []
+        final: Dict[str, Any] = {}
+        with _requests().post(url, json=payload, timeout=timeout, stream=True) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                msg = data.get("message") or {}
+                piece = msg.get("content", "") if isinstance(msg, dict) else ""
+                if piece:
+                    parts.append(piece)
+                    if on_token:
+                        on_token(piece)
+                if data.get("done"):
+                    final = data
+                    break
+
+        text = "".join(parts)
+        raw = dict(final)
+        raw["message"] = {"role": "assistant", "content": text}
+        return LLMResponse(text=text, raw=raw)
+
+    def _replay(
+        self,
+        key: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        on_token: Optional[Callable[[str], None]],
+    ) -> LLMResponse:
+        assert self.transcript is not None
+        entry = self.transcript.lookup(key, model, messages)
+        text = entry["t"]
+        if on_token:
+            # Replay word-sized pieces so streaming consumers see the same text incrementally.
+            for piece in re.findall(r"\S+\s*|\s+", text):
+                on_token(piece)
+        raw = dict(entry.get("u") or {})
+        raw["message"] = {"role": "assistant", "content": text}
+        return LLMResponse(text=text, raw=raw)
+
     def tags(self) -> Dict[str, Any]:
         url = f"{self.base_url}/api/tags"
-        r = requests.get(url, timeout=self.timeout)
+        r = _requests().get(url, timeout=self.timeout)
         r.raise_for_status()
         return r.json()
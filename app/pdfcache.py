@@ -0,0 +1,190 @@
+# app/pdfcache.py
+from __future__ import annotations
+
+import fcntl
+import hashlib
+import os
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Bump when app/pdfgen.py's layout changes, so cached PDFs are invalidated. Kept here
+# rather than in pdfgen so a cache hit never has to import reportlab.
+RENDERER_VERSION = "2"
+
+FICLONE = 0x40049409  # Linux ioctl: share extents (btrfs, xfs, ...)
+LINK_MODES = ("hardlink", "reflink", "copy")
+
+
+def _place(blob: Path, dest: Path, link_mode: str) -> None:
+    """Put the cached blob at dest without re-rendering; degrade to a plain copy."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    if dest.exists() or dest.is_symlink():
+        dest.unlink()
+    if link_mode == "hardlink":
+        try:
+            os.link(blob, dest)
+            return
+        except OSError:
+            pass  # cross-device, or the filesystem has no hard links
+    elif link_mode == "reflink":
+        try:
+            with blob.open("rb") as src, dest.open("wb") as dst:
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return
+        except OSError:
+            dest.unlink(missing_ok=True)
+    shutil.copyfile(blob, dest)
+
+
+def render_into_cache(md_text: str, title: str | None, blob: Path, dest: Path, link_mode: str) -> None:
+    """Render a cache miss into the store, then place it at dest. Picklable for process pools."""
+    from .pdfgen import markdown_to_pdf
+
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    tmp = blob.with_name(f"{blob.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    markdown_to_pdf(md_text, tmp, title=title)
+    os.replace(tmp, blob)  # concurrent renders of the same key are identical; last one wins
+    _place(blob, dest, link_mode)
+
+
+def render_bytes_into_cache(md_text: str, title: str | None, blob: Path) -> bytes:
+    """Like render_into_cache, for stores that keep the PDF bytes themselves (the case archive)."""
+    from .pdfgen import render_pdf_bytes
+
+    data = render_pdf_bytes(md_text, title=title)
+    blob.parent.mkdir(parents=True, exist_ok=True)
+    tmp = blob.with_name(f"{blob.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, blob)
+    return data
+
+
+class PDFCache:
+    """
+    Content-addressed store of rendered PDFs, keyed on (renderer version, title, markdown).
+
+    Identical outputs (e.g. the same BLOCK safe_response, or a deduplicated answer) are
+    hard-linked (or reflinked) into the case folder instead of being rendered again.
+    The store is bounded by max_bytes: every evict_every misses, least-recently-used
+    blobs (mtime is refreshed on each hit) are removed until it is under 90% of the limit.
+    Hard links in case folders survive eviction; only the cache's own reference goes.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int = 256 * 1024 * 1024,
+        link_mode: str = "hardlink",
+        evict_every: int = 32,
+    ):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"link_mode must be one of {LINK_MODES}")
+        self.root = root
+        self.max_bytes = max_bytes
+        self.link_mode = link_mode
+        self.evict_every = max(1, evict_every)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self.evict()  # measure (and trim) whatever a previous run left behind
+
+    @staticmethod
+    def key(md_text: str, title: str | None) -> str:
+        h = hashlib.sha256()
+        for part in (RENDERER_VERSION, title or "", md_text):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def blob_path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.pdf"
+
+    def try_link(self, key: str, dest: Path) -> bool:
+        """On a hit, place the cached PDF at dest and return True."""
+        blob = self.blob_path(key)
+        try:
+            os.utime(blob)  # LRU touch; raises if missing
+            _place(blob, dest, self.link_mode)
+        except FileNotFoundError:
+            return False  # never cached, or evicted between the touch and the link
+        with self._lock:
+            self.hits += 1
+        return True
+
+    def read(self, key: str) -> Optional[bytes]:
+        """On a hit, return the cached PDF bytes."""
+        blob = self.blob_path(key)
+        try:
+            os.utime(blob)
+            data = blob.read_bytes()
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.hits += 1
+        return data
+
+    def note_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+            due = self.misses % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def materialize(self, md_text: str, dest: Path, title: str | None = None) -> bool:
+        """Place the PDF for (md_text, title) at dest, rendering only on a miss. Returns hit."""
+        key = self.key(md_text, title)
+        if self.try_link(key, dest):
+            return True
+        self.note_miss()
+        render_into_cache(md_text, title, self.blob_path(key), dest, self.link_mode)
+        return False
+
+    def _scan(self) -> List[Tuple[float, int, Path]]:
+        entries: List[Tuple[float, int, Path]] = []
+        for sub in self.root.iterdir() if self.root.exists() else []:
+            if not sub.is_dir():
+                continue
+            with os.scandir(sub) as it:
+                for e in it:
+                    if e.name.endswith(".pdf"):
+                        st = e.stat()
+                        entries.append((st.st_mtime, st.st_size, Path(e.path)))
+        return entries
+
+    def evict(self) -> int:
+        entries = self._scan()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        if total > self.max_bytes:
+            target = int(self.max_bytes * 0.9)
+            for _, size, path in sorted(entries):
+                if total <= target:
+                    break
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                total -= size
+                removed += 1
+        with self._lock:
+            self.bytes = total
+            self.evictions += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
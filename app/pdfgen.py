@@ -1,96 +1,206 @@
 # app/pdfgen.py
 from __future__ import annotations
 
+import io
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
 
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
 
+# Layout changes must bump app/pdfcache.RENDERER_VERSION (the content-addressed PDF cache key).
 
-def _wrap_text(c: canvas.Canvas, text: str, x: float, y: float, max_width: float, leading: float) -> float:
+BODY_FONT = ("Helvetica", 11)
+H1_FONT = ("Helvetica-Bold", 16)
+H2_FONT = ("Helvetica-Bold", 13)
+TITLE_FONT = ("Helvetica-Bold", 16)
+MARGIN = 20 * mm
+
+
+# ---------------------------
+# Glyph metrics
+# ---------------------------
+
+@lru_cache(maxsize=None)
+def _glyph_table(font: str) -> Dict[str, float]:
+    """Unit-size advance widths for one font, precomputed for Latin-1; others added lazily."""
+    return {chr(i): stringWidth(chr(i), font, 1.0) for i in range(32, 256)}
+
+
+@lru_cache(maxsize=65536)
+def _unit_word_width(font: str, word: str) -> float:
+    table = _glyph_table(font)
+    try:
+        return sum(map(table.__getitem__, word))
+    except KeyError:
+        for ch in word:
+            if ch not in table:
+                table[ch] = stringWidth(ch, font, 1.0)
+        return sum(map(table.__getitem__, word))
+
+
+def text_width(text: str, font: str, size: float) -> float:
+    """Same result as reportlab's stringWidth for the standard fonts, from cached tables."""
+    return _unit_word_width(font, text) * size
+
+
+def wrap_words(text: str, font: str, size: float, max_width: float) -> List[str]:
     """
-    Draw a paragraph with crude word-wrapping. Returns new y.
+    Greedy word wrap in one pass: each word is measured once (cached per font) and the
+    line width is kept as a running sum, instead of re-measuring the growing line.
+    Words wider than the line are split across lines by character.
     """
-    words = text.split()
-    line = ""
-    for w in words:
-        test = (line + " " + w).strip()
-        if c.stringWidth(test, c._fontname, c._fontsize) <= max_width:
-            line = test
+    space = _unit_word_width(font, " ") * size
+    lines: List[str] = []
+    line: List[str] = []
+    width = 0.0
+    for word in text.split():
+        w = _unit_word_width(font, word) * size
+        if w > max_width:
+            if line:
+                lines.append(" ".join(line))
+                line, width = [], 0.0
+            lines.extend(_split_long_word(word, font, size, max_width))
+            continue
+        needed = w if not line else width + space + w
+        if needed <= max_width:
+            line.append(word)
+            width = needed
         else:
-            c.drawString(x, y, line)
-            y -= leading
-            line = w
-            if y < 20 * mm:
-                c.showPage()
-                y = A4[1] - 20 * mm
-                c.setFont("Helvetica", 11)
+            lines.append(" ".join(line))
+            line, width = [word], w
     if line:
-        c.drawString(x, y, line)
-        y -= leading
-    return y
+        lines.append(" ".join(line))
+    return lines
 
 
-def markdown_to_pdf(md_text: str, pdf_path: Path, title: str | None = None) -> None:
-    """
-    Minimal Markdown -> PDF renderer supporting:
-    - # / ## headings
-    - bullet lines starting with "- "
-    - normal paragraphs
-    """
-    pdf_path.parent.mkdir(parents=True, exist_ok=True)
-    c = canvas.Canvas(str(pdf_path), pagesize=A4)
+def _split_long_word(word: str, font: str, size: float, max_width: float) -> List[str]:
+    table = _glyph_table(font)
+    parts: List[str] = []
+    start = 0
+    width = 0.0
+    for i, ch in enumerate(word):
+        cw = table.get(ch)
+        if cw is None:
+            cw = table[ch] = stringWidth(ch, font, 1.0)
+        cw *= size
+        if width + cw > max_width and i > start:
+            parts.append(word[start:i])
+            start, width = i, 0.0
+        width += cw
+    parts.append(word[start:])
+    return parts
+
+
+# ---------------------------
+# Rendering
+# ---------------------------
+
+class _Layout:
+    def __init__(self, c: canvas.Canvas):
+        self.c = c
+        self.width, self.height = A4
+        self.x = MARGIN
+        self.max_width = self.width - 2 * MARGIN
+        self.y = self.height - MARGIN
+        self.font = BODY_FONT
+
+    def set_font(self, font: Tuple[str, float]) -> None:
+        self.font = font
+        self.c.setFont(*font)
 
-    width, height = A4
-    x = 20 * mm
-    y = height - 20 * mm
-    max_width = width - 40 * mm
+    def new_page(self) -> None:
+        self.c.showPage()
+        self.y = self.height - MARGIN
+        self.c.setFont(*self.font)  # reportlab resets the font on a new page
 
-    def new_page():
-        nonlocal y
-        c.showPage()
-        y = height - 20 * mm
+    def space(self, amount: float) -> None:
+        self.y -= amount
+        if self.y < MARGIN:
+            self.new_page()
 
-    # Optional title
-    if title:
-        c.setFont("Helvetica-Bold", 16)
-        c.drawString(x, y, title)
-        y -= 10 * mm
-        c.setFont("Helvetica", 11)
+    def paragraph(self, text: str, font: Tuple[str, float], leading: float) -> None:
+        if font != self.font:
+            self.set_font(font)
+        for line in wrap_words(text, font[0], font[1], self.max_width):
+            if self.y < MARGIN:
+                self.new_page()
+            self.c.drawString(self.x, self.y, line)
+            self.y -= leading
 
-    lines: List[str] = md_text.splitlines()
 
-    for raw in lines:
-        line = raw.rstrip()
+def _render(md_text: str, out: Union[str, BinaryIO], title: Optional[str]) -> int:
+    c = canvas.Canvas(out, pagesize=A4)
+    layout = _Layout(c)
+    layout.set_font(BODY_FONT)
+
+    if title and title.strip():
+        layout.paragraph(title.strip(), TITLE_FONT, leading=18)
+        layout.space(10 * mm - 18)
+
+    for raw in md_text.splitlines():
+        line = raw.rstrip().replace("\t", "    ")
 
         if not line.strip():
-            y -= 4 * mm
-            if y < 20 * mm:
-                new_page()
+            layout.space(4 * mm)
             continue
 
         # Headings
         if line.startswith("# "):
-            c.setFont("Helvetica-Bold", 16)
-            y = _wrap_text(c, line[2:].strip(), x, y, max_width, leading=18)
-            c.setFont("Helvetica", 11)
-            y -= 2 * mm
-        elif line.startswith("## "):
-            c.setFont("Helvetica-Bold", 13)
-            y = _wrap_text(c, line[3:].strip(), x, y, max_width, leading=15)
-            c.setFont("Helvetica", 11)
-            y -= 1 * mm
+            layout.paragraph(line[2:].strip(), H1_FONT, leading=18)
+            layout.space(2 * mm)
+        elif line.startswith(("## ", "### ", "#### ")):
+            layout.paragraph(line.lstrip("#").strip(), H2_FONT, leading=15)
+            layout.space(1 * mm)
         # Bullets
-        elif line.startswith("- "):
-            bullet = "• " + line[2:].strip()
-            y = _wrap_text(c, bullet, x, y, max_width, leading=13)
+        elif line.lstrip().startswith(("- ", "* ")):
+            layout.paragraph("• " + line.lstrip()[2:].strip(), BODY_FONT, leading=13)
         else:
-            y = _wrap_text(c, line.strip(), x, y, max_width, leading=13)
-
-        if y < 20 * mm:
-            new_page()
-            c.setFont("Helvetica", 11)
+            layout.paragraph(line.strip(), BODY_FONT, leading=13)
 
+    pages = c.getPageNumber()
     c.save()
+    return pages
+
+
+def markdown_to_pdf(md_text: str, pdf_path: Path, title: str | None = None) -> int:
+    """
+    Minimal Markdown -> PDF renderer supporting:
+    - # / ## / ### headings
+    - bullet lines starting with "- " or "* "
+    - normal paragraphs (word-wrapped to the page width)
+    Returns the number of pages written.
+    """
+    pdf_path.parent.mkdir(parents=True, exist_ok=True)
+    return _render(md_text, str(pdf_path), title)
+
+
+def render_pdf_bytes(md_text: str, title: str | None = None) -> bytes:
+    """Render to memory (for caches and archives that store the PDF themselves)."""
+    buf = io.BytesIO()
+    _render(md_text, buf, title)
+    return buf.getvalue()
+
+
+def _render_job(job: Tuple[str, Path, Optional[str]]) -> int:
+    md_text, pdf_path, title = job
+    return markdown_to_pdf(md_text, Path(pdf_path), title=title)
+
+
+def render_many(
+    jobs: Iterable[Tuple[str, Path, Optional[str]]],
+    workers: int = 4,
+    processes: bool = True,
+) -> int:
+    """
+    Render many (markdown, pdf_path, title) jobs on a worker pool. Processes side-step the
+    GIL (reportlab layout is pure Python); threads avoid start-up cost for small batches.
+    Returns the total number of pages rendered.
+    """
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with pool(max_workers=max(1, workers)) as ex:
+        return sum(ex.map(_render_job, jobs, chunksize=4 if processes else 1))
@@ -1,47 +1,18 @@
 # app/postprocess.py
-import json
 from typing import Callable, Type, TypeVar, Any
 from pydantic import ValidationError
 
+from .jsonrepair import JSONRepairError, extract_json_object, repair_json
+
 T = TypeVar("T")
 
 
 def _extract_first_json_object(text: str) -> str:
     """
     Extract the first top-level JSON object from a string, even if surrounded by prose/markdown.
-    Works by scanning for matching braces.
+    Kept for existing callers; see app/jsonrepair.py.
     """
-    start = text.find("{")
-    if start == -1:
-        return text
-
-    depth = 0
-    in_str = False
-    esc = False
-
-    for i in range(start, len(text)):
-        ch = text[i]
-        if in_str:
-            if esc:
-                esc = False
-            elif ch == "\\":
-                esc = True
-            elif ch == '"':
-                in_str = False
-            continue
-        else:
-            if ch == '"':
-                in_str = True
-                continue
-            if ch == "{":
-                depth += 1
-            elif ch == "}":
-                depth -= 1
-                if depth == 0:
-                    return text[start : i + 1]
-
-    # If we never closed braces, return original
-    return text
+    return extract_json_object(text)
 
 
 def parse_or_repair(
@@ -52,17 +23,17 @@ def parse_or_repair(
 ) -> T:
     """
     Try to parse raw as JSON -> validate with Pydantic.
-    If it fails, attempt repair. Also tries extracting the first JSON object from raw.
+    Malformed JSON is first repaired locally (app/jsonrepair.py); repair_fn is only
+    called when that fails or the object does not validate.
     """
     last = raw
 
     for _ in range(max_tries + 1):
-        candidate = _extract_first_json_object(last)
-
+        # Local deterministic repair first; only pay for repair_fn (an LLM call) when it fails.
         try:
-            obj: Any = json.loads(candidate)
+            obj: Any = repair_json(last)
             return model_cls.model_validate(obj)
-        except (json.JSONDecodeError, ValidationError) as e:
+        except (JSONRepairError, ValidationError) as e:
             last = repair_fn(last, str(e))
 
     raise RuntimeError("Failed to produce valid JSON after repair attempts.")
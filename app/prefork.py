@@ -0,0 +1,282 @@
+# app/prefork.py
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+# Only the standard library is imported here: the client side (python -m app.prefork)
+# must start in milliseconds, since the warm workers already hold everything else.
+
+Handler = Callable[[Dict[str, Any], Optional[Callable[[str], None]]], Dict[str, Any]]
+Setup = Callable[[], Tuple[Handler, Callable[[], None]]]
+
+MAX_REQUEST_BYTES = 1 << 20
+_PARENT_SIGNALS = {signal.SIGINT, signal.SIGTERM, signal.SIGCHLD}
+
+
+class PreforkServer:
+    """
+    Unix-socket request server over pre-forked, long-lived worker processes.
+
+    The parent binds the socket and forks `workers` children once everything expensive
+    (imports, the retrieval index, model config) is already loaded, so each child starts
+    warm and shares those pages copy-on-write. Children accept on the shared socket
+    themselves; the parent only replaces children that exit (a crash, or recycling after
+    max_requests) until it gets SIGINT / SIGTERM, then stops them and removes the socket.
+
+    setup() runs in each child right after the fork, for state that must not cross a fork
+    (threads, locks, open logs), and returns (handler, close). handler(body, on_token)
+    gets the request object and returns the result object.
+
+    A worker that fails within min_uptime_s of its fork (typically in setup()) is still
+    replaced, but after max_fast_failures such failures in a row serve_forever() stops
+    the server and raises RuntimeError instead of re-forking in a tight loop.
+
+    Protocol: one JSON request line in; {"token": ...} lines if the request sets "stream",
+    then one {"result": ...} or {"error": ...} line out.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        setup: Setup,
+        workers: int = 2,
+        max_requests: int = 0,
+        backlog: int = 64,
+        min_uptime_s: float = 1.0,
+        max_fast_failures: int = 5,
+    ):
+        self.path = Path(path)
+        self.setup = setup
+        self.workers = max(1, workers)
+        self.max_requests = max_requests
+        self.backlog = backlog
+        self.min_uptime_s = min_uptime_s
+        self.max_fast_failures = max(1, max_fast_failures)
+        self.children: Set[int] = set()
+        self._forked: Dict[int, float] = {}  # pid -> time.monotonic() at fork
+        self._fast_failures = 0
+        self.sock: Optional[socket.socket] = None
+        self._mask: Set[int] = set()
+
+    # ---------------------------
+    # Parent
+    # ---------------------------
+
+    def serve_forever(self) -> None:
+        # The parent keeps SIGINT / SIGTERM / SIGCHLD blocked and takes them synchronously
+        # with sigwaitinfo(): a Python-level handler only runs between bytecodes, so a
+        # signal landing just before a blocking os.wait() went unnoticed. Children inherit
+        # the mask and restore the original once their own handlers are in place.
+        self._mask = signal.pthread_sigmask(signal.SIG_BLOCK, _PARENT_SIGNALS)
+        # Bind under a temporary name and rename once listening, so the path only appears
+        # once connections to it are accepted.
+        staging = self.path.with_name(self.path.name + ".tmp")
+        staging.unlink(missing_ok=True)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.bind(str(staging))
+            self.sock.listen(self.backlog)
+            self.sock.setblocking(False)  # every idle worker wakes for a connection; one wins
+            os.replace(staging, self.path)
+            for _ in range(self.workers):
+                self._spawn()
+            while signal.sigwaitinfo(_PARENT_SIGNALS).si_signo == signal.SIGCHLD:
+                self._replace_exited()
+        finally:
+            self._stop_children()
+            self.sock.close()
+            staging.unlink(missing_ok=True)
+            self.path.unlink(missing_ok=True)
+            while signal.sigtimedwait(_PARENT_SIGNALS, 0):
+                pass  # a repeated Ctrl-C / SIGTERM is already being acted on
+            signal.pthread_sigmask(signal.SIG_SETMASK, self._mask)
+
+    def _replace_exited(self) -> None:
+        # SIGCHLDs coalesce, so reap everything that has exited so far.
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if not pid:
+                return
+            if pid in self.children:
+                self.children.discard(pid)
+                uptime = time.monotonic() - self._forked.pop(pid, 0.0)
+                if status and uptime < self.min_uptime_s:
+                    self._fast_failures += 1
+                    if self._fast_failures >= self.max_fast_failures:
+                        raise RuntimeError(
+                            f"{self._fast_failures} workers in a row failed within {self.min_uptime_s:g}s of starting "
+                            f"(last exit code {os.waitstatus_to_exitcode(status)}); stopping"
+                        )
+                else:
+                    self._fast_failures = 0
+                self._spawn()
+
+    def _spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            self._forked[pid] = time.monotonic()
+            return
+        code = 0
+        try:
+            self._child()
+        except SystemExit:
+            pass
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)  # never fall back into the parent's stack or atexit hooks
+
+    def _stop_children(self) -> None:
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in list(self.children):
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.children.clear()
+        self._forked.clear()
+
+    # ---------------------------
+    # Child
+    # ---------------------------
+
+    def _child(self) -> None:
+        # Ctrl-C reaches the whole process group; only the parent acts on it. SIGTERM gets
+        # a no-op handler so it can only write its number to the wakeup pipe: a worker
+        # waits in select() on that pipe and the socket, so a SIGTERM that lands just
+        # before the wait still wakes it, and a request in progress finishes first.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        wake_r, wake_w = os.pipe()
+        os.set_blocking(wake_w, False)
+        signal.set_wakeup_fd(wake_w)
+        signal.signal(signal.SIGTERM, lambda signum, frame: None)
+        signal.pthread_sigmask(signal.SIG_SETMASK, self._mask)
+        handler, close = self.setup()
+        served = 0
+        try:
+            while not (self.max_requests and served >= self.max_requests):
+                ready, _, _ = select.select([self.sock, wake_r], [], [])
+                if wake_r in ready and signal.SIGTERM in os.read(wake_r, 64):
+                    break
+                if self.sock not in ready:
+                    continue
+                try:
+                    conn, _ = self.sock.accept()  # type: ignore[union-attr]
+                except BlockingIOError:
+                    continue  # another worker took this connection
+                with conn:
+                    conn.setblocking(True)
+                    self._serve(conn, handler)
+                served += 1
+        finally:
+            close()
+
+    @staticmethod
+    def _serve(conn: socket.socket, handler: Handler) -> None:
+        with conn.makefile("rwb") as f:
+
+            def send(obj: Dict[str, Any]) -> None:
+                f.write((json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8"))
+                f.flush()
+
+            try:
+                body = json.loads(f.readline(MAX_REQUEST_BYTES) or b"null")
+                if not isinstance(body, dict):
+                    raise ValueError("request must be one JSON object per line")
+                on_token = (lambda piece: send({"token": piece})) if body.get("stream") else None
+                reply = {"result": handler(body, on_token)}
+            except Exception as e:
+                reply = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                send(reply)
+            except OSError:
+                pass  # the client went away
+
+
+# ---------------------------
+# Client
+# ---------------------------
+
+def request(
+    path: Path,
+    body: Dict[str, Any],
+    on_token: Optional[Callable[[str], None]] = None,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    """Send one request to a PreforkServer; with on_token the answer is streamed to it."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(str(path))
+        s.sendall((json.dumps(dict(body, stream=on_token is not None)) + "\n").encode("utf-8"))
+        with s.makefile("rb") as f:
+            for line in f:
+                msg = json.loads(line)
+                if "token" in msg:
+                    on_token(msg["token"])  # type: ignore[misc]
+                elif "error" in msg:
+                    raise RuntimeError(msg["error"])
+                else:
+                    return msg["result"]
+    raise ConnectionError(f"{path}: worker closed the connection without a result")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Send one prompt to warm workers started with demo.py --warm SOCKET")
+    ap.add_argument("prompt")
+    ap.add_argument("--socket", default="out/warm.sock")
+    ap.add_argument("--client-id", default=None)
+    ap.add_argument("--deadline", type=float, default=None, help="deadline_s for this request")
+    ap.add_argument("--capstone", action="store_true")
+    ap.add_argument("--sectioned", action="store_true")
+    ap.add_argument("--no-stream", action="store_true", help="Print the answer only once it is complete")
+    args = ap.parse_args()
+
+    body: Dict[str, Any] = {"user_prompt": args.prompt, "client_id": args.client_id}
+    if args.capstone:
+        body["capstone"] = True
+    if args.sectioned:
+        body["sectioned"] = True
+    if args.deadline is not None:
+        body["deadline_s"] = args.deadline
+    streamed = []
+
+    def on_token(piece: str) -> None:
+        streamed.append(piece)
+        print(piece, end="", flush=True)
+
+    started = time.monotonic()
+    try:
+        result = request(Path(args.socket), body, on_token=None if args.no_stream else on_token)
+    except (OSError, RuntimeError) as e:
+        raise SystemExit(f"error: {e}")
+    if not streamed:  # --no-stream, or no generation (BLOCK, time limit)
+        print(result.get("answer", ""), end="")
+    print()
+    summary = {k: v for k, v in result.items() if k != "answer"}
+    summary["client_ms"] = round((time.monotonic() - started) * 1000, 1)
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
 
-from rank_bm25 import BM25Okapi
+from .dedup import open_index
+from .gates import passage_risk, risk_score
+from .index import Index, IndexSnapshot
+from .tracing import traced
+
+if TYPE_CHECKING:
+    from rank_bm25 import BM25Okapi
 
 
 @dataclass
@@ -13,6 +21,15 @@ class RAGResult:
     sources: List[str]           # filenames only
     confidence: str              # "high" | "low"
     top_score: float             # raw BM25 score of best hit (after re-rank)
+    risks: List[List[str]] = field(default_factory=list)  # passage_risk flags per source
+
+    @property
+    def clean(self) -> bool:
+        """Every returned passage was annotated clean at index time."""
+        return not any(self.risks)
+
+
+RISK_POLICIES = ("flag", "downrank", "filter")
 
 
 def _tag_for_filename(name: str) -> str:
@@ -37,27 +54,131 @@ class LocalRAG:
       - relevance gating (min_score / relative threshold)
       - domain-aware re-ranking (wikipedia vs policy)
       - optional metadata return (without breaking old callers)
+      - duplicate filtering: exact and near-duplicate files (app/dedup.py) are indexed
+        once, so mirrored pages cannot fill several top-k slots with the same text
+      - persistent index mode (from_index): chunks are scored from app/index.py's on-disk
+        index, and new index generations written by ingest/sync are picked up live
+      - risk annotations: each passage's injection / override / secret flags
+        (gates.passage_risk) are computed when it is indexed, never per query.
+        risk_policy "flag" labels risky snippets, "downrank" also scales their score by
+        (1 - risk/100, floor 0.2), "filter" drops passages with risk >= risk_threshold
     """
 
-    def __init__(self, kb_dir: Path, max_chars: int = 2000):
+    def __init__(
+        self,
+        kb_dir: Path,
+        max_chars: int = 2000,
+        dedup: bool = True,
+        dedup_threshold: float = 0.8,
+        *,
+        index: Optional[Index] = None,
+        reload_interval_s: float = 1.0,
+        risk_policy: str = "flag",
+        risk_threshold: int = 60,
+    ):
+        if risk_policy not in RISK_POLICIES:
+            raise ValueError(f"risk_policy must be one of {RISK_POLICIES}")
         self.kb_dir = kb_dir
         self.max_chars = max_chars
+        self.risk_policy = risk_policy
+        self.risk_threshold = risk_threshold
 
         self.docs: List[str] = []
         self.doc_names: List[str] = []
         self.doc_tags: List[str] = []
+        self.doc_risks: List[List[str]] = []
+        self.duplicates: Dict[str, str] = {}  # skipped file -> file it duplicates
+
+        self.index = index
+        self.snapshot: Optional[IndexSnapshot] = None
+        self.reload_interval_s = reload_interval_s
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+        self.bm25: Optional["BM25Okapi"] = None
+        if index is not None:
+            self._swap(index.snapshot())  # the index was built with its own dedup pass (Index.sync_dir)
+            return
 
+        sigs = open_index(kb_dir, dedup_threshold) if dedup else None
+        kept_names: Set[str] = set()
         texts: List[str] = []
-        for p in kb_dir.glob("*.md"):
+        for p in sorted(kb_dir.glob("*.md")):
             txt = p.read_text(encoding="utf-8", errors="ignore")
+            if sigs is not None:
+                kept = [d for d in sigs.matches(txt, exclude=p.name) if d.doc_id in kept_names]
+                if kept:
+                    self.duplicates[p.name] = kept[0].doc_id
+                    continue
+                sigs.add(p.name, txt)
+                kept_names.add(p.name)
             texts.append(txt)
             self.docs.append(txt)
             self.doc_names.append(p.name)
             self.doc_tags.append(_tag_for_filename(p.name))
+            self.doc_risks.append(passage_risk(txt))
+
+        if sigs is not None:
+            sigs.retain(self.doc_names)
+            sigs.close()
 
         tokenized = [t.split() for t in texts] if texts else []
-        self.bm25 = BM25Okapi(tokenized) if tokenized else None
+        if tokenized:
+            # Imported here: the persistent index path (from_index) never needs rank_bm25/numpy.
+            from rank_bm25 import BM25Okapi
 
+            self.bm25 = BM25Okapi(tokenized)
+
+    @classmethod
+    def from_index(cls, index_dir: Path, max_chars: int = 2000, reload_interval_s: float = 1.0, **kwargs: Any) -> "LocalRAG":
+        """
+        Retrieve from a persistent app/index.py index instead of re-reading the KB.
+        Every reload_interval_s a retrieve() checks the index's CURRENT generation and, if it
+        moved, loads the new snapshot and swaps it in; in-flight retrievals keep the old one.
+        """
+        return cls(index_dir.parent, max_chars, index=Index(index_dir), reload_interval_s=reload_interval_s, **kwargs)
+
+    @property
+    def generation(self) -> int:
+        return self.snapshot.generation if self.snapshot is not None else 0
+
+    def _swap(self, snap: IndexSnapshot) -> None:
+        self.snapshot = snap
+        self.doc_names = snap.doc_names()
+        self.doc_tags = [_tag_for_filename(n) for n in self.doc_names]
+        self._checked_at = time.monotonic()
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Pick up a newer index generation. Returns True if the snapshot changed."""
+        if self.index is None:
+            return False
+        if not force and time.monotonic() - self._checked_at < self.reload_interval_s:
+            return False
+        if not self._reload_lock.acquire(blocking=force):
+            return False  # another thread is already loading it
+        try:
+            self._checked_at = time.monotonic()
+            if self.index.current_name() == f"gen-{self.generation:06d}.json":
+                return False
+            self._swap(self.index.snapshot())
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def _units(self, query: str) -> List[Tuple[str, str, float, List[str]]]:
+        """(doc name, text, raw score, risk flags) candidates: whole files, or the best chunk per file in index mode."""
+        if self.index is not None:
+            self.maybe_reload()
+            snap = self.snapshot
+            best: Dict[str, Tuple[str, str, float, List[str]]] = {}
+            for hit in snap.search(query) if snap is not None else []:
+                best.setdefault(hit[0], hit)
+            return list(best.values())
+        if not self.docs or self.bm25 is None:
+            return []
+        scores = self.bm25.get_scores(query.split())
+        return [(self.doc_names[i], self.docs[i], float(scores[i]), self.doc_risks[i]) for i in range(len(self.docs))]
+
+    @traced("rag.retrieve")
     def retrieve(
         self,
         query: str,
@@ -67,6 +188,7 @@ class LocalRAG:
         min_score: float = 0.10,
         min_relative: float = 0.15,
         return_meta: bool = False,
+        risk_policy: Optional[str] = None,
     ):
         """
         Returns:
@@ -79,14 +201,15 @@ class LocalRAG:
         Domain-aware re-ranking:
           - GENERIC_QA: boost wikipedia; downweight policy
           - ASSESSMENT_GEN: boost policy and course outline
+        Risk policy (default: the instance's): see the class docstring.
         """
-        if not self.docs or self.bm25 is None:
+        policy = risk_policy or self.risk_policy
+        units = self._units(query)
+        if not units:
             empty = RAGResult([], [], "low", 0.0)
             return empty if return_meta else []
 
-        q_tokens = query.split()
-        scores = list(self.bm25.get_scores(q_tokens))
-        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        ranked = sorted(range(len(units)), key=lambda i: units[i][2], reverse=True)
 
         # Domain-aware reweighting (simple and explainable)
         def weight(tag: str, intent_: str) -> float:
@@ -106,7 +229,14 @@ class LocalRAG:
                 return 1.0
             return 1.0
 
-        weighted = [(i, scores[i] * weight(self.doc_tags[i], intent)) for i in ranked]
+        # Risk policy: uses the flags stored at index time, no text is scanned here.
+        if policy == "filter":
+            ranked = [i for i in ranked if risk_score(units[i][3]) < self.risk_threshold]
+
+        def risk_factor(flags: List[str]) -> float:
+            return max(0.2, 1.0 - risk_score(flags) / 100) if policy == "downrank" else 1.0
+
+        weighted = [(i, units[i][2] * weight(_tag_for_filename(units[i][0]), intent) * risk_factor(units[i][3])) for i in ranked]
         weighted.sort(key=lambda x: x[1], reverse=True)
 
         best = weighted[0][1] if weighted else 0.0
@@ -131,10 +261,14 @@ class LocalRAG:
         chosen = filtered[:k]
         snippets: List[str] = []
         sources: List[str] = []
+        risks: List[List[str]] = []
         for i, _s in chosen:
-            snippet = self.docs[i][: self.max_chars].strip()
-            snippets.append(f"[{self.doc_names[i]}]\n{snippet}")
-            sources.append(self.doc_names[i])
+            name, text, _raw, flags = units[i]
+            snippet = text[: self.max_chars].strip()
+            label = f" (flagged at index time: {', '.join(flags)})" if flags else ""
+            snippets.append(f"[{name}]{label}\n{snippet}")
+            sources.append(name)
+            risks.append(flags)
 
-        out = RAGResult(snippets=snippets, sources=sources, confidence="high", top_score=float(chosen[0][1]))
+        out = RAGResult(snippets=snippets, sources=sources, confidence="high", top_score=float(chosen[0][1]), risks=risks)
         return out if return_meta else snippets
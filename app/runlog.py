@@ -0,0 +1,301 @@
+# app/runlog.py
+from __future__ import annotations
+
+import atexit
+import contextvars
+import fcntl
+import gzip
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+SCHEMA_VERSION = 6
+
+
+# ---------------------------
+# Record schema
+# ---------------------------
+
+@dataclass
+class RunRecord:
+    """
+    One line of out/run_log.jsonl. Every writer emits exactly these fields (missing values
+    are null/empty, never absent), so readers need no per-source special cases.
+    """
+
+    case_id: str
+    case_ref: str                       # case folder path, or archive case id
+    user_prompt: str
+    model: str
+    intent: str
+    intent_confidence: float
+    action: str
+    risk_score: int
+    rag_confidence: str = "none"
+    rag_top_score: float = 0.0
+    degraded: bool = False              # any stage fell back because of its latency budget
+    deadline_misses: List[str] = field(default_factory=list)
+    client_id: str = "default"
+    total_ms: float = 0.0
+    stage_ms: Dict[str, float] = field(default_factory=dict)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    json_calls: int = 0                 # structured (intent/triage) model outputs requested
+    json_valid: int = 0                 # ... that parsed first time (after local repair only)
+    repair_calls: int = 0               # LLM JSON-repair round-trips
+    sources: List[str] = field(default_factory=list)
+    cited: Optional[bool] = None        # answer names a retrieved source; None if nothing to cite
+    stream_abort: Optional[str] = None  # StreamGuard stopped generation: "secret" | "kb_dump"
+    triage_cache_similarity: Optional[float] = None  # BLOCK reused from a near-duplicate prompt
+    stage_usage: Dict[str, Dict[str, Dict[str, float]]] = field(default_factory=dict)  # stage -> model -> calls/tokens/ms
+    escalated: Optional[str] = None     # small-model triage re-run on the large model, and why
+    error: Optional[str] = None         # exception that failed the run (action is then "ERROR")
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat(timespec="milliseconds"))
+    schema_version: int = SCHEMA_VERSION
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+# ---------------------------
+# Token accounting
+# ---------------------------
+
+@dataclass
+class TokenUsage:
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    json_calls: int = 0
+    json_valid: int = 0
+    repair_calls: int = 0
+    stages: Dict[str, Dict[str, Dict[str, float]]] = field(default_factory=dict)
+
+    def add(self, raw: Dict[str, Any], stage: str = "", model: str = "", ms: float = 0.0) -> None:
+        # Ollama reports prompt_eval_count / eval_count on the final (or only) response.
+        prompt, completion = int(raw.get("prompt_eval_count") or 0), int(raw.get("eval_count") or 0)
+        self.calls += 1
+        self.prompt_tokens += prompt
+        self.completion_tokens += completion
+        if stage:
+            per = self.stages.setdefault(stage, {}).setdefault(model or str(raw.get("model") or "unknown"), {})
+            per["calls"] = per.get("calls", 0) + 1
+            per["prompt_tokens"] = per.get("prompt_tokens", 0) + prompt
+            per["completion_tokens"] = per.get("completion_tokens", 0) + completion
+            per["ms"] = round(per.get("ms", 0) + ms, 1)
+
+
+_USAGE: contextvars.ContextVar[Optional[TokenUsage]] = contextvars.ContextVar("run_usage", default=None)
+
+
+@contextmanager
+def usage_scope() -> Iterator[TokenUsage]:
+    """Collect token counts from every note_usage() call made inside this block."""
+    usage = TokenUsage()
+    token = _USAGE.set(usage)
+    try:
+        yield usage
+    finally:
+        _USAGE.reset(token)
+
+
+def note_usage(raw: Dict[str, Any], stage: str = "", model: str = "", ms: float = 0.0) -> None:
+    """Count one model response; with a stage it is also attributed (tokens, call time) to that stage and model."""
+    usage = _USAGE.get()
+    if usage is not None:
+        usage.add(raw, stage, model, ms)
+
+
+def note_json(valid: bool, repair_calls: int) -> None:
+    """Record one structured-output request: valid first time, and how many LLM repairs it took."""
+    usage = _USAGE.get()
+    if usage is not None:
+        usage.json_calls += 1
+        usage.json_valid += int(valid)
+        usage.repair_calls += repair_calls
+
+
+# ---------------------------
+# Writer
+# ---------------------------
+
+class RunLog:
+    """
+    Buffered JSONL writer for run records.
+
+    Records are serialised into an in-memory buffer and written in one append when it
+    reaches flush_bytes, or every flush_interval_s from a background thread, instead of
+    one open/write/close per record. Each flush takes an exclusive flock on the file, so
+    threads and separate processes can share one log without interleaving lines.
+
+    The live file is rotated when it would exceed rotate_bytes, or when its last write was
+    on an earlier day; rotated segments are named <stem>-YYYYmmdd-HHMMSS-<pid>-<n>.jsonl and
+    gzip-compressed.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        flush_bytes: int = 64 * 1024,
+        flush_interval_s: float = 1.0,
+        rotate_bytes: int = 50 * 1024 * 1024,
+        rotate_daily: bool = True,
+        compress: bool = True,
+    ):
+        self.path = path
+        self.flush_bytes = flush_bytes
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self.compress = compress
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()       # guards the buffer
+        self._io_lock = threading.Lock()    # one flush at a time within the process
+        self._buf: List[str] = []
+        self._buf_bytes = 0
+        self.written = 0
+        self.rotations = 0
+        self._closed = False
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        if flush_interval_s > 0:
+            self._thread = threading.Thread(
+                target=self._flush_loop, args=(flush_interval_s,), name="runlog-flush", daemon=True
+            )
+            self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, record: RunRecord | Dict[str, Any]) -> None:
+        obj = record.to_dict() if isinstance(record, RunRecord) else record
+        line = json.dumps(obj, ensure_ascii=False) + "\n"
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("RunLog is closed")
+            self._buf.append(line)
+            self._buf_bytes += len(line)
+            full = self._buf_bytes >= self.flush_bytes
+        if full:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._io_lock:
+            with self._lock:
+                lines, self._buf, self._buf_bytes = self._buf, [], 0
+            if not lines:
+                return
+            data = "".join(lines).encode("utf-8")
+            rotated = self._append(data)
+            self.written += len(lines)
+        if rotated is not None and self.compress:
+            _gzip_file(rotated)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+
+    def _flush_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.flush()
+            except OSError:
+                pass  # retried on the next tick; close() surfaces persistent errors
+
+    def _open_locked(self) -> Any:
+        """Open the live file with an exclusive flock, re-opening if another process rotated it."""
+        while True:
+            f = self.path.open("ab")
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                same = os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino
+            except FileNotFoundError:
+                same = False
+            if same:
+                return f
+            f.close()  # renamed under us while we waited for the lock
+
+    def _append(self, data: bytes) -> Optional[Path]:
+        rotated: Optional[Path] = None
+        f = self._open_locked()
+        try:
+            st = os.fstat(f.fileno())
+            if st.st_size and self._should_rotate(st, len(data)):
+                rotated = self._rotate_locked()
+                f.close()
+                f = self._open_locked()
+            f.write(data)
+            f.flush()
+        finally:
+            f.close()  # also releases the flock
+        return rotated
+
+    def _should_rotate(self, st: os.stat_result, incoming: int) -> bool:
+        if st.st_size + incoming > self.rotate_bytes:
+            return True
+        return self.rotate_daily and date.fromtimestamp(st.st_mtime) != date.today()
+
+    def _rotate_locked(self) -> Path:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.rotations += 1
+        # pid + per-process counter keep names unique across writers and fast rotations.
+        target = self.path.with_name(f"{self.path.stem}-{stamp}-{os.getpid()}-{self.rotations:04d}{self.path.suffix}")
+        os.replace(self.path, target)
+        return target
+
+
+class MemoryRunLog:
+    """Keeps run records in memory instead of a file (eval harness, tests). Same write() API."""
+
+    def __init__(self) -> None:
+        self.records: List[RunRecord] = []
+        self._lock = threading.Lock()
+
+    def write(self, record: RunRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def close(self) -> None:
+        pass
+
+
+def _gzip_file(path: Path) -> Path:
+    """Compress a rotated segment to path.gz (atomically) and remove the original."""
+    out = path.with_name(path.name + ".gz")
+    tmp = path.with_name(path.name + ".gz.tmp")
+    with path.open("rb") as src, gzip.open(tmp, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.replace(tmp, out)
+    path.unlink()
+    return out
+
+
+def iter_segments(path: Path) -> List[Path]:
+    """All segments of a run log, oldest first: rotated (.jsonl.gz / .jsonl) then the live file."""
+    rotated = sorted(
+        p for p in path.parent.glob(f"{path.stem}-*{path.suffix}*") if not p.name.endswith(".tmp")
+    )
+    return rotated + ([path] if path.exists() else [])
+
+
+def open_segment(path: Path) -> Any:
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8")
+    return path.open("r", encoding="utf-8")
+
@@ -0,0 +1,281 @@
+# app/scheduler.py
+from __future__ import annotations
+
+import contextvars
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .llm_client import LLMResponse
+
+LANE_INTERACTIVE = 0   # short calls: intent, triage, JSON repair
+LANE_BULK = 1          # long generations (GENERIC_QA answers, ASSESSMENT_GEN)
+
+# Per-request scheduling context. Set by the batch runner / HTTP service around run_one.
+_TENANT: contextvars.ContextVar[str] = contextvars.ContextVar("sched_tenant", default="default")
+_DEADLINE: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("sched_deadline", default=None)
+
+
+class AdmissionRejected(RuntimeError):
+    """The scheduler refused (or gave up on) a call that cannot finish before its deadline."""
+
+
+@contextmanager
+def request_context(tenant: Optional[str] = None, deadline_s: Optional[float] = None) -> Iterator[None]:
+    """
+    Tag every LLM call made inside the block with a tenant (for fair queuing) and an
+    overall deadline, in seconds from now (for deadline-aware rejection).
+    """
+    t1 = _TENANT.set(tenant or "default")
+    t2 = _DEADLINE.set(time.monotonic() + deadline_s if deadline_s else None)
+    try:
+        yield
+    finally:
+        _DEADLINE.reset(t2)
+        _TENANT.reset(t1)
+
+
+def current_tenant() -> str:
+    return _TENANT.get()
+
+
+def current_deadline() -> Optional[float]:
+    """Absolute time.monotonic() deadline of the current request, if any."""
+    return _DEADLINE.get()
+
+
+@dataclass(order=True)
+class _Ticket:
+    finish_tag: float
+    seq: int
+    start_tag: float = field(compare=False)
+    lane: int = field(compare=False)
+    tenant: str = field(compare=False)
+    backend: str = field(compare=False)
+    cost: float = field(compare=False)
+    enqueued: float = field(compare=False)
+    deadline: Optional[float] = field(compare=False)
+    granted: bool = field(default=False, compare=False)
+    cancelled: bool = field(default=False, compare=False)
+
+
+class FairScheduler:
+    """
+    Admission + ordering for LLM calls.
+
+    - Two priority lanes: short classification calls (LANE_INTERACTIVE) always dispatch
+      before long generations (LANE_BULK); a bulk call that has waited longer than
+      max_starvation_s is promoted so it cannot starve.
+    - Within a lane, weighted fair queuing across tenants (self-clocked: each call gets a
+      virtual finish tag = max(lane clock, tenant's last tag) + cost / weight, and the
+      lowest tag dispatches first). Cost is the call's max_tokens.
+    - A concurrency cap per backend (model name).
+    - Deadline-aware rejection: a call whose estimated queue wait + service time would
+      overrun its deadline is rejected up front, and one still queued at its deadline is
+      withdrawn. Both raise AdmissionRejected.
+    """
+
+    def __init__(
+        self,
+        backend_caps: Optional[Dict[str, int]] = None,
+        default_cap: int = 2,
+        tenant_weights: Optional[Dict[str, float]] = None,
+        max_starvation_s: float = 30.0,
+    ):
+        self.backend_caps = dict(backend_caps or {})
+        self.default_cap = max(1, int(default_cap))
+        self.tenant_weights = dict(tenant_weights or {})
+        self.max_starvation_s = max_starvation_s
+
+        self._cv = threading.Condition()
+        self._seq = itertools.count()
+        self._queues: Dict[Tuple[str, int], List[_Ticket]] = {}
+        self._inflight: Dict[str, int] = {}
+        self._vtime: Dict[int, float] = {LANE_INTERACTIVE: 0.0, LANE_BULK: 0.0}
+        self._last_tag: Dict[Tuple[int, str], float] = {}
+        self._service_ewma: Dict[Tuple[str, int], float] = {}
+
+        self.rejected = 0
+        self.expired = 0
+        self.dispatched = 0
+
+    # ---------------------------
+    # Public API
+    # ---------------------------
+
+    def cap(self, backend: str) -> int:
+        return max(1, int(self.backend_caps.get(backend, self.default_cap)))
+
+    @contextmanager
+    def slot(
+        self,
+        backend: str,
+        cost: float,
+        lane: int,
+        tenant: Optional[str] = None,
+        deadline: Optional[float] = None,
+    ) -> Iterator[None]:
+        """Block until the call may run on `backend`; the slot is released on exit."""
+        ticket = self._acquire(backend, cost, lane, tenant or _TENANT.get(), deadline)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(ticket, time.monotonic() - started)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cv:
+            queued = {}
+            for (backend, lane), q in self._queues.items():
+                n = sum(1 for t in q if not t.cancelled)
+                if n:
+                    queued[f"{backend}/{'interactive' if lane == LANE_INTERACTIVE else 'bulk'}"] = n
+            return {
+                "inflight": dict(self._inflight),
+                "queued": queued,
+                "dispatched": self.dispatched,
+                "rejected": self.rejected,
+                "expired": self.expired,
+            }
+
+    # ---------------------------
+    # Internals
+    # ---------------------------
+
+    def _estimate_wait(self, backend: str, lane: int) -> float:
+        # Work that dispatches before this call: everything still queued in its own lane and
+        # any higher-priority lane, spread over the backend's concurrency. Cancelled tickets
+        # stay in the heap until they reach the front, so they are skipped here.
+        ahead = 0.0
+        for (b, l), q in self._queues.items():
+            if b == backend and l <= lane:
+                ahead += sum(1 for t in q if not t.cancelled) * self._service_ewma.get((b, l), 0.0)
+        if self._inflight.get(backend, 0) >= self.cap(backend):
+            ahead += self._service_ewma.get((backend, lane), 0.0)
+        return ahead / self.cap(backend)
+
+    def _acquire(self, backend: str, cost: float, lane: int, tenant: str, deadline: Optional[float]) -> _Ticket:
+        now = time.monotonic()
+        with self._cv:
+            if deadline is not None:
+                expected = self._estimate_wait(backend, lane) + self._service_ewma.get((backend, lane), 0.0)
+                if now + expected > deadline:
+                    self.rejected += 1
+                    raise AdmissionRejected(
+                        f"{backend}: estimated {expected:.1f}s exceeds remaining {max(0.0, deadline - now):.1f}s"
+                    )
+
+            weight = max(1e-6, float(self.tenant_weights.get(tenant, 1.0)))
+            start = max(self._vtime[lane], self._last_tag.get((lane, tenant), 0.0))
+            ticket = _Ticket(
+                finish_tag=start + max(1.0, float(cost)) / weight,
+                seq=next(self._seq),
+                start_tag=start,
+                lane=lane,
+                tenant=tenant,
+                backend=backend,
+                cost=cost,
+                enqueued=now,
+                deadline=deadline,
+            )
+            self._last_tag[(lane, tenant)] = ticket.finish_tag
+            heapq.heappush(self._queues.setdefault((backend, lane), []), ticket)
+            self._dispatch(backend)
+
+            while not ticket.granted:
+                timeout = None if deadline is None else deadline - time.monotonic()
+                if timeout is not None and timeout <= 0:
+                    ticket.cancelled = True
+                    self.expired += 1
+                    raise AdmissionRejected(f"{backend}: deadline passed while queued")
+                # Wake periodically so starving bulk calls get promoted without new events.
+                self._cv.wait(timeout=min(timeout, 1.0) if timeout is not None else 1.0)
+                self._dispatch(backend)
+            return ticket
+
+    def _release(self, ticket: _Ticket, service_s: float) -> None:
+        with self._cv:
+            self._inflight[ticket.backend] = self._inflight.get(ticket.backend, 1) - 1
+            key = (ticket.backend, ticket.lane)
+            prev = self._service_ewma.get(key)
+            self._service_ewma[key] = service_s if prev is None else 0.8 * prev + 0.2 * service_s
+            self._dispatch(ticket.backend)
+
+    def _next(self, backend: str) -> Optional[_Ticket]:
+        for lane in (LANE_INTERACTIVE, LANE_BULK):
+            q = self._queues.get((backend, lane))
+            while q and q[0].cancelled:
+                heapq.heappop(q)
+        bulk = self._queues.get((backend, LANE_BULK))
+        if bulk:
+            oldest = min((t for t in bulk if not t.cancelled), key=lambda t: t.enqueued, default=None)
+            if oldest is not None and time.monotonic() - oldest.enqueued > self.max_starvation_s:
+                bulk.remove(oldest)
+                heapq.heapify(bulk)
+                return oldest
+        for lane in (LANE_INTERACTIVE, LANE_BULK):
+            q = self._queues.get((backend, lane))
+            if q:
+                return heapq.heappop(q)
+        return None
+
+    def _dispatch(self, backend: str) -> None:
+        # Caller holds self._cv.
+        granted = False
+        while self._inflight.get(backend, 0) < self.cap(backend):
+            ticket = self._next(backend)
+            if ticket is None:
+                break
+            ticket.granted = True
+            self._vtime[ticket.lane] = max(self._vtime[ticket.lane], ticket.start_tag)
+            self._inflight[backend] = self._inflight.get(backend, 0) + 1
+            self.dispatched += 1
+            granted = True
+        if granted:
+            self._cv.notify_all()
+
+
+class ScheduledClient:
+    """
+    Wraps an OllamaClient-compatible client so every chat() goes through a FairScheduler.
+    Calls with max_tokens <= short_max_tokens (intent, triage, repair) use the priority lane.
+    """
+
+    def __init__(self, inner: Any, scheduler: FairScheduler, short_max_tokens: int = 512):
+        self.inner = inner
+        self.scheduler = scheduler
+        self.short_max_tokens = short_max_tokens
+
+    def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.2,
+        max_tokens: int = 800,
+        stream: bool = False,
+        on_token: Optional[Callable[[str], None]] = None,
+        **kwargs: Any,
+    ) -> LLMResponse:
+        lane = LANE_INTERACTIVE if max_tokens <= self.short_max_tokens else LANE_BULK
+        deadline = _DEADLINE.get()
+        if kwargs.get("timeout") is not None:
+            # A per-stage budget (app/deadline.py) is a tighter deadline for this call.
+            call_deadline = time.monotonic() + float(kwargs["timeout"])
+            deadline = call_deadline if deadline is None else min(deadline, call_deadline)
+        with self.scheduler.slot(model, cost=max_tokens, lane=lane, deadline=deadline):
+            return self.inner.chat(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                stream=stream,
+                on_token=on_token,
+                **kwargs,
+            )
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
@@ -0,0 +1,282 @@
+# app/server.py
+from __future__ import annotations
+
+import json
+import signal
+import threading
+import time
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+# runner(request_json, on_token) -> response_json. on_token is None for /run.
+Runner = Callable[[Dict[str, Any], Optional[Callable[[str], None]]], Dict[str, Any]]
+
+
+class RequestError(ValueError):
+    """Raised by a runner for a bad request body (mapped to HTTP 400)."""
+
+
+class Overloaded(RuntimeError):
+    """Raised by a runner when downstream capacity rejects the request (mapped to HTTP 429)."""
+
+
+@dataclass
+class ServiceConfig:
+    host: str = "127.0.0.1"
+    port: int = 8080
+    max_concurrency: int = 4     # pipeline runs executing at once
+    max_queue: int = 16          # requests allowed to wait for a slot; beyond this -> 429
+    max_body_bytes: int = 64 * 1024
+    drain_timeout_s: float = 60.0
+
+
+class PipelineService:
+    """
+    Long-running HTTP front-end for the guarded pipeline.
+
+    Endpoints:
+      - GET  /health  -> {"status": "ok"|"draining", "inflight": n, "queued": n, "shed": n}
+      - GET  /metrics -> Prometheus text: metrics() output plus the /health gauges
+      - POST /run     -> runner output as JSON
+      - POST /stream  -> NDJSON: {"event":"token","text":...}* then {"event":"result",...};
+                         a request rejected before its first token gets 400 / 429 as on /run
+
+    Admission control: at most max_concurrency runs execute and max_queue wait; any
+    further request is shed immediately with 429 + Retry-After instead of piling up.
+    """
+
+    def __init__(
+        self,
+        runner: Runner,
+        config: Optional[ServiceConfig] = None,
+        extra_stats: Optional[Callable[[], Dict[str, Any]]] = None,
+        metrics: Optional[Callable[[], str]] = None,
+    ):
+        self.runner = runner
+        self.config = config or ServiceConfig()
+        self.extra_stats = extra_stats
+        self.metrics = metrics
+        self._admit = threading.BoundedSemaphore(self.config.max_concurrency + self.config.max_queue)
+        self._slots = threading.BoundedSemaphore(self.config.max_concurrency)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._admitted = 0
+        self._shed = 0
+        self._draining = threading.Event()
+        self._idle = threading.Condition(self._lock)
+        self.httpd = ThreadingHTTPServer((self.config.host, self.config.port), self._handler_class())
+        self.httpd.daemon_threads = True
+
+    @property
+    def address(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # ---------------------------
+    # Lifecycle
+    # ---------------------------
+
+    def serve_forever(self, install_signals: bool = True) -> None:
+        if install_signals:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                signal.signal(sig, lambda *_: threading.Thread(target=self.shutdown, daemon=True).start())
+        try:
+            self.httpd.serve_forever()
+        finally:
+            self.httpd.server_close()
+
+    def shutdown(self) -> bool:
+        """
+        Graceful stop: refuse new work (503), wait for admitted requests to finish
+        (up to drain_timeout_s), then stop the accept loop. Returns True if fully drained.
+        """
+        self._draining.set()
+        deadline = time.monotonic() + self.config.drain_timeout_s
+        with self._idle:
+            while self._admitted > 0:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._idle.wait(timeout=left)
+            drained = self._admitted == 0
+        self.httpd.shutdown()
+        return drained
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {
+                "status": "draining" if self._draining.is_set() else "ok",
+                "inflight": self._inflight,
+                "queued": self._admitted - self._inflight,
+                "shed": self._shed,
+            }
+        if self.extra_stats is not None:
+            out.update(self.extra_stats())
+        return out
+
+    def metrics_text(self) -> str:
+        text = self.metrics() if self.metrics is not None else ""
+        stats = self.stats()
+        lines = []
+        for name in ("inflight", "queued"):
+            lines += [f"# TYPE service_{name} gauge", f"service_{name} {stats[name]}"]
+        lines += ["# TYPE service_shed_total counter", f"service_shed_total {stats['shed']}"]
+        lines += ["# TYPE service_draining gauge", f"service_draining {int(stats['status'] == 'draining')}"]
+        return text + "\n".join(lines) + "\n"
+
+    # ---------------------------
+    # Request execution
+    # ---------------------------
+
+    def _run(self, body: Dict[str, Any], on_token: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        self._slots.acquire()
+        with self._lock:
+            self._inflight += 1
+        try:
+            return self.runner(body, on_token)
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            self._slots.release()
+
+    def _try_admit(self) -> bool:
+        if self._draining.is_set():
+            return False
+        if not self._admit.acquire(blocking=False):
+            with self._lock:
+                self._shed += 1
+            return False
+        with self._lock:
+            self._admitted += 1
+        return True
+
+    def _release(self) -> None:
+        with self._idle:
+            self._admitted -= 1
+            self._idle.notify_all()
+        self._admit.release()
+
+    def _handler_class(self):
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            server_version = "GuardedLLM/1.0"
+
+            def log_message(self, fmt: str, *args: Any) -> None:  # keep stdout for the pipeline
+                pass
+
+            def _send_json(self, status: int, obj: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self) -> Optional[Dict[str, Any]]:
+                length = int(self.headers.get("Content-Length") or 0)
+                if length <= 0 or length > service.config.max_body_bytes:
+                    self._send_json(HTTPStatus.BAD_REQUEST, {"error": "missing or oversized JSON body"})
+                    return None
+                try:
+                    body = json.loads(self.rfile.read(length))
+                except json.JSONDecodeError as e:
+                    self._send_json(HTTPStatus.BAD_REQUEST, {"error": f"invalid JSON: {e}"})
+                    return None
+                if not isinstance(body, dict):
+                    self._send_json(HTTPStatus.BAD_REQUEST, {"error": "body must be a JSON object"})
+                    return None
+                return body
+
+            def do_GET(self) -> None:
+                if self.path == "/health":
+                    self._send_json(HTTPStatus.OK, service.stats())
+                elif self.path == "/metrics":
+                    data = service.metrics_text().encode("utf-8")
+                    self.send_response(HTTPStatus.OK)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+
+            def do_POST(self) -> None:
+                if self.path not in ("/run", "/stream"):
+                    self._send_json(HTTPStatus.NOT_FOUND, {"error": "not found"})
+                    return
+                body = self._read_body()
+                if body is None:
+                    return
+                if service._draining.is_set():
+                    self._send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "shutting down"}, {"Connection": "close"})
+                    return
+                if not service._try_admit():
+                    self._send_json(HTTPStatus.TOO_MANY_REQUESTS, {"error": "overloaded, retry later"}, {"Retry-After": "1"})
+                    return
+                try:
+                    if self.path == "/run":
+                        self._handle_run(body)
+                    else:
+                        self._handle_stream(body)
+                finally:
+                    service._release()
+
+            def _handle_run(self, body: Dict[str, Any]) -> None:
+                try:
+                    out = service._run(body, None)
+                except RequestError as e:
+                    self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+                    return
+                except Overloaded as e:
+                    self._send_json(HTTPStatus.TOO_MANY_REQUESTS, {"error": str(e)}, {"Retry-After": "1"})
+                    return
+                except Exception as e:  # noqa: BLE001 - report pipeline failures as 500
+                    self._send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"})
+                    return
+                self._send_json(HTTPStatus.OK, out)
+
+            def _handle_stream(self, body: Dict[str, Any]) -> None:
+                # Headers go out with the first event, so a runner that rejects the request
+                # before producing output still gets a real 400 / 429 status.
+                started = False
+
+                def emit(obj: Dict[str, Any]) -> None:
+                    nonlocal started
+                    if not started:
+                        self.send_response(HTTPStatus.OK)
+                        self.send_header("Content-Type", "application/x-ndjson")
+                        self.send_header("Transfer-Encoding", "chunked")
+                        self.send_header("Cache-Control", "no-cache")
+                        self.end_headers()
+                        started = True
+                    data = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+
+                try:
+                    out = service._run(body, lambda piece: emit({"event": "token", "text": piece}))
+                    emit({"event": "result", **out})
+                except (BrokenPipeError, ConnectionResetError):
+                    return  # client went away; the model request was aborted via on_token
+                except RequestError as e:
+                    if not started:
+                        self._send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+                        return
+                    emit({"event": "error", "error": f"{type(e).__name__}: {e}"})
+                except Overloaded as e:
+                    if not started:
+                        self._send_json(HTTPStatus.TOO_MANY_REQUESTS, {"error": str(e)}, {"Retry-After": "1"})
+                        return
+                    emit({"event": "error", "error": f"{type(e).__name__}: {e}"})
+                except Exception as e:  # noqa: BLE001
+                    emit({"event": "error", "error": f"{type(e).__name__}: {e}"})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+        return Handler
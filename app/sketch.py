@@ -0,0 +1,105 @@
+# app/sketch.py
+from __future__ import annotations
+
+import math
+from typing import Any, Dict, Iterable, Optional
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with relative-error guarantees (DDSketch-style).
+
+    Values are counted in logarithmic buckets of ratio gamma = (1+alpha)/(1-alpha), so any
+    quantile is reported within alpha relative error using O(log(max/min)) memory, no
+    matter how many values were added. Sketches built over different log segments (or
+    on different machines) merge exactly by adding bucket counts, which is what makes
+    incremental reports possible. Values <= 0 are counted in a separate zero bucket.
+    """
+
+    def __init__(self, alpha: float = 0.01):
+        if not 0 < alpha < 1:
+            raise ValueError("alpha must be in (0, 1)")
+        self.alpha = alpha
+        self._gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self._gamma)
+        self.bins: Dict[int, int] = {}
+        self.zero = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float, n: int = 1) -> None:
+        if value <= 0:
+            self.zero += n
+        else:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.bins[key] = self.bins.get(key, 0) + n
+        self.count += n
+        self.total += value * n
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def extend(self, values: Iterable[float]) -> None:
+        for v in values:
+            self.add(v)
+
+    def merge(self, other: "QuantileSketch") -> None:
+        if other.alpha != self.alpha:
+            raise ValueError("cannot merge sketches with different alpha")
+        for key, n in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + n
+        self.zero += other.zero
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0 if self.min >= 0 else self.min
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                estimate = 2 * self._gamma**key / (self._gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def summary(self, qs: Iterable[float] = (0.5, 0.9, 0.99)) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"count": self.count}
+        if self.count:
+            out["mean"] = round(self.total / self.count, 3)
+            out["min"] = self.min
+            out["max"] = self.max
+            for q in qs:
+                out[f"p{round(q * 100):d}"] = round(self.quantile(q) or 0.0, 3)
+        return out
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "alpha": self.alpha,
+            "zero": self.zero,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "bins": {str(k): v for k, v in self.bins.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "QuantileSketch":
+        sk = cls(alpha=float(data.get("alpha", 0.01)))
+        sk.zero = int(data.get("zero", 0))
+        sk.count = int(data.get("count", 0))
+        sk.total = float(data.get("total", 0.0))
+        sk.min = data["min"] if data.get("min") is not None else math.inf
+        sk.max = data["max"] if data.get("max") is not None else -math.inf
+        sk.bins = {int(k): int(v) for k, v in (data.get("bins") or {}).items()}
+        return sk
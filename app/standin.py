@@ -0,0 +1,263 @@
+# app/standin.py
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+from .gates import private_data_screen, simple_screen
+
+# Extra markers the keyword gates do not cover, so the stand-in blocks the usual attacks.
+_BLOCK_MARKERS = ("ignore all", "ignore previous", "system prompt", "hidden instructions", "jailbreak")
+_GUARDRAIL_MARKERS = ("avoid detection", "avoid turnitin", "write my", "paraphrase", "bypass")
+_ASSESSMENT_MARKERS = ("assessment", "rubric", "assignment", "capstone")
+_SOURCE_RE = re.compile(r"^\[([^\]\n]+)\]$", re.MULTILINE)
+_SECTION_RE = re.compile(r"Start with the heading '(# [^']+)'")
+
+
+def _last_user(messages: List[Dict[str, str]]) -> str:
+    for m in reversed(messages):
+        if m.get("role") == "user":
+            return str(m.get("content") or "")
+    return ""
+
+
+def _after(text: str, marker: str) -> str:
+    i = text.rfind(marker)
+    return text[i + len(marker):].strip() if i >= 0 else text
+
+
+def _classify(prompt: str) -> Tuple[str, int]:
+    low = prompt.lower()
+    if simple_screen(prompt) or private_data_screen(prompt) or any(m in low for m in _BLOCK_MARKERS):
+        return "BLOCK", 90
+    if any(m in low for m in _GUARDRAIL_MARKERS):
+        return "ALLOW_WITH_GUARDRAILS", 50
+    return "ALLOW", 10
+
+
+@dataclass
+class StandInConfig:
+    latency_ms: float = 0.0          # added per call
+    ms_per_token: float = 0.0        # added per generated token (models answer length)
+    malformed_rate: float = 0.0      # share of JSON replies returned fenced + with trailing commas
+    broken_rate: float = 0.0         # share of JSON replies that cannot be repaired locally
+    seed: int = 0
+
+
+class StandInModel:
+    """
+    Deterministic, rule-based replacement for the LLM, answering the pipeline's intent,
+    triage, JSON-repair and answer prompts. The same request always gets the same reply
+    (noise is seeded from the request), so replay runs are comparable.
+    """
+
+    def __init__(self, config: Optional[StandInConfig] = None):
+        self.config = config or StandInConfig()
+
+    def reply(self, messages: List[Dict[str, str]]) -> str:
+        user = _last_user(messages)
+        rng = random.Random(f"{self.config.seed}:{hashlib.sha256(user.encode('utf-8')).hexdigest()}")
+        if "BAD_OUTPUT:" in user:
+            schema = _after(user.split("BAD_OUTPUT:")[0], "SCHEMA:")
+            if '"action"' in schema:
+                return json.dumps(self._triage("", "ALLOW", 10))
+            return json.dumps({"intent": "GENERIC_QA", "confidence": 0.5})
+        if "GENERIC_QA|ASSESSMENT_GEN" in user and "Rules:" in user:
+            prompt = _after(user, "User prompt:")
+            intent = "ASSESSMENT_GEN" if any(m in prompt.lower() for m in _ASSESSMENT_MARKERS) else "GENERIC_QA"
+            return self._noisy({"intent": intent, "confidence": 0.9}, rng)
+        if "SCORING + ACTION RUBRIC" in user:
+            prompt = _after(user, "User prompt:")
+            action, risk = _classify(prompt)
+            return self._noisy(self._triage(prompt, action, risk), rng)
+        return self._answer(user)
+
+    def _triage(self, prompt: str, action: str, risk: int) -> Dict[str, Any]:
+        threats = []
+        if action == "BLOCK":
+            threats.append(
+                {
+                    "type": "prompt_injection",
+                    "severity": "HIGH",
+                    "evidence": prompt[:60],
+                    "exploit_path": "User attempts to override system instructions",
+                }
+            )
+        return {
+            "action": action,
+            "risk_score": risk,
+            "risk_rationale": "stand-in rule match" if action != "ALLOW" else "benign request",
+            "threats": threats,
+            "safe_response": "" if action == "ALLOW" else "I can't help with that, but I can explain the policy at a high level.",
+            "recommended_controls": [] if action == "ALLOW" else ["Answer at high level only"],
+        }
+
+    def _noisy(self, obj: Dict[str, Any], rng: random.Random) -> str:
+        roll = rng.random()
+        text = json.dumps(obj)
+        if roll < self.config.broken_rate:
+            return "Sure! Here is the result you asked for."
+        if roll < self.config.broken_rate + self.config.malformed_rate:
+            return "```json\n" + text[:-1] + ",}\n```"
+        return text
+
+    def _answer(self, user: str) -> str:
+        if "Task:" in user:
+            task = _after(user, "Task:").split("\n\n")[0]
+            sections = [
+                f"# Assessment Brief\nStand-in brief for: {task}\n",
+                "# Marking Rubric\n- Analysis (40%)\n- Implementation (40%)\n- Reflection (20%)\n",
+                "# Submission Checklist\n- Report\n- Code\n- Evaluation results\n",
+            ]
+            wanted = _SECTION_RE.search(user)
+            if wanted:  # one call per section (demo.py --sectioned)
+                return next((sec for sec in sections if sec.startswith(wanted.group(1) + "\n")), sections[0])
+            return "\n".join(sections)
+        question = _after(user, "Question:").replace("Answer:", "").strip()
+        text = f"This is a stand-in answer to: {question}"
+        sources = _SOURCE_RE.findall(user)
+        if sources:
+            text += "\n\nSources: " + ", ".join(dict.fromkeys(sources))
+        return text
+
+
+class StandInServer:
+    """
+    Local HTTP server speaking the subset of the Ollama API that OllamaClient uses
+    (POST /api/chat, streaming or not; GET /api/tags), backed by StandInModel.
+    Lets the eval harness and benchmarks run the real client and pipeline without a GPU.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, config: Optional[StandInConfig] = None):
+        self.model = StandInModel(config)
+        self.config = self.model.config
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StandInServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="standin", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "StandInServer":
+        return self.start()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.stop()
+
+    def _handler_class(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, fmt: str, *args: Any) -> None:  # quiet
+                pass
+
+            def _send(self, status: int, body: bytes, ctype: str = "application/json") -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self) -> None:
+                if self.path == "/api/tags":
+                    self._send(HTTPStatus.OK, json.dumps({"models": [{"name": "stand-in"}]}).encode())
+                else:
+                    self._send(HTTPStatus.NOT_FOUND, b'{"error":"not found"}')
+
+            def do_POST(self) -> None:
+                if self.path != "/api/chat":
+                    self._send(HTTPStatus.NOT_FOUND, b'{"error":"not found"}')
+                    return
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                messages = payload.get("messages") or []
+                text = server.model.reply(messages)
+                with server._lock:
+                    server.calls += 1
+                prompt_tokens = sum(len(str(m.get("content", ""))) for m in messages) // 4
+                eval_tokens = max(1, len(text) // 4)
+                cfg = server.config
+                delay = (cfg.latency_ms + cfg.ms_per_token * eval_tokens) / 1000
+                usage = {"prompt_eval_count": prompt_tokens, "eval_count": eval_tokens}
+                model = payload.get("model", "stand-in")
+
+                if not payload.get("stream"):
+                    if delay:
+                        time.sleep(delay)
+                    body = {"model": model, "message": {"role": "assistant", "content": text}, "done": True, **usage}
+                    try:
+                        self._send(HTTPStatus.OK, json.dumps(body).encode())
+                    except (BrokenPipeError, ConnectionResetError):
+                        pass  # the client timed out while we slept
+                    return
+
+                self.send_response(HTTPStatus.OK)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = re.findall(r"\S+\s*", text) or [text]
+                try:
+                    for piece in pieces:
+                        if delay:
+                            time.sleep(delay / len(pieces))
+                        self._chunk({"model": model, "message": {"role": "assistant", "content": piece}, "done": False})
+                    self._chunk({"model": model, "done": True, **usage})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    return  # client aborted the stream (cancel, deadline or stream guard)
+
+            def _chunk(self, obj: Dict[str, Any]) -> None:
+                data = json.dumps(obj).encode() + b"\n"
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        return Handler
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Ollama-compatible stand-in server for evals and benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--ms-per-token", type=float, default=0.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0)
+    ap.add_argument("--broken-rate", type=float, default=0.0)
+    args = ap.parse_args()
+    config = StandInConfig(
+        latency_ms=args.latency_ms,
+        ms_per_token=args.ms_per_token,
+        malformed_rate=args.malformed_rate,
+        broken_rate=args.broken_rate,
+    )
+    server = StandInServer(args.host, args.port, config)
+    print(f"Stand-in model on {server.base_url} (point OllamaClient base_url here)")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
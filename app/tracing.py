@@ -0,0 +1,365 @@
+# app/tracing.py
+from __future__ import annotations
+
+import bisect
+import cProfile
+import functools
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+# ---------------------------
+# Spans
+# ---------------------------
+
+_TRACE: ContextVar[Optional["Trace"]] = ContextVar("trace", default=None)
+_PARENT: ContextVar[Optional[int]] = ContextVar("trace_parent", default=None)
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent", "start", "end", "attrs", "thread")
+
+    def __init__(self, name: str, span_id: int, parent: Optional[int], attrs: Dict[str, Any]):
+        self.name = name
+        self.span_id = span_id
+        self.parent = parent
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.attrs = attrs
+        self.thread = threading.get_ident()
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+class _NullSpan:
+    """Returned by span() when no trace is active; every operation is a no-op."""
+
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Trace:
+    """
+    Spans recorded for one request. Spans nest through a context variable, so a span
+    opened inside another (on the same thread) becomes its child.
+    """
+
+    def __init__(self, name: str, attrs: Optional[Dict[str, Any]] = None, to_case: bool = True):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs or {})
+        self.to_case = to_case  # written as trace.json into the case folder
+        self.started_wall = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def open(self, name: str, attrs: Dict[str, Any]) -> Span:
+        with self._lock:
+            self._next_id += 1
+            sp = Span(name, self._next_id, _PARENT.get(), attrs)
+            self.spans.append(sp)
+        return sp
+
+    def duration_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """
+        Chrome trace-event format (open in chrome://tracing or ui.perfetto.dev); spans
+        still open are cut at the time of the call.
+        """
+        now = time.perf_counter()
+        events = []
+        for sp in list(self.spans):
+            end = sp.end if sp.end is not None else now
+            events.append(
+                {
+                    "name": sp.name,
+                    "ph": "X",
+                    "ts": round((sp.start - self.started) * 1e6, 1),
+                    "dur": round((end - sp.start) * 1e6, 1),
+                    "pid": os.getpid(),
+                    "tid": sp.thread,
+                    "args": {"span_id": sp.span_id, "parent": sp.parent, **sp.attrs},
+                }
+            )
+        return {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "trace_id": self.trace_id,
+                "name": self.name,
+                "started": self.started_wall,
+                "total_ms": round((now - self.started) * 1000, 3),
+                **self.attrs,
+            },
+        }
+
+
+@contextmanager
+def _real_span(trace: Trace, name: str, attrs: Dict[str, Any]) -> Iterator[Span]:
+    sp = trace.open(name, attrs)
+    token = _PARENT.set(sp.span_id)
+    try:
+        yield sp
+    except BaseException as e:
+        sp.attrs["error"] = f"{type(e).__name__}: {e}"[:200]
+        raise
+    finally:
+        sp.end = time.perf_counter()
+        _PARENT.reset(token)
+        METRICS.observe("span_ms", (sp.end - sp.start) * 1000, span=name)
+
+
+def span(name: str, **attrs: Any) -> Any:
+    """
+    Context manager timing a block as a span of the active trace. With no active trace
+    this is a context-variable lookup returning a shared no-op object.
+    """
+    trace = _TRACE.get()
+    if trace is None:
+        return NULL_SPAN
+    return _real_span(trace, name, attrs)
+
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def traced(name: str) -> Callable[[F], F]:
+    """Decorator: run the function inside span(name) when a trace is active."""
+
+    def deco(fn: F) -> F:
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            trace = _TRACE.get()
+            if trace is None:
+                return fn(*args, **kwargs)
+            with _real_span(trace, name, {}):
+                return fn(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return deco
+
+
+def current() -> Optional[Trace]:
+    return _TRACE.get()
+
+
+@contextmanager
+def activate(trace: Optional[Trace]) -> Iterator[Optional[Trace]]:
+    """Make trace the active trace for this context (None disables tracing inside)."""
+    token = _TRACE.set(trace)
+    parent = _PARENT.set(None)
+    try:
+        yield trace
+    finally:
+        _PARENT.reset(parent)
+        _TRACE.reset(token)
+
+
+class TraceCollector:
+    """Appends finished traces, one compact JSON object per line, to a local file."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def write(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict(), ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(line)
+
+
+# ---------------------------
+# Tracer: per-request tracing + profiling options
+# ---------------------------
+
+# From Python 3.12 cProfile registers a process-wide sys.monitoring tool, so a second
+# Profile.enable() while another thread profiles raises. Profiled requests take turns.
+_PROFILE_LOCK = threading.Lock()
+
+class Tracer:
+    """
+    What to capture per request: spans (trace.json in the case, and/or a collector file)
+    and an optional cProfile profile written to profile_dir/<case>.pstats + .txt.
+    Profiled requests run one at a time in a process: start_profile() blocks until the
+    previous profile is finished.
+    """
+
+    def __init__(
+        self,
+        case_traces: bool = True,
+        collector: Optional[TraceCollector] = None,
+        profile_dir: Optional[Path] = None,
+        profile_top: int = 30,
+    ):
+        self.case_traces = case_traces
+        self.collector = collector
+        self.profile_dir = profile_dir
+        self.profile_top = profile_top
+        if profile_dir is not None:
+            profile_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def tracing(self) -> bool:
+        return self.case_traces or self.collector is not None
+
+    def start_profile(self) -> Optional[cProfile.Profile]:
+        if self.profile_dir is None:
+            return None
+        _PROFILE_LOCK.acquire()
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except BaseException:
+            _PROFILE_LOCK.release()
+            raise
+        return prof
+
+    def finish(self, trace: Optional[Trace], prof: Optional[cProfile.Profile], case_name: str) -> None:
+        if prof is not None and self.profile_dir is not None:
+            try:
+                prof.disable()
+            finally:
+                _PROFILE_LOCK.release()
+            prof.dump_stats(str(self.profile_dir / f"{case_name}.pstats"))
+            buf = io.StringIO()
+            pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(self.profile_top)
+            (self.profile_dir / f"{case_name}.txt").write_text(buf.getvalue(), encoding="utf-8")
+        if trace is not None and self.collector is not None:
+            trace.attrs.setdefault("case", case_name)
+            self.collector.write(trace)
+
+
+# ---------------------------
+# Metrics (counters + histograms, Prometheus text format)
+# ---------------------------
+
+DEFAULT_BUCKETS_MS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+LabelKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _label_value(v: str) -> str:
+    """Escape a label value for the text format: backslash, double quote and newline."""
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Histogram:
+    __slots__ = ("bounds", "counts", "total", "n")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.n = 0
+
+
+class Metrics:
+    """
+    Process-wide counters and fixed-bucket histograms, rendered in the Prometheus text
+    exposition format for GET /metrics. Updates are a dict lookup under one lock.
+    Histograms use the millisecond buckets unless set_buckets() gave the metric its own.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS_MS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters: Dict[LabelKey, float] = {}
+        self._hists: Dict[LabelKey, _Histogram] = {}
+        self._bounds: Dict[str, Tuple[float, ...]] = {}
+
+    @staticmethod
+    def _key(name: str, labels: Dict[str, Any]) -> LabelKey:
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def inc(self, name: str, value: float = 1, **labels: Any) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_buckets(self, name: str, buckets: Tuple[float, ...]) -> None:
+        """Use these bucket bounds for histogram name (e.g. a 0-1 ratio instead of ms)."""
+        with self._lock:
+            self._bounds[name] = tuple(sorted(buckets))
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        key = self._key(name, labels)
+        with self._lock:
+            h = self._hists.get(key)
+            if h is None:
+                h = self._hists[key] = _Histogram(self._bounds.get(name, self.buckets))
+            h.counts[bisect.bisect_left(h.bounds, value)] += 1
+            h.total += value
+            h.n += 1
+
+    def counter(self, name: str, **labels: Any) -> float:
+        with self._lock:
+            return self._counters.get(self._key(name, labels), 0)
+
+    def series(self, name: str) -> List[Tuple[Dict[str, str], float]]:
+        """Every labelled value of one counter."""
+        with self._lock:
+            return [(dict(labels), v) for (n, labels), v in sorted(self._counters.items()) if n == name]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._hists.clear()
+
+    def render(self, prefix: str = "guarded_") -> str:
+        def fmt(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+            parts = [f'{k}="{_label_value(v)}"' for k, v in labels] + ([extra] if extra else [])
+            return "{" + ",".join(parts) + "}" if parts else ""
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            hists = sorted(
+                ((k, (h.bounds, list(h.counts), h.total, h.n)) for k, h in self._hists.items()), key=lambda kv: kv[0]
+            )
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in counters:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} counter")
+                typed.add(name)
+            lines.append(f"{prefix}{name}{fmt(labels)} {value:g}")
+        for (name, labels), (bounds, counts, total, n) in hists:
+            if name not in typed:
+                lines.append(f"# TYPE {prefix}{name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, c in zip(bounds + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                lines.append(f"{prefix}{name}_bucket{fmt(labels, 'le=' + json.dumps(le))} {cumulative}")
+            lines.append(f"{prefix}{name}_sum{fmt(labels)} {total:.3f}")
+            lines.append(f"{prefix}{name}_count{fmt(labels)} {n}")
+        return "\n".join(lines) + "\n"
+
+
+METRICS = Metrics()
@@ -0,0 +1,121 @@
+# app/transcript.py
+from __future__ import annotations
+
+import atexit
+import gzip
+import hashlib
+import json
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, TextIO
+
+MODES = ("record", "replay")
+
+
+class ReplayMiss(LookupError):
+    """A replayed run asked for a request that is not in the transcript."""
+
+    def __init__(self, key: str, model: str, preview: str, path: Path):
+        super().__init__(
+            f"no recorded response for model={model!r} request={key[:12]} in {path} "
+            f"(last user message: {preview!r}); re-record, or run live"
+        )
+        self.key = key
+
+
+def request_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Stable hash of everything that determines the model's answer (not stream/timeout)."""
+    canon = json.dumps(
+        {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens},
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+def _open_text(path: Path, mode: str) -> TextIO:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")  # type: ignore[return-value]
+    return path.open(mode, encoding="utf-8")
+
+
+class Transcript:
+    """
+    Request/response pairs keyed by request_key, one compact JSON line each:
+    {"k": key, "m": model, "t": text, "u": usage/raw fields without the message}.
+    A ".gz" path is gzip-compressed (appends add gzip members).
+
+    replay: responses are served by key with no network. A key recorded several times
+    (same prompt at temperature > 0) replays its responses in recorded order and then
+    repeats the last one, so repeated runs stay deterministic.
+    record: every response is appended; lines are buffered and written on flush/close.
+    """
+
+    def __init__(self, path: Path, mode: str, flush_every: int = 64):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}")
+        self.path = path
+        self.mode = mode
+        self.flush_every = max(1, flush_every)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, List[Dict[str, Any]]] = {}
+        self._cursor: Dict[str, int] = {}
+        self._pending: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        if mode == "replay":
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            atexit.register(self.close)
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            raise FileNotFoundError(f"transcript {self.path} does not exist (record one with --record)")
+        with _open_text(self.path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["k"], []).append(entry)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._entries.values())
+
+    def lookup(self, key: str, model: str, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.misses += 1
+                preview = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+                raise ReplayMiss(key, model, " ".join(str(preview).split())[-80:], self.path)
+            i = self._cursor.get(key, 0)
+            self._cursor[key] = i + 1
+            self.hits += 1
+            return entries[min(i, len(entries) - 1)]
+
+    def record(self, key: str, model: str, text: str, raw: Dict[str, Any]) -> None:
+        usage = {k: v for k, v in raw.items() if k != "message"}
+        line = json.dumps({"k": key, "m": model, "t": text, "u": usage}, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._pending.append(line + "\n")
+            self.recorded += 1
+            due = len(self._pending) >= self.flush_every
+        if due:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            lines, self._pending = self._pending, []
+            if lines:
+                with _open_text(self.path, "a") as f:
+                    f.write("".join(lines))
+
+    def close(self) -> None:
+        if self.mode == "record":
+            self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self), "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
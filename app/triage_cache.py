@@ -0,0 +1,194 @@
+# app/triage_cache.py
+from __future__ import annotations
+
+import hashlib
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .dedup import BANDS, band_buckets, minhash_shingles, similarity
+from .tracing import METRICS
+
+CHAR_SHINGLE = 4           # characters per shingle: robust to re-ordered or swapped words
+# Only these TriageOut fields are kept: rationale, threats (with their evidence) and the
+# safe response describe the original prompt, which a hit must not copy into another case.
+VERDICT_FIELDS = ("action", "risk_score")
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+# Hits are at or above the threshold, so resolve the upper half of the 0-1 range.
+SIMILARITY_BUCKETS = tuple(round(0.5 + 0.05 * i, 2) for i in range(11))
+METRICS.set_buckets("triage_cache_similarity", SIMILARITY_BUCKETS)
+
+
+def normalize(prompt: str) -> str:
+    return _NON_WORD.sub(" ", prompt.lower()).strip()
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def fingerprint(prompt: str) -> Tuple[int, ...]:
+    """MinHash signature over character shingles of the normalised prompt."""
+    text = normalize(prompt)
+    return minhash_shingles(text[i:i + CHAR_SHINGLE] for i in range(max(1, len(text) - CHAR_SHINGLE + 1)))
+
+
+@dataclass
+class CachedVerdict:
+    key: int
+    prompt_sha256: str                # the original prompt itself is never kept
+    sig: Tuple[int, ...]
+    verdict: Dict[str, Any]           # VERDICT_FIELDS of the original BLOCK
+    created: float = 0.0
+    hits: int = 0
+    similarity: float = 0.0           # set on the copy returned by lookup()
+
+
+class TriageCache:
+    """
+    Near-duplicate memo for BLOCK triage verdicts.
+
+    Prompts are fingerprinted with MinHash over character shingles and indexed in LSH
+    bands (app/dedup.py), so a lookup compares only prompts sharing a bucket. A lookup
+    returns the most similar cached BLOCK with estimated similarity >= threshold; ALLOW and
+    ALLOW_WITH_GUARDRAILS verdicts are never stored, so a paraphrase can only be refused
+    early, never waved through. Entries hold the verdict (VERDICT_FIELDS) and a hash of
+    the prompt, not its text, since hits serve other clients. At most max_entries are kept (oldest evicted first) and
+    entries older than ttl_s expire.
+
+    False reuse: with verify_rate > 0 a sample of hits (should_verify()) still runs the
+    model; if it disagrees, verify() counts a false reuse and drops the entry. Callers
+    with ground truth (replay.py) can call report_false_reuse() directly.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.6,
+        max_entries: int = 10_000,
+        ttl_s: float = 24 * 3600,
+        verify_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.verify_rate = verify_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, CachedVerdict]" = OrderedDict()
+        self._bands: List[Dict[int, Set[int]]] = [{} for _ in range(BANDS)]
+        self._next_key = 0
+        self.counts = {"lookups": 0, "hits": 0, "stores": 0, "expired": 0, "evicted": 0, "verified": 0, "false_reuse": 0}
+
+    # ---------------------------
+    # Index maintenance (call with the lock held)
+    # ---------------------------
+
+    def _drop(self, key: int) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band, bucket in enumerate(band_buckets(entry.sig)):
+            keys = self._bands[band].get(bucket)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._bands[band][bucket]
+
+    def _expire(self, now: float) -> None:
+        # Entries are kept in creation order, so the expired ones are at the front.
+        n = 0
+        while self._entries:
+            entry = next(iter(self._entries.values()))
+            if now - entry.created <= self.ttl_s:
+                break
+            self._drop(entry.key)
+            n += 1
+        self._count("expired", n)
+
+    def _count(self, name: str, n: int = 1) -> None:
+        if n:
+            self.counts[name] += n
+            METRICS.inc(f"triage_cache_{name}_total", n)
+
+    # ---------------------------
+    # API
+    # ---------------------------
+
+    def lookup(self, prompt: str) -> Optional[CachedVerdict]:
+        sig = fingerprint(prompt)
+        now = time.time()
+        with self._lock:
+            self._count("lookups")
+            candidates: Set[int] = set()
+            for band, bucket in enumerate(band_buckets(sig)):
+                candidates.update(self._bands[band].get(bucket, ()))
+            best: Optional[Tuple[float, CachedVerdict]] = None
+            for key in candidates:
+                entry = self._entries[key]
+                if now - entry.created > self.ttl_s:
+                    self._drop(key)
+                    self._count("expired")
+                    continue
+                sim = similarity(sig, entry.sig)
+                if sim >= self.threshold and (best is None or sim > best[0]):
+                    best = (sim, entry)
+            if best is None:
+                return None
+            sim, entry = best
+            entry.hits += 1
+            self._count("hits")
+            METRICS.observe("triage_cache_similarity", sim)
+            return CachedVerdict(entry.key, entry.prompt_sha256, entry.sig, dict(entry.verdict), entry.created, entry.hits, round(sim, 3))
+
+    def store(self, prompt: str, verdict: Dict[str, Any]) -> bool:
+        """Remember a verdict if it is a BLOCK. Returns whether it was stored."""
+        if str(verdict.get("action", "")).strip().upper() != "BLOCK":
+            return False
+        sig = fingerprint(prompt)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            key = self._next_key
+            self._next_key += 1
+            kept = {k: verdict[k] for k in VERDICT_FIELDS if k in verdict}
+            self._entries[key] = CachedVerdict(key, prompt_hash(prompt), sig, kept, created=now)
+            for band, bucket in enumerate(band_buckets(sig)):
+                self._bands[band].setdefault(bucket, set()).add(key)
+            self._count("stores")
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._count("evicted")
+        return True
+
+    def should_verify(self) -> bool:
+        return self.verify_rate > 0 and self._rng.random() < self.verify_rate
+
+    def verify(self, hit: CachedVerdict, model_action: str) -> bool:
+        """Compare a hit against the model's own verdict; a non-BLOCK is a false reuse."""
+        with self._lock:
+            self._count("verified")
+        if model_action.strip().upper() == "BLOCK":
+            return True
+        self.report_false_reuse(hit)
+        return False
+
+    def report_false_reuse(self, hit: CachedVerdict) -> None:
+        with self._lock:
+            self._count("false_reuse")
+            self._drop(hit.key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = dict(self.counts, entries=len(self._entries))
+        out["hit_rate"] = round(out["hits"] / out["lookups"], 4) if out["lookups"] else 0.0
+        out["false_reuse_rate"] = round(out["false_reuse"] / out["verified"], 4) if out["verified"] else None
+        return out
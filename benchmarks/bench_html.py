@@ -0,0 +1,95 @@
+"""
+HTML extraction benchmark: MB/s and output size for ingest_url.py's previous regex
+stripping vs the streaming app/html2md.py converter.
+
+  python benchmarks/bench_html.py --pages 5 --repeat 20
+
+Inputs are the stored Wikipedia page in knowledge_base/ (repeated --repeat times to make
+a multi-megabyte document) plus synthetic pages with large inline scripts.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.html2md import html_to_markdown  # noqa: E402
+
+WORDS = "policy integrity student assessment rubric evidence analysis security retrieval model".split()
+
+
+def legacy_html_to_text(html: str) -> str:
+    # Previous ingest_url.py extraction (before the 8000-char cut).
+    text = re.sub(r"(?is)<script.*?>.*?</script>", "", html)
+    text = re.sub(r"(?is)<style.*?>.*?</style>", "", text)
+    text = re.sub(r"(?is)<[^>]+>", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def synthetic_page(sections: int, seed: int) -> str:
+    rnd = random.Random(seed)
+    out = ["<html><head><title>Synthetic</title><style>body{font:12px}</style></head><body>"]
+    for s in range(sections):
+        out.append(f"<h2>Section {s}</h2>")
+        out.append("<script>var data = " + json.dumps([rnd.random() for _ in range(200)]) + ";</script>")
+        for _ in range(4):
+            out.append("<p>" + " ".join(rnd.choice(WORDS) for _ in range(120)) + "</p>")
+        out.append("<ul>" + "".join(f"<li>{rnd.choice(WORDS)} item</li>" for _ in range(8)) + "</ul>")
+    out.append("</body></html>")
+    return "\n".join(out)
+
+
+def measure(fn, docs):
+    t0 = time.perf_counter()
+    out_chars = sum(len(fn(d)) for d in docs)
+    secs = time.perf_counter() - t0
+    # Separate pass: tracemalloc slows allocation-heavy code far more than the regex path.
+    tracemalloc.start()
+    for d in docs:
+        fn(d)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return out_chars, secs, peak
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--pages", type=int, default=5, help="Synthetic pages")
+    ap.add_argument("--sections", type=int, default=200)
+    ap.add_argument("--repeat", type=int, default=10, help="Copies of the Wikipedia page concatenated")
+    ap.add_argument("--out", type=str, default="", help="Optional JSON results file")
+    args = ap.parse_args()
+
+    docs = [synthetic_page(args.sections, seed) for seed in range(args.pages)]
+    wiki = ROOT / "knowledge_base" / "en_wikipedia_org_wiki.html"
+    if wiki.exists():
+        docs.append(wiki.read_text(encoding="utf-8") * args.repeat)
+    mb = sum(len(d.encode("utf-8")) for d in docs) / 1e6
+
+    results = {}
+    for name, fn in (("regex", legacy_html_to_text), ("streaming", html_to_markdown)):
+        out_chars, secs, peak = measure(fn, docs)
+        results[name] = {
+            "input_mb": round(mb, 2),
+            "seconds": round(secs, 3),
+            "mb_per_sec": round(mb / secs, 2),
+            "output_chars": out_chars,
+            "peak_alloc_mb": round(peak / 1e6, 1),  # includes the output string
+        }
+        print(f"{name:>10}: {mb:.1f} MB in {secs:.2f}s -> {mb / secs:.1f} MB/s, {out_chars} chars out, peak {peak / 1e6:.1f} MB")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
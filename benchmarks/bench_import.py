@@ -0,0 +1,131 @@
+"""
+Start-up benchmark: how long a fresh interpreter takes to import the entry points, and
+which heavy dependencies that pulls in before any request is served.
+
+  python benchmarks/bench_import.py --repeat 10 --out bench_import.json
+  python benchmarks/bench_import.py --baseline bench_import.json --tolerance 0.2   # exit 1 on regression
+
+Each sample is a new `python -X importtime -c "import <module>"` process. Reported per
+module: median process wall time, median import time (importtime's cumulative figure),
+the slowest direct imports, and which of HEAVY were loaded. HEAVY modules are meant to be
+imported lazily (first PDF, first HTTP call, in-memory BM25), so any listed here is a
+regression as well; `python -m app.prefork` is the warm-worker client and should stay
+stdlib-only.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT = Path(__file__).resolve().parents[1]
+
+MODULES = ("demo", "replay", "app.prefork")
+HEAVY = ("reportlab", "requests", "urllib3", "rank_bm25", "numpy")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def parse_importtime(stderr: str, module: str) -> Tuple[float, List[Tuple[str, float]]]:
+    """(cumulative ms for module, its direct imports as (name, ms), slowest first)."""
+    rows: List[Tuple[int, str, float]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cum_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" "))) // 2
+        rows.append((depth, name.strip(), int(cum_us) / 1000))
+    # importtime prints a module after everything it imported, so its subtree is the run
+    # of deeper rows just before it.
+    idx = max(i for i, (depth, name, _) in enumerate(rows) if name == module and depth == 0)
+    children: List[Tuple[str, float]] = []
+    i = idx - 1
+    while i >= 0 and rows[i][0] > 0:
+        if rows[i][0] == 1:
+            children.append((rows[i][1], rows[i][2]))
+        i -= 1
+    return rows[idx][2], sorted(children, key=lambda c: -c[1])
+
+
+def sample(module: str) -> Dict[str, Any]:
+    code = f"import sys, json; import {module}; print(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    wall_ms = (time.perf_counter() - t0) * 1000
+    import_ms, children = parse_importtime(proc.stderr, module)
+    return {"wall_ms": wall_ms, "import_ms": import_ms, "children": children, "heavy": json.loads(proc.stdout)}
+
+
+def bench_module(module: str, repeat: int) -> Dict[str, Any]:
+    samples = [sample(module) for _ in range(repeat)]
+    slowest: Dict[str, List[float]] = {}
+    for s in samples:
+        for name, ms in s["children"]:
+            slowest.setdefault(name, []).append(ms)
+    top = sorted(((name, statistics.median(v)) for name, v in slowest.items()), key=lambda c: -c[1])[:6]
+    return {
+        "wall_ms": round(statistics.median(s["wall_ms"] for s in samples), 1),
+        "import_ms": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "heavy_loaded": samples[-1]["heavy"],
+        "slowest_imports_ms": {name: round(ms, 1) for name, ms in top},
+    }
+
+
+def interpreter_ms(repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], cwd=ROOT, check=True)
+        times.append((time.perf_counter() - t0) * 1000)
+    return round(statistics.median(times), 1)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--modules", nargs="+", default=list(MODULES))
+    ap.add_argument("--repeat", type=int, default=7, help="Fresh processes per module (median reported)")
+    ap.add_argument("--out", type=str, default="", help="Optional JSON results file")
+    ap.add_argument("--baseline", default="", help="Previous results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative import-time growth")
+    ap.add_argument("--floor-ms", type=float, default=10.0, help="Ignore import-time growth below this")
+    args = ap.parse_args()
+
+    bench = {module: bench_module(module, args.repeat) for module in args.modules}
+    results = {"commit": git_commit(), "python": sys.version.split()[0], "interpreter_ms": interpreter_ms(args.repeat), "modules": bench}
+
+    print(f"bare interpreter: {results['interpreter_ms']:.0f} ms")
+    print(f"{'module':<14} {'wall ms':>9} {'import ms':>10}  heavy deps loaded / slowest direct imports (ms)")
+    for module, r in bench.items():
+        heavy = ", ".join(r["heavy_loaded"]) or "none"
+        slow = ", ".join(f"{name} {ms:.0f}" for name, ms in r["slowest_imports_ms"].items())
+        print(f"{module:<14} {r['wall_ms']:>9.0f} {r['import_ms']:>10.0f}  {heavy} / {slow}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results -> {args.out}")
+
+    regressions = [f"{m}: loads {', '.join(r['heavy_loaded'])} at import" for m, r in bench.items() if r["heavy_loaded"]]
+    if args.baseline:
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        for module, r in bench.items():
+            a = base.get("modules", {}).get(module, {}).get("import_ms")
+            if a is not None and r["import_ms"] > a * (1 + args.tolerance) and r["import_ms"] - a > args.floor_ms:
+                regressions.append(f"{module}: import {a:.0f} -> {r['import_ms']:.0f} ms")
+    if regressions:
+        raise SystemExit(f"{len(regressions)} regression(s):\n  " + "\n  ".join(regressions))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+PDF renderer benchmark: pages/sec on large assessment-style markdown.
+
+  python benchmarks/bench_pdf.py --docs 20 --sections 40 --workers 4
+
+"before" is the previous app/pdfgen.py wrapping (stringWidth on the growing line for
+every word); "after" is the current renderer, single-threaded and via render_many.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from reportlab.lib.pagesizes import A4  # noqa: E402
+from reportlab.lib.units import mm  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+from app.pdfgen import markdown_to_pdf, render_many  # noqa: E402
+
+WORDS = (
+    "students must implement a prompt injection test suite for their retrieval augmented generation "
+    "pipeline and report attack success rate false block rate json validity rate citation coverage "
+    "ethics compliance rubric criteria marking distinction credit pass evidence analysis security"
+).split()
+
+
+def synthetic_assessment(sections: int, seed: int) -> str:
+    rnd = random.Random(seed)
+    out = ["# Assessment Brief", ""]
+    for s in range(sections):
+        out.append(f"## Section {s + 1}")
+        for _ in range(3):
+            out.append(" ".join(rnd.choice(WORDS) for _ in range(rnd.randint(60, 160))))
+            out.append("")
+        for _ in range(5):
+            out.append("- " + " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(8, 30))))
+        out.append("")
+    return "\n".join(out)
+
+
+# ---------------------------
+# Previous renderer (for the "before" column)
+# ---------------------------
+
+def _legacy_wrap(c, text, x, y, max_width, leading):
+    words = text.split()
+    line = ""
+    for w in words:
+        test = (line + " " + w).strip()
+        if c.stringWidth(test, c._fontname, c._fontsize) <= max_width:
+            line = test
+        else:
+            c.drawString(x, y, line)
+            y -= leading
+            line = w
+            if y < 20 * mm:
+                c.showPage()
+                y = A4[1] - 20 * mm
+                c.setFont("Helvetica", 11)
+    if line:
+        c.drawString(x, y, line)
+        y -= leading
+    return y
+
+
+def legacy_markdown_to_pdf(md_text: str, pdf_path: Path, title: str) -> int:
+    c = canvas.Canvas(str(pdf_path), pagesize=A4)
+    width, height = A4
+    x, y, max_width = 20 * mm, height - 20 * mm, width - 40 * mm
+    c.setFont("Helvetica-Bold", 16)
+    c.drawString(x, y, title)
+    y -= 10 * mm
+    c.setFont("Helvetica", 11)
+    for raw in md_text.splitlines():
+        line = raw.rstrip()
+        if not line.strip():
+            y -= 4 * mm
+        elif line.startswith("# "):
+            c.setFont("Helvetica-Bold", 16)
+            y = _legacy_wrap(c, line[2:], x, y, max_width, 18)
+            c.setFont("Helvetica", 11)
+        elif line.startswith("## "):
+            c.setFont("Helvetica-Bold", 13)
+            y = _legacy_wrap(c, line[3:], x, y, max_width, 15)
+            c.setFont("Helvetica", 11)
+        elif line.startswith("- "):
+            y = _legacy_wrap(c, "• " + line[2:], x, y, max_width, 13)
+        else:
+            y = _legacy_wrap(c, line, x, y, max_width, 13)
+        if y < 20 * mm:
+            c.showPage()
+            y = height - 20 * mm
+            c.setFont("Helvetica", 11)
+    pages = c.getPageNumber()
+    c.save()
+    return pages
+
+
+def _time(fn) -> tuple:
+    t0 = time.perf_counter()
+    pages = fn()
+    return pages, time.perf_counter() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--docs", type=int, default=12)
+    ap.add_argument("--sections", type=int, default=30)
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--out", type=str, default="", help="Optional JSON results file")
+    args = ap.parse_args()
+
+    docs = [synthetic_assessment(args.sections, seed) for seed in range(args.docs)]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        d = Path(tmp)
+        runs = {
+            "before": lambda: sum(legacy_markdown_to_pdf(md, d / f"old{i}.pdf", "Assessment") for i, md in enumerate(docs)),
+            "after": lambda: sum(markdown_to_pdf(md, d / f"new{i}.pdf", "Assessment") for i, md in enumerate(docs)),
+            f"after_pool_{args.workers}": lambda: render_many(
+                [(md, d / f"pool{i}.pdf", "Assessment") for i, md in enumerate(docs)], workers=args.workers
+            ),
+        }
+        for name, fn in runs.items():
+            pages, secs = _time(fn)
+            results[name] = {"pages": pages, "seconds": round(secs, 3), "pages_per_sec": round(pages / secs, 1)}
+            print(f"{name:>16}: {pages} pages in {secs:.2f}s -> {pages / secs:.1f} pages/s")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
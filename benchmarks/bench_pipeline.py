@@ -0,0 +1,273 @@
+"""
+End-to-end pipeline benchmark against the local stand-in model (app/standin.py).
+
+  python benchmarks/bench_pipeline.py --cases 200 --workers 4 --kb-docs 200 --out bench.json
+  python benchmarks/bench_pipeline.py --baseline bench.json --tolerance 0.15   # exit 1 on regression
+
+Sections: LocalRAG build + retrieve on a synthetic KB, llm_json, generate_assessment_artifacts,
+PDF rendering, and run_one over a prompt mix drawn from logs/redteam_dataset.jsonl.
+Each section reports throughput and latency percentiles; run_one also reports per-stage
+percentiles from the run records. Allocations (tracemalloc peak) are measured in a
+separate short pass so they do not distort the timings; peak RSS is for the process.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from app.artifacts import ArtifactWriter  # noqa: E402
+from app.batch import percentile  # noqa: E402
+from app.evaluation import LATENCY_KEYS, load_dataset  # noqa: E402
+from app.llm_client import OllamaClient  # noqa: E402
+from app.pdfgen import render_pdf_bytes  # noqa: E402
+from app.prompts import build_intent_messages  # noqa: E402
+from app.rag import LocalRAG  # noqa: E402
+from app.runlog import MemoryRunLog  # noqa: E402
+from app.standin import StandInConfig, StandInModel, StandInServer  # noqa: E402
+from demo import generate_assessment_artifacts, llm_json, run_one  # noqa: E402
+
+TOPICS = (
+    "academic integrity policy turnitin similarity report misconduct appeal extension "
+    "special consideration assessment rubric marking criteria plagiarism referencing "
+    "retrieval augmented generation prompt injection security privacy student records"
+).split()
+FILLER = "the a of to and for in on with by students staff university must should may".split()
+TAGS = ("policy", "guide", "faq", "handbook", "external")
+INTENT_SCHEMA = '{"intent":"GENERIC_QA|ASSESSMENT_GEN","confidence":0.0-1.0}'
+
+# Higher is better for these; every other compared number is a latency (lower is better).
+THROUGHPUT_KEYS = ("per_sec",)
+
+
+def build_kb(root: Path, docs: int, words: int, seed: int = 0) -> Path:
+    rnd = random.Random(seed)
+    root.mkdir(parents=True, exist_ok=True)
+    for i in range(docs):
+        topic = rnd.sample(TOPICS, 4)
+        lines = [f"# {' '.join(topic).title()}", ""]
+        for _ in range(max(1, words // 80)):
+            lines.append(" ".join(rnd.choice(topic if rnd.random() < 0.3 else FILLER) for _ in range(80)))
+            lines.append("")
+        (root / f"{TAGS[i % len(TAGS)]}_{i:05d}.md").write_text("\n".join(lines), encoding="utf-8")
+    return root
+
+
+def load_prompts(path: Path, n: int, seed: int = 0) -> List[str]:
+    prompts = [c["user_prompt"] for c in load_dataset(path)] if path.exists() else []
+    # Always include an assessment request so ASSESSMENT_GEN + artifacts are exercised.
+    prompts.append("Design a capstone assessment with a rubric on prompt injection testing")
+    rnd = random.Random(seed)
+    return [rnd.choice(prompts) for _ in range(n)]
+
+
+def _lat(samples_ms: List[float]) -> Dict[str, float]:
+    return {f"p{p}": round(percentile(samples_ms, p), 3) for p in (50, 95, 99)}
+
+
+def time_calls(fn: Callable[[int], Any], n: int) -> Dict[str, Any]:
+    samples: List[float] = []
+    t0 = time.perf_counter()
+    for i in range(n):
+        s = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - s) * 1000)
+    secs = time.perf_counter() - t0
+    return {"n": n, "seconds": round(secs, 3), "per_sec": round(n / secs, 1), "latency_ms": _lat(samples)}
+
+
+def alloc_peak_kb(fn: Callable[[int], Any], n: int) -> float:
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        for i in range(n):
+            fn(i)
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def bench_pipeline(llm: OllamaClient, rag: LocalRAG, prompts: List[str], model: str, workers: int, out_dir: Path) -> Dict[str, Any]:
+    writer = ArtifactWriter(workers=2)
+    records: List[Any] = []
+
+    def one(prompt: str) -> None:
+        log = MemoryRunLog()
+        run_one(llm, rag, out_dir, model, prompt, False, writer=writer, run_log=log)
+        records.extend(log.records)
+
+    t0 = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(one, prompts))
+    finally:
+        writer.shutdown()
+    secs = time.perf_counter() - t0
+
+    stages: Dict[str, Dict[str, float]] = {}
+    for key in LATENCY_KEYS:
+        values = [r.total_ms if key == "total" else r.stage_ms.get(key) for r in records]
+        values = [v for v in values if v is not None]
+        if values:
+            stages[key] = _lat(values)
+    return {
+        "n": len(prompts),
+        "workers": workers,
+        "seconds": round(secs, 3),
+        "per_sec": round(len(prompts) / secs, 1),
+        "latency_ms": stages.pop("total", {}),
+        "stage_ms": stages,
+        "degraded": sum(1 for r in records if r.degraded),
+    }
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], tolerance: float, floor_ms: float) -> List[str]:
+    """Names of numbers that got worse by more than tolerance (relative); latencies also by > floor_ms."""
+    regressions: List[str] = []
+
+    def walk(a: Any, b: Any, path: str) -> None:
+        if isinstance(a, dict) and isinstance(b, dict):
+            for k in a.keys() & b.keys():
+                walk(a[k], b[k], f"{path}.{k}" if path else k)
+            return
+        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or not a:
+            return
+        leaf = path.rsplit(".", 1)[-1]
+        if leaf in THROUGHPUT_KEYS:
+            if b < a * (1 - tolerance):
+                regressions.append(f"{path}: {a} -> {b}")
+        elif "latency_ms" in path or "stage_ms" in path:
+            if b > a * (1 + tolerance) and b - a > floor_ms:
+                regressions.append(f"{path}: {a} -> {b}")
+
+    walk(base.get("benchmarks", {}), new.get("benchmarks", {}), "")
+    return sorted(regressions)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--cases", type=int, default=60, help="run_one calls in the end-to-end section")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--iterations", type=int, default=200, help="Calls per micro-benchmark")
+    ap.add_argument("--kb-docs", type=int, default=100)
+    ap.add_argument("--kb-words", type=int, default=400, help="Approximate words per KB document")
+    ap.add_argument("--dataset", default=str(ROOT / "logs" / "redteam_dataset.jsonl"))
+    ap.add_argument("--model", default="stand-in")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Stand-in latency per model call")
+    ap.add_argument("--ms-per-token", type=float, default=0.0)
+    ap.add_argument("--malformed-rate", type=float, default=0.0)
+    ap.add_argument("--out", default="", help="JSON results file")
+    ap.add_argument("--baseline", default="", help="Previous results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before failing")
+    ap.add_argument("--floor-ms", type=float, default=1.0, help="Ignore latency changes smaller than this")
+    args = ap.parse_args()
+
+    config = StandInConfig(latency_ms=args.latency_ms, ms_per_token=args.ms_per_token, malformed_rate=args.malformed_rate)
+    prompts = load_prompts(Path(args.dataset), args.cases)
+    queries = load_prompts(Path(args.dataset), args.iterations, seed=1)
+    answer = StandInModel().reply([{"role": "user", "content": "Task: design a capstone assessment\n\n"}])
+    brief = "\n\n".join([answer] * 20)
+    bench: Dict[str, Any] = {}
+
+    with tempfile.TemporaryDirectory() as tmp, StandInServer(config=config) as server:
+        tmp_dir = Path(tmp)
+        kb_dir = build_kb(tmp_dir / "kb", args.kb_docs, args.kb_words)
+        llm = OllamaClient(base_url=server.base_url)
+
+        t0 = time.perf_counter()
+        rag = LocalRAG(kb_dir=kb_dir, max_chars=2000)
+        bench["rag_build"] = {"docs": args.kb_docs, "seconds": round(time.perf_counter() - t0, 3)}
+
+        def retrieve(i: int) -> Any:
+            return rag.retrieve(queries[i % len(queries)], intent="GENERIC_QA", k=4)
+
+        def intent_json(i: int) -> Any:
+            return llm_json(llm, args.model, build_intent_messages(queries[i % len(queries)]), INTENT_SCHEMA, 200)
+
+        micro = {
+            "rag_retrieve": (retrieve, args.iterations),
+            "llm_json": (intent_json, args.iterations),
+            "assessment_artifacts": (lambda i: generate_assessment_artifacts(answer), args.iterations),
+            "pdf_render": (lambda i: render_pdf_bytes(brief, "Assessment Brief"), max(10, args.iterations // 10)),
+        }
+        for name, (fn, n) in micro.items():
+            fn(0)  # warm-up
+            bench[name] = time_calls(fn, n)
+            bench[name]["alloc_peak_kb"] = alloc_peak_kb(fn, min(n, 20))
+
+        def run_inline(i: int) -> Any:
+            writer = ArtifactWriter(background=False)
+            try:
+                return run_one(llm, rag, tmp_dir / "alloc", args.model, prompts[i], False, writer=writer)
+            finally:
+                writer.shutdown()
+
+        bench["run_one"] = bench_pipeline(llm, rag, prompts, args.model, args.workers, tmp_dir / "cases")
+        bench["run_one"]["alloc_peak_kb"] = alloc_peak_kb(run_inline, min(len(prompts), 5))
+        bench["run_one"]["model_calls"] = server.calls
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": vars(args),
+        "peak_rss_mb": peak_rss_mb(),
+        "benchmarks": bench,
+    }
+
+    print(f"{'benchmark':<22} {'n':>6} {'per_sec':>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'alloc KiB':>10}")
+    for name, r in bench.items():
+        lat = r.get("latency_ms") or {}
+        print(
+            f"{name:<22} {r.get('n', r.get('docs', '')):>6} {r.get('per_sec', ''):>10} "
+            f"{lat.get('p50', ''):>9} {lat.get('p95', ''):>9} {lat.get('p99', ''):>9} {r.get('alloc_peak_kb', ''):>10}"
+        )
+    for stage, p in bench["run_one"]["stage_ms"].items():
+        print(f"  run_one.{stage:<13} p50={p['p50']:.1f} p95={p['p95']:.1f} p99={p['p99']:.1f} ms")
+    print(f"peak RSS {results['peak_rss_mb']} MiB, commit {results['commit'] or '?'}")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, indent=2), encoding="utf-8")
+        print(f"Results -> {args.out}")
+
+    if args.baseline:
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(base, results, args.tolerance, args.floor_ms)
+        if regressions:
+            raise SystemExit(
+                f"{len(regressions)} regression(s) vs {args.baseline} (commit {base.get('commit') or '?'}):\n  "
+                + "\n  ".join(regressions)
+            )
+        print(f"No regressions vs {args.baseline} (tolerance {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
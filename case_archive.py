@@ -0,0 +1,78 @@
+import argparse
+import json
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+from app.archive import ArchiveError, CaseArchive
+
+
+def parse_time(value: str) -> Optional[float]:
+    if not value:
+        return None
+    return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect and export cases stored with demo.py --archive")
+    ap.add_argument("--archive", default="out/archive", help="Archive directory")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    ls = sub.add_parser("list", help="List archived cases, newest first")
+    ls.add_argument("--intent", default="")
+    ls.add_argument("--action", default="")
+    ls.add_argument("--since", default="", help="ISO timestamp, e.g. 2024-05-01 or 2024-05-01T09:00")
+    ls.add_argument("--until", default="")
+    ls.add_argument("--limit", type=int, default=50)
+
+    show = sub.add_parser("show", help="Print a case's metadata and one artifact")
+    show.add_argument("case_id")
+    show.add_argument("--file", default="answer.md")
+
+    ex = sub.add_parser("export", help="Materialise classic case folders")
+    ex.add_argument("case_ids", nargs="+")
+    ex.add_argument("--dest", default="out", help="Folder to create the case directories in")
+
+    sub.add_parser("reindex", help="Rebuild index.sqlite from the segment files")
+    sub.add_parser("stats", help="Case, segment and byte counts")
+    args = ap.parse_args()
+
+    # Only reindex may repair the archive; inspection must not truncate the tail a running
+    # demo.py --archive is still appending to.
+    try:
+        archive = CaseArchive(Path(args.archive), readonly=args.cmd != "reindex")
+    except ArchiveError as e:
+        raise SystemExit(str(e))
+    try:
+        if args.cmd == "list":
+            rows = archive.query(
+                intent=args.intent,
+                action=args.action,
+                since=parse_time(args.since),
+                until=parse_time(args.until),
+                limit=args.limit,
+            )
+            for r in rows:
+                when = datetime.fromtimestamp(r["ts"]).strftime("%Y-%m-%d %H:%M:%S")
+                print(f"{when}  {r['intent'] or '-':<14} {r['action'] or '-':<22} {r['case_id']}")
+        elif args.cmd == "show":
+            case = archive.get(args.case_id)
+            print(json.dumps({"status": case.status, "meta": case.meta, "artifacts": case.artifacts}, indent=2))
+            if args.file in case.files:
+                print(f"\n--- {args.file} ---")
+                print(case.files[args.file].decode("utf-8", errors="replace"))
+        elif args.cmd == "export":
+            for case_id in args.case_ids:
+                print(f"Exported: {archive.export(case_id, Path(args.dest))}")
+        elif args.cmd == "reindex":
+            print(f"Indexed {archive.reindex()} cases")
+        else:
+            print(json.dumps(archive.stats(), indent=2))
+    except ArchiveError as e:
+        raise SystemExit(str(e))
+    finally:
+        archive.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,52 @@
 from __future__ import annotations
 
 import argparse
+import contextvars
 import json
+import math
 import os
 import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
-
-from pydantic import BaseModel, Field, ValidationError
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfgen import canvas
-
+from typing import Any, Callable, Dict, List, Literal, Optional, Tuple, Type, Union
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from app.archive import CaseArchive
+from app.artifacts import INLINE as INLINE_WRITER
+from app.artifacts import MANIFEST_NAME, ArtifactWriter
+from app.batch import load_cases, run_batch
+from app.cascade import STAGES as STAGE_ORDER
+from app.cascade import ModelPlan
+from app.deadline import Deadline, DeadlineExceeded, StageBudget
+from app.gates import StreamAborted, StreamGuard, private_data_screen, simple_screen
+from app.index import INDEX_DIR, Index
+from app.jsonrepair import STATS as REPAIR_STATS
+from app.jsonrepair import JSONRepairError, extract_json_object, repair_json, strip_code_fences
 from app.llm_client import OllamaClient
+from app.pdfcache import PDFCache
+from app.prefork import PreforkServer
 from app.prompts import (
+    ASSESSMENT_SECTIONS,
     build_assessment_messages,
+    build_assessment_section_messages,
     build_generic_qa_messages,
     build_intent_messages,
     build_json_repair_messages,
     build_triage_messages,
 )
-from app.rag import LocalRAG, RAGResult
+from app.rag import RISK_POLICIES, LocalRAG, RAGResult
+from app.runlog import MemoryRunLog, RunLog, RunRecord, TokenUsage, note_json, note_usage, usage_scope
+from app.scheduler import AdmissionRejected, FairScheduler, ScheduledClient, current_tenant, request_context
+from app.server import Overloaded, PipelineService, RequestError, ServiceConfig
+from app.tracing import METRICS, Trace, TraceCollector, Tracer, activate, current, span, traced
+from app.transcript import Transcript
+from app.triage_cache import TriageCache
 
 
 # ---------------------------
@@ -51,13 +77,18 @@ class Threat(BaseModel):
 
 
 class TriageOut(BaseModel):
-    action: str = Field(..., description="ALLOW, ALLOW_WITH_GUARDRAILS, BLOCK")
+    action: Literal["ALLOW", "ALLOW_WITH_GUARDRAILS", "BLOCK"]
     risk_score: int = Field(..., ge=0, le=100)
     risk_rationale: str
     threats: List[Threat] = Field(default_factory=list)
     safe_response: str = ""
     recommended_controls: List[str] = Field(default_factory=list)
 
+    @field_validator("action", mode="before")
+    @classmethod
+    def _normalize_action(cls, v: Any) -> Any:
+        return v.strip().upper() if isinstance(v, str) else v
+
 
 # ---------------------------
 # Terminal color helpers (ANSI)
@@ -106,55 +137,40 @@ def color_for_risk(risk_score: int) -> str:
 
 
 # ---------------------------
-# Simple PDF exporter (wrap lines)
+# PDF exporter
 # ---------------------------
 
 def md_to_pdf(md_text: str, pdf_path: Path, title: str = "") -> None:
-    pdf_path.parent.mkdir(parents=True, exist_ok=True)
-    c = canvas.Canvas(str(pdf_path), pagesize=A4)
-    width, height = A4  # noqa: F841
-    margin = 50
-    y = height - margin
-
-    def draw_line(line: str, y_pos: float) -> float:
-        max_chars = 95
-        parts = [line[i:i + max_chars] for i in range(0, len(line), max_chars)] or [""]
-        for p in parts:
-            c.drawString(margin, y_pos, p)
-            y_pos -= 14
-            if y_pos < margin:
-                c.showPage()
-                y_pos = height - margin
-        return y_pos
-
-    if title.strip():
-        c.setFont("Helvetica-Bold", 14)
-        y = draw_line(title.strip(), y)
-        y -= 8
-        c.setFont("Helvetica", 11)
-
-    for raw in md_text.splitlines():
-        line = raw.replace("\t", "    ")
-        y = draw_line(line, y)
-
-    c.save()
+    # Single renderer for every artifact; see app/pdfgen.py (imported on first use: reportlab).
+    from app.pdfgen import markdown_to_pdf
+
+    markdown_to_pdf(md_text, pdf_path, title=title or None)
 
 
 # ---------------------------
 # JSON helpers
 # ---------------------------
 
-JSON_RE = re.compile(r"\{.*\}", re.DOTALL)
+def extract_json(text: str) -> str:
+    return extract_json_object(strip_code_fences(text.strip()))
 
 
-def extract_json(text: str) -> str:
-    text = text.strip()
-    text = re.sub(r"^```(?:json)?\s*", "", text, flags=re.IGNORECASE)
-    text = re.sub(r"\s*```$", "", text)
-    m = JSON_RE.search(text)
-    return m.group(0) if m else text
+def _budget_kwargs(budget: Optional[StageBudget]) -> Dict[str, Any]:
+    # Only bounded stages pass a per-call timeout; otherwise the client default applies.
+    if budget is None or not budget.bounded():
+        return {}
+    budget.check()
+    return {"timeout": budget.call_timeout()}
 
 
+def _check_stream_budget(budget: Optional[StageBudget]) -> None:
+    # A streamed call's timeout only bounds each read, so a model that keeps sending
+    # tokens is cut off here, between pieces.
+    if budget is not None and budget.bounded() and budget.expired():
+        raise DeadlineExceeded(budget.name, f"{budget.name}: budget exhausted while streaming")
+
+
+@traced("llm_json")
 def llm_json(
     llm: OllamaClient,
     model: str,
@@ -163,20 +179,100 @@ def llm_json(
     max_tokens: int,
     temperature: float = 0.2,
     repair_attempts: int = 2,
+    budget: Optional[StageBudget] = None,
+    repair_model: str = "",
+    out_cls: Optional[Type[BaseModel]] = None,
 ) -> Dict[str, Any]:
+    """
+    Chat -> JSON with a repair loop. With a stage budget, each call is capped to the time
+    left, and a repair round is skipped (DeadlineExceeded) when the previous call took
+    longer than what remains, so the caller can use its deterministic fallback instead.
+    Repair rounds use repair_model (default: model) and are counted as the "repair" stage.
+    With out_cls, an object that does not validate against it (e.g. output truncated and
+    closed by local repair) also goes to a repair round rather than back to the caller.
+    """
     last = ""
-    for _attempt in range(repair_attempts + 1):
-        resp = llm.chat(messages=messages, model=model, temperature=temperature, max_tokens=max_tokens)
-        last = resp.text
-        candidate = extract_json(resp.text)
-        try:
-            return json.loads(candidate)
-        except Exception:
-            messages = build_json_repair_messages(schema_text=schema_text, bad_output=resp.text)
-            continue
+    last_call_s = 0.0
+    calls = 0
+    try:
+        for attempt in range(repair_attempts + 1):
+            if attempt and budget is not None and budget.remaining() < last_call_s:
+                raise DeadlineExceeded(budget.name, f"{budget.name}: no time left for JSON repair")
+            started = time.monotonic()
+            call_model = (repair_model or model) if attempt else model
+            try:
+                resp = llm.chat(
+                    messages=messages,
+                    model=call_model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **_budget_kwargs(budget),
+                )
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if budget is not None and budget.bounded() and budget.expired():
+                    raise DeadlineExceeded(budget.name, f"{budget.name}: model call timed out") from e
+                raise
+            calls += 1
+            last_call_s = time.monotonic() - started
+            note_usage(resp.raw, "repair" if attempt else (budget.name if budget else ""), call_model, last_call_s * 1000)
+            last = resp.text
+            try:
+                # Fences, trailing commas, quotes and truncation are fixed locally; only
+                # output that cannot be repaired costs another model round-trip.
+                obj = repair_json(resp.text)
+                if out_cls is not None:
+                    out_cls.model_validate(obj)
+                note_json(valid=attempt == 0, repair_calls=attempt)
+                return obj
+            except (JSONRepairError, ValidationError):
+                messages = build_json_repair_messages(schema_text=schema_text, bad_output=resp.text)
+                continue
+    except DeadlineExceeded:
+        note_json(valid=False, repair_calls=max(0, calls - 1))
+        raise
+    note_json(valid=False, repair_calls=max(0, calls - 1))
     raise RuntimeError("Failed to produce valid JSON after repair attempts.\n\nLast output:\n" + last)
 
 
+def _classify(
+    llm: OllamaClient,
+    plan: ModelPlan,
+    stage: str,
+    messages: List[Dict[str, str]],
+    schema_text: str,
+    max_tokens: int,
+    budget: StageBudget,
+    out_cls: Any,
+) -> Tuple[Any, Optional[str]]:
+    """
+    Structured intent/triage call on the stage's model. If that is a smaller model and its
+    output cannot be parsed or validated, the call is repeated on the generation model.
+    Returns (validated output, escalation reason or None).
+    """
+    model = plan.for_stage(stage)
+    try:
+        data = llm_json(
+            llm, model, messages, schema_text, max_tokens, 0.0,
+            budget=budget, repair_model=plan.for_stage("repair"), out_cls=out_cls,
+        )
+        return out_cls(**data), None
+    except (RuntimeError, ValidationError):
+        if not plan.can_escalate(stage):
+            raise
+    data = llm_json(
+        llm, plan.generation, messages, schema_text, max_tokens, 0.0,
+        budget=budget, repair_model=plan.generation, out_cls=out_cls,
+    )
+    return out_cls(**data), "invalid_output"
+
+
+def _escalated(facts: Dict[str, Any], stage: str, reason: str) -> None:
+    METRICS.inc("escalations_total", stage=stage, reason=reason)
+    facts["escalated"] = ",".join(filter(None, [facts.get("escalated"), f"{stage}:{reason}"]))
+
+
 # ---------------------------
 # Output folder naming
 # ---------------------------
@@ -188,13 +284,29 @@ def slugify(s: str, max_len: int = 40) -> str:
     return s[:max_len] if len(s) > max_len else s
 
 
-def make_case_dir(out_dir: Path, user_prompt: str, intent: str, action: str) -> Path:
+def make_case_dir(
+    out_dir: Path,
+    user_prompt: str,
+    intent: str,
+    action: str,
+    archive: Optional[CaseArchive] = None,
+) -> Path:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
     slug = slugify(user_prompt)
     name = f"{ts}_{slug}_{intent}_{action}"
-    case_dir = out_dir / name
-    case_dir.mkdir(parents=True, exist_ok=True)
-    return case_dir
+    if archive is not None:
+        # Archived cases are never created on disk; the folder name is only the case id.
+        return out_dir / archive.reserve(name)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Concurrent workers can hit the same prompt within the same second; never share a folder.
+    n = 1
+    while True:
+        case_dir = out_dir / (name if n == 1 else f"{name}_{n}")
+        try:
+            case_dir.mkdir()
+            return case_dir
+        except FileExistsError:
+            n += 1
 
 
 # ---------------------------
@@ -210,6 +322,7 @@ def append_sources_if_missing(answer_text: str, sources: List[str]) -> str:
     return answer_text.rstrip() + "\n\nSources: " + ", ".join(uniq)
 
 
+@traced("artifacts.generate")
 def generate_assessment_artifacts(llm_answer: str) -> Dict[str, str]:
     text = llm_answer.strip()
 
@@ -255,29 +368,346 @@ def generate_assessment_artifacts(llm_answer: str) -> Dict[str, str]:
     }
 
 
+# Token cap per call when ASSESSMENT_GEN runs one call per artifact (--sectioned).
+SECTION_MAX_TOKENS = {"assessment_brief.md": 900, "rubric.md": 600, "submission_checklist.md": 600}
+
+
+def generate_sections(
+    llm: OllamaClient,
+    model: str,
+    sections: Dict[str, List[Dict[str, str]]],
+    temperature: float,
+    budget: Optional[StageBudget],
+    kb_texts: List[str],
+    on_token: Optional[Callable[[str], None]] = None,
+) -> Tuple[Dict[str, str], Optional[StreamAborted]]:
+    """
+    Generate each artifact of `sections` (file name -> messages) as its own concurrent,
+    streamed call, so the stage takes as long as the longest section.
+
+    Each call has its own StreamGuard; the first abort cancels the other calls and is
+    returned instead of the texts. on_token sees the sections in order, separated by a
+    blank line: the first streams live, later ones are held until those before finish.
+    Each section forwards only what its guard releases, and nothing more reaches on_token
+    once a call has been cancelled.
+    """
+    names = list(sections)
+    guards = {name: StreamGuard(kb_texts) for name in names}
+    cancel = threading.Event()
+    lock = threading.Lock()
+    held: Dict[str, List[str]] = {name: [] for name in names}
+    finished: set = set()
+    head = 0
+
+    def emit(name: str, piece: str) -> None:
+        with lock:
+            if cancel.is_set():
+                return
+            if names[head] == name:
+                on_token(piece)
+            else:
+                held[name].append(piece)
+
+    def finish(name: str) -> None:
+        nonlocal head
+        with lock:
+            finished.add(name)
+            if cancel.is_set():
+                return  # held text of a withheld answer is never flushed
+            while head < len(names) and names[head] in finished:
+                head += 1
+                if on_token and head < len(names):
+                    on_token("\n\n" + "".join(held[names[head]]))
+                    held[names[head]].clear()
+
+    def call(name: str) -> Tuple[Any, float]:
+        guard = guards[name]
+
+        def guarded(piece: str) -> None:
+            if cancel.is_set():
+                raise StreamAborted("cancelled", "another section was withheld", guard.chars)
+            _check_stream_budget(budget)
+            safe = guard.feed(piece)
+            if on_token and safe:
+                emit(name, safe)
+
+        started = time.monotonic()
+        try:
+            with span("generation.section", section=name):
+                resp = llm.chat(
+                    messages=sections[name],
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=SECTION_MAX_TOKENS[name],
+                    on_token=guarded,
+                    **_budget_kwargs(budget),
+                )
+            if not guard.chars:
+                guard.feed(resp.text)
+            elif on_token:
+                emit(name, guard.flush())
+        except BaseException:
+            cancel.set()
+            raise
+        finally:
+            finish(name)
+        return resp, (time.monotonic() - started) * 1000
+
+    # Each call runs in a copy of this context, so its spans and deadline stay with the request.
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="section") as pool:
+        futures = {name: pool.submit(contextvars.copy_context().run, call, name) for name in names}
+    texts: Dict[str, str] = {}
+    error: Optional[BaseException] = None
+    for name, fut in futures.items():
+        try:
+            resp, ms = fut.result()
+        except StreamAborted:
+            continue
+        except Exception as e:
+            error = error or e
+            continue
+        note_usage(resp.raw, "generation", model, ms)
+        title = ASSESSMENT_SECTIONS[name][0]
+        text = resp.text.strip()
+        texts[name] = text if text.startswith("#") else f"# {title}\n\n{text}"
+    aborted = next((g.aborted for g in guards.values() if g.aborted is not None), None)
+    if aborted is None and error is not None:
+        raise error
+    return texts, aborted
+
+
+# ---------------------------
+# Deterministic fallbacks (used when a stage runs out of latency budget)
+# ---------------------------
+
+DEFAULT_SAFE_RESPONSE = (
+    "Your request appears to be unsafe or attempts to bypass system controls. "
+    "I can help with a safer alternative (e.g., explaining concepts at a high level, "
+    "or providing policy-compliant guidance)."
+)
+
+TIMEOUT_RESPONSE = (
+    "The assistant could not complete this request within its time limit. "
+    "Please retry, or ask a shorter or more specific question."
+)
+
+ASSESSMENT_KEYWORDS = ("assessment", "rubric", "assignment", "capstone")
+
+
+def fallback_intent(user_prompt: str) -> IntentOut:
+    # Mirrors the routing rule in build_intent_messages; confidence 0 marks it as a fallback.
+    p = user_prompt.lower()
+    intent = "ASSESSMENT_GEN" if any(k in p for k in ASSESSMENT_KEYWORDS) else "GENERIC_QA"
+    return IntentOut(intent=intent, confidence=0.0)
+
+
+def fallback_triage(user_prompt: str) -> TriageOut:
+    # Without a model verdict we fail closed-ish: keyword hits BLOCK, everything else
+    # proceeds only with guardrails.
+    if simple_screen(user_prompt) or private_data_screen(user_prompt):
+        return TriageOut(
+            action="BLOCK",
+            risk_score=90,
+            risk_rationale="Model triage exceeded its latency budget; deterministic keyword screen flagged the prompt.",
+            safe_response=DEFAULT_SAFE_RESPONSE,
+            recommended_controls=["Deterministic keyword screen"],
+        )
+    return TriageOut(
+        action="ALLOW_WITH_GUARDRAILS",
+        risk_score=40,
+        risk_rationale="Model triage exceeded its latency budget; deterministic keyword screen found no risk markers.",
+        safe_response="I can help with this at a high level.",
+        recommended_controls=["Answer at high level only"],
+    )
+
+
 # ---------------------------
 # Main loop
 # ---------------------------
 
+def _export_pdf(
+    writer: ArtifactWriter,
+    case_dir: Path,
+    name: str,
+    md: str,
+    title: str,
+    deadline: Deadline,
+    budget: StageBudget,
+) -> None:
+    if budget.bounded() and budget.expired():
+        deadline.miss("export", "skipped_pdf", name)
+        return
+    with span("export.pdf", file=name):
+        writer.pdf(case_dir, name, md, title)
+
+
 def run_one(
     llm: OllamaClient,
     rag: Optional[LocalRAG],
     out_dir: Path,
-    model: str,
+    model: Union[str, ModelPlan],
+    user_prompt: str,
+    capstone: bool,
+    on_token: Optional[Callable[[str], None]] = None,
+    deadline_s: Optional[float] = None,
+    writer: Optional[ArtifactWriter] = None,
+    run_log: Optional[Union[RunLog, MemoryRunLog]] = None,
+    tracer: Optional[Tracer] = None,
+    triage_cache: Optional[TriageCache] = None,
+    sectioned: bool = False,
+) -> Tuple[Path, IntentOut, TriageOut, str]:
+    """
+    Run the guarded pipeline for one prompt and write its case folder.
+
+    deadline_s bounds the whole run; it is split into intent / retrieval / triage /
+    generation / export budgets (app/deadline.py). A stage that runs out degrades:
+    intent -> keyword routing, retrieval -> skipped, triage -> keyword screen,
+    generation -> triage safe_response, export -> PDFs skipped. Misses go to deadline.json.
+
+    Artifacts are handed to writer (inline by default); with a background ArtifactWriter
+    this returns as soon as the answer exists and manifest.json marks completion.
+
+    With a run_log, one RunRecord (stage timings, token counts, decision) is appended.
+    With a tracer, spans go to the case's trace.json and/or the tracer's collector, and
+    --profile runs are captured with cProfile (app/tracing.py).
+    With a triage_cache, a near-duplicate of a previously blocked prompt reuses that BLOCK
+    verdict instead of a triage call (app/triage_cache.py).
+
+    model is one model name for every stage, or a ModelPlan (app/cascade.py) that puts a
+    small model on intent / triage / JSON repair and escalates triage to the large one.
+
+    With sectioned, ASSESSMENT_GEN generates the brief, rubric and checklist as concurrent
+    calls sharing one prompt prefix, each written straight to its artifact.
+    """
+    plan = model if isinstance(model, ModelPlan) else ModelPlan.single(model)
+    started = time.monotonic()
+    deadline = Deadline(total_s=deadline_s if deadline_s else math.inf)
+    facts: Dict[str, Any] = {}
+    trace = Trace("run_one", plan.to_dict(), to_case=tracer.case_traces) if tracer and tracer.tracing else None
+    prof = tracer.start_profile() if tracer else None
+    case_name = ""
+    usage = TokenUsage()
+    try:
+        with usage_scope() as usage, activate(trace) if trace else nullcontext(), span("run_one"):
+            case_dir, intent_out, triage_out, answer_text = _run_pipeline(
+                llm, rag, out_dir, plan, user_prompt, capstone, on_token, deadline, writer or INLINE_WRITER, facts,
+                triage_cache, sectioned,
+            )
+        case_name = case_dir.name
+    except Exception as e:
+        METRICS.inc("requests_failed_total")
+        case_name = f"failed-{uuid.uuid4().hex[:8]}"
+        if run_log is not None:
+            # A failed run still gets its record, so the log counts every request.
+            run_log.write(
+                RunRecord(
+                    case_id=case_name,
+                    case_ref="",
+                    user_prompt=user_prompt,
+                    model=plan.generation,
+                    intent=facts.get("intent", ""),
+                    intent_confidence=0.0,
+                    action="ERROR",
+                    risk_score=facts.get("risk_score", 0),
+                    degraded=bool(deadline.misses),
+                    deadline_misses=[f"{m['stage']}:{m['fallback']}" for m in deadline.misses],
+                    client_id=current_tenant(),
+                    total_ms=round((time.monotonic() - started) * 1000, 1),
+                    stage_ms={k: round(v["elapsed_s"] * 1000, 1) for k, v in deadline.stages.items()},
+                    llm_calls=usage.calls,
+                    prompt_tokens=usage.prompt_tokens,
+                    completion_tokens=usage.completion_tokens,
+                    json_calls=usage.json_calls,
+                    json_valid=usage.json_valid,
+                    repair_calls=usage.repair_calls,
+                    stage_usage=usage.stages,
+                    escalated=facts.get("escalated"),
+                    error=f"{type(e).__name__}: {e}",
+                )
+            )
+        raise
+    finally:
+        if tracer is not None:
+            tracer.finish(trace, prof, case_name)
+
+    total_ms = round((time.monotonic() - started) * 1000, 1)
+    stage_ms = {k: round(v["elapsed_s"] * 1000, 1) for k, v in deadline.stages.items()}
+    METRICS.inc("requests_total", intent=facts["intent"], action=facts["action"])
+    METRICS.observe("request_ms", total_ms)
+    for stage, ms in stage_ms.items():
+        METRICS.observe("stage_ms", ms, stage=stage)
+    for m in deadline.misses:
+        METRICS.inc("deadline_misses_total", stage=m["stage"], fallback=m["fallback"])
+    METRICS.inc("llm_repair_calls_total", usage.repair_calls)
+    METRICS.inc("llm_prompt_tokens_total", usage.prompt_tokens)
+    METRICS.inc("llm_completion_tokens_total", usage.completion_tokens)
+    for stage, models in usage.stages.items():
+        for name, per in models.items():
+            METRICS.inc("stage_llm_calls_total", per["calls"], stage=stage, model=name)
+            METRICS.inc("stage_tokens_total", per["prompt_tokens"] + per["completion_tokens"], stage=stage, model=name)
+            METRICS.inc("stage_llm_ms_total", per["ms"], stage=stage, model=name)
+
+    if run_log is not None:
+        run_log.write(
+            RunRecord(
+                case_id=case_dir.name,
+                case_ref=case_dir.name if (writer and writer.archive) else str(case_dir),
+                user_prompt=user_prompt,
+                model=plan.generation,
+                intent=facts["intent"],
+                intent_confidence=intent_out.confidence,
+                action=facts["action"],
+                risk_score=triage_out.risk_score,
+                rag_confidence=facts.get("rag_confidence", "none"),
+                rag_top_score=facts.get("rag_top_score", 0.0),
+                degraded=bool(deadline.misses),
+                deadline_misses=[f"{m['stage']}:{m['fallback']}" for m in deadline.misses],
+                client_id=current_tenant(),
+                total_ms=total_ms,
+                stage_ms=stage_ms,
+                llm_calls=usage.calls,
+                prompt_tokens=usage.prompt_tokens,
+                completion_tokens=usage.completion_tokens,
+                json_calls=usage.json_calls,
+                json_valid=usage.json_valid,
+                repair_calls=usage.repair_calls,
+                sources=facts.get("sources", []),
+                cited=facts.get("cited"),
+                stream_abort=facts.get("stream_abort"),
+                triage_cache_similarity=facts.get("triage_cache_similarity"),
+                stage_usage=usage.stages,
+                escalated=facts.get("escalated"),
+            )
+        )
+    return case_dir, intent_out, triage_out, answer_text
+
+
+def _run_pipeline(
+    llm: OllamaClient,
+    rag: Optional[LocalRAG],
+    out_dir: Path,
+    plan: ModelPlan,
     user_prompt: str,
     capstone: bool,
+    on_token: Optional[Callable[[str], None]],
+    deadline: Deadline,
+    writer: ArtifactWriter,
+    facts: Dict[str, Any],
+    triage_cache: Optional[TriageCache] = None,
+    sectioned: bool = False,
 ) -> Tuple[Path, IntentOut, TriageOut, str]:
     # 1) Intent routing FIRST (so retrieval can be intent-aware)
     intent_schema = '{"intent":"GENERIC_QA|ASSESSMENT_GEN","confidence":0.0-1.0}'
-    intent_json = llm_json(
-        llm=llm,
-        model=model,
-        messages=build_intent_messages(user_prompt),
-        schema_text=intent_schema,
-        max_tokens=200,
-        temperature=0.0,
-    )
-    intent_out = IntentOut(**intent_json)
+    with deadline.stage("intent") as budget:
+        try:
+            intent_out, reason = _classify(
+                llm, plan, "intent", build_intent_messages(user_prompt), intent_schema, 200, budget, IntentOut
+            )
+            if reason:
+                _escalated(facts, "intent", reason)
+        except DeadlineExceeded as e:
+            deadline.miss("intent", "keyword_routing", str(e))
+            intent_out = fallback_intent(user_prompt)
     intent = intent_out.intent.strip().upper()
     if intent not in ("GENERIC_QA", "ASSESSMENT_GEN"):
         intent = "GENERIC_QA"
@@ -285,12 +715,15 @@ def run_one(
     # 2) Retrieval SECOND (intent-aware + confidence gating)
     rag_meta: RAGResult = RAGResult([], [], "low", 0.0)
     rag_snippets = ""
-    if rag:
-        rag_meta = rag.retrieve(user_prompt, k=3, intent=intent, return_meta=True)  # type: ignore
-        if rag_meta.confidence == "high":
-            rag_snippets = "\n\n".join(rag_meta.snippets)
-        else:
-            rag_snippets = ""
+    with deadline.stage("retrieval") as budget:
+        if rag and budget.bounded() and budget.expired():
+            deadline.miss("retrieval", "skipped")
+        elif rag:
+            rag_meta = rag.retrieve(user_prompt, k=3, intent=intent, return_meta=True)  # type: ignore
+            if rag_meta.confidence == "high":
+                rag_snippets = "\n\n".join(rag_meta.snippets)
+            else:
+                rag_snippets = ""
 
     # 3) Security triage (schema must match app/prompts.py triage schema)
     triage_schema = (
@@ -301,172 +734,729 @@ def run_one(
         '"safe_response":"...", '
         '"recommended_controls":["..."] }'
     )
-    triage_json = llm_json(
-        llm=llm,
-        model=model,
-        messages=build_triage_messages(user_prompt, rag_snippets=rag_snippets),
-        schema_text=triage_schema,
-        max_tokens=420,
-        temperature=0.0,
-    )
-    triage_out = TriageOut(**triage_json)
-    action = triage_out.action.strip().upper()
-    if action not in ("ALLOW", "ALLOW_WITH_GUARDRAILS", "BLOCK"):
-        action = "ALLOW"
-
-    case_dir = make_case_dir(out_dir, user_prompt, intent, action)
-
-    (case_dir / "intent.json").write_text(intent_out.model_dump_json(indent=2), encoding="utf-8")
-    (case_dir / "triage.json").write_text(triage_out.model_dump_json(indent=2), encoding="utf-8")
-    (case_dir / "retrieval.json").write_text(
-        json.dumps(
+    # Passages annotated clean at index time are not re-sent to triage; flagged ones are.
+    flagged = [snip for snip, flags in zip(rag_meta.snippets, rag_meta.risks) if flags] if rag_snippets else []
+    triage_ctx = "\n\n".join(flagged)
+    prescreened = len(rag_meta.snippets) - len(flagged) if rag_snippets else 0
+    # Only BLOCK verdicts are cached; a sampled hit still asks the model to measure false reuse.
+    cached = triage_cache.lookup(user_prompt) if triage_cache is not None else None
+    with deadline.stage("triage") as budget:
+        if cached is not None and not triage_cache.should_verify():  # type: ignore[union-attr]
+            triage_out = TriageOut(
+                risk_rationale=f"near-duplicate (similarity {cached.similarity}) of a previously blocked prompt",
+                **cached.verdict,
+            )
+            facts["triage_cache_similarity"] = cached.similarity
+        else:
+            triage_messages = build_triage_messages(user_prompt, rag_snippets=triage_ctx, prescreened=prescreened)
+            try:
+                triage_out, reason = _classify(llm, plan, "triage", triage_messages, triage_schema, 420, budget, TriageOut)
+                if reason is None:
+                    reason = plan.triage_escalation(triage_out.action, triage_out.risk_score)
+                    if reason is not None:
+                        try:
+                            triage_json = llm_json(
+                                llm, plan.generation, triage_messages, triage_schema, 420, 0.0,
+                                budget=budget, repair_model=plan.generation, out_cls=TriageOut,
+                            )
+                            triage_out = TriageOut(**triage_json)
+                        except DeadlineExceeded as e:
+                            deadline.miss("triage", "small_model_verdict", str(e))
+                        except (RuntimeError, ValidationError):
+                            # No usable verdict from the large model: the small model's stands.
+                            _escalated(facts, "triage", reason)
+                            reason = "escalation_failed"
+                if reason is not None:
+                    _escalated(facts, "triage", reason)
+                if cached is not None:
+                    triage_cache.verify(cached, triage_out.action)  # type: ignore[union-attr]
+                elif triage_cache is not None:
+                    triage_cache.store(user_prompt, triage_out.model_dump())
+            except DeadlineExceeded as e:
+                # Keyword-screen verdicts are not cached: they are not model decisions.
+                deadline.miss("triage", "keyword_screen", str(e))
+                triage_out = fallback_triage(user_prompt)
+    action = triage_out.action
+
+    case_dir = make_case_dir(out_dir, user_prompt, intent, action, archive=writer.archive)
+    try:
+        meta = {"intent": intent, "action": action, "risk_score": triage_out.risk_score}
+        facts.update(meta, rag_confidence=rag_meta.confidence if rag else "none", rag_top_score=rag_meta.top_score)
+        facts["sources"] = rag_meta.sources if rag_meta.confidence == "high" else []
+
+        writer.text(case_dir, "intent.json", intent_out.model_dump_json(indent=2))
+        writer.text(case_dir, "triage.json", triage_out.model_dump_json(indent=2))
+        if "triage_cache_similarity" in facts and cached is not None:
+            writer.json(case_dir, "triage_cache.json", {"similarity": cached.similarity, "matched_prompt_sha256": cached.prompt_sha256})
+        writer.json(
+            case_dir,
+            "retrieval.json",
             {
                 "confidence": rag_meta.confidence,
                 "top_score": rag_meta.top_score,
                 "sources": rag_meta.sources,
+                "risks": dict(zip(rag_meta.sources, rag_meta.risks)),
             },
-            indent=2,
-        ),
-        encoding="utf-8",
-    )
+        )
 
-    # 4) Enforcement
-    if action == "BLOCK":
-        safe = triage_out.safe_response.strip()
-        if not safe:
-            safe = (
-                "Your request appears to be unsafe or attempts to bypass system controls. "
-                "I can help with a safer alternative (e.g., explaining concepts at a high level, "
-                "or providing policy-compliant guidance)."
+        # 4) Enforcement
+        if action == "BLOCK":
+            safe = triage_out.safe_response.strip() or DEFAULT_SAFE_RESPONSE
+            safe_md = "# Request Blocked\n\n" + safe + "\n"
+            with deadline.stage("export") as budget:
+                writer.text(case_dir, "answer.md", safe_md)
+                _export_pdf(writer, case_dir, "answer.pdf", safe_md, "Blocked Request", deadline, budget)
+                writer.json(case_dir, "answer.json", {"blocked": True, "safe_response": safe})
+            _finish_case(writer, case_dir, deadline, meta)
+            return case_dir, intent_out, triage_out, safe_md
+
+        # 5) Generation
+        sections: Dict[str, List[Dict[str, str]]] = {}
+        if intent == "ASSESSMENT_GEN" and sectioned:
+            sections = {
+                name: build_assessment_section_messages(
+                    user_prompt,
+                    name,
+                    rag_snippets=rag_snippets,
+                    capstone_context=(CAPSTONE_CONTEXT if capstone else ""),
+                )
+                for name in ASSESSMENT_SECTIONS
+            }
+            temperature = 0.2
+        elif intent == "ASSESSMENT_GEN":
+            messages = build_assessment_messages(
+                user_prompt,
+                rag_snippets=rag_snippets,
+                capstone_context=(CAPSTONE_CONTEXT if capstone else ""),
             )
-        safe_md = "# Request Blocked\n\n" + safe + "\n"
-        (case_dir / "answer.md").write_text(safe_md, encoding="utf-8")
-        md_to_pdf(safe_md, case_dir / "answer.pdf", title="Blocked Request")
-        (case_dir / "answer.json").write_text(
-            json.dumps({"blocked": True, "safe_response": safe}, indent=2),
-            encoding="utf-8",
-        )
-        return case_dir, intent_out, triage_out, safe_md
-
-    # 5) Generation
-    if intent == "ASSESSMENT_GEN":
-        messages = build_assessment_messages(
-            user_prompt,
-            rag_snippets=rag_snippets,
-            capstone_context=(CAPSTONE_CONTEXT if capstone else ""),
-        )
-        max_tokens = 1800
-        temperature = 0.2
-    else:
-        messages = build_generic_qa_messages(user_prompt, rag_snippets=rag_snippets)
-        max_tokens = 650
-        temperature = 0.2
-
-    resp = llm.chat(messages=messages, model=model, temperature=temperature, max_tokens=max_tokens)
-    answer_text = resp.text.strip()
-    (case_dir / "answer.json").write_text(json.dumps({"text": answer_text}, indent=2), encoding="utf-8")
-
-    # 6) Postprocess
-    if intent == "GENERIC_QA":
-        answer_text = append_sources_if_missing(answer_text, rag_meta.sources if rag_meta.confidence == "high" else [])
-        md = "# Answer\n\n" + answer_text + "\n"
-        (case_dir / "answer.md").write_text(md, encoding="utf-8")
-        md_to_pdf(md, case_dir / "answer.pdf", title="Answer")
-
-    if intent == "ASSESSMENT_GEN":
-        artifacts = generate_assessment_artifacts(answer_text)
-        overall_md = "# Assessment Output\n\n" + answer_text + "\n"
-        (case_dir / "answer.md").write_text(overall_md, encoding="utf-8")
-        md_to_pdf(overall_md, case_dir / "answer.pdf", title="Assessment Output")
-
-        for fname, content in artifacts.items():
-            p = case_dir / fname
-            p.write_text(content.strip() + "\n", encoding="utf-8")
-            md_to_pdf(content, p.with_suffix(".pdf"), title=fname.replace("_", " ").replace(".md", ""))
+            max_tokens = 1800
+            temperature = 0.2
+        else:
+            messages = build_generic_qa_messages(user_prompt, rag_snippets=rag_snippets)
+            max_tokens = 650
+            temperature = 0.2
+
+        # Generation is always streamed through a guard (one per section when sectioned), so a
+        # leak stops the model mid-answer.
+        guard = StreamGuard(rag_meta.snippets if rag_snippets else ())
+        answer_text = ""
+        artifacts: Dict[str, str] = {}
+        aborted: Optional[StreamAborted] = None
+        degraded = False
+        with deadline.stage("generation") as budget:
+
+            def guarded(piece: str) -> None:
+                _check_stream_budget(budget)
+                safe = guard.feed(piece)
+                if on_token and safe:
+                    on_token(safe)
+
+            try:
+                if sections:
+                    artifacts, aborted = generate_sections(
+                        llm, plan.generation, sections, temperature, budget, rag_meta.snippets if rag_snippets else [], on_token
+                    )
+                    answer_text = "\n\n".join(artifacts.values())
+                else:
+                    gen_started = time.monotonic()
+                    resp = llm.chat(
+                        messages=messages,
+                        model=plan.generation,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        on_token=guarded,
+                        **_budget_kwargs(budget),
+                    )
+                    note_usage(resp.raw, "generation", plan.generation, (time.monotonic() - gen_started) * 1000)
+                    if not guard.chars:
+                        guard.feed(resp.text)  # a client that ignored on_token: check the whole answer
+                    elif on_token:
+                        on_token(guard.flush())  # the held-back tail; the stream ended without a match
+                    answer_text = resp.text.strip()
+            except StreamAborted:
+                pass  # handled below with the guard's record
+            except Exception as e:
+                if not isinstance(e, DeadlineExceeded) and not (budget.bounded() and budget.expired()):
+                    raise
+                deadline.miss("generation", "safe_response", str(e))
+                degraded = True
+
+        abort = aborted or guard.aborted
+        if abort is not None:
+            # The partial answer is discarded; the case is closed like a BLOCK, with an incident log.
+            METRICS.inc("stream_aborts_total", kind=abort.kind)
+            facts["stream_abort"] = abort.kind
+            safe = (triage_out.safe_response or "").strip() or DEFAULT_SAFE_RESPONSE
+            safe_md = "# Answer Withheld\n\n" + safe + "\n"
+            with deadline.stage("export") as budget:
+                writer.json(case_dir, "incident_log.json", {"action": action, "stage": "generation", **abort.to_dict()})
+                writer.json(case_dir, "answer.json", {"blocked": True, "stream_abort": abort.kind, "safe_response": safe})
+                writer.text(case_dir, "answer.md", safe_md)
+                _export_pdf(writer, case_dir, "answer.pdf", safe_md, "Answer Withheld", deadline, budget)
+            _finish_case(writer, case_dir, deadline, meta)
+            return case_dir, intent_out, triage_out, safe_md
+
+        if degraded:
+            # Generation ran out of budget: answer with the triage safe_response instead.
+            answer_text = (triage_out.safe_response or "").strip() or TIMEOUT_RESPONSE
+            md = "# Answer (time limit reached)\n\n" + answer_text + "\n"
+            with deadline.stage("export") as budget:
+                writer.json(case_dir, "answer.json", {"text": answer_text, "degraded": True})
+                writer.text(case_dir, "answer.md", md)
+                _export_pdf(writer, case_dir, "answer.pdf", md, "Answer", deadline, budget)
+            _finish_case(writer, case_dir, deadline, meta)
+            return case_dir, intent_out, triage_out, answer_text
+
+        writer.json(case_dir, "answer.json", {"text": answer_text})
+        if facts["sources"]:
+            # Measured on the model's own answer, before "Sources:" is appended for it.
+            facts["cited"] = any(src in answer_text for src in facts["sources"])
+
+        # 6) Postprocess + export
+        with deadline.stage("export") as budget:
+            if intent == "GENERIC_QA":
+                answer_text = append_sources_if_missing(answer_text, rag_meta.sources if rag_meta.confidence == "high" else [])
+                md = "# Answer\n\n" + answer_text + "\n"
+                writer.text(case_dir, "answer.md", md)
+                _export_pdf(writer, case_dir, "answer.pdf", md, "Answer", deadline, budget)
+
+            if intent == "ASSESSMENT_GEN":
+                if not sections:
+                    artifacts = generate_assessment_artifacts(answer_text)
+                overall_md = "# Assessment Output\n\n" + answer_text + "\n"
+                writer.text(case_dir, "answer.md", overall_md)
+                _export_pdf(writer, case_dir, "answer.pdf", overall_md, "Assessment Output", deadline, budget)
+
+                for fname, content in artifacts.items():
+                    writer.text(case_dir, fname, content.strip() + "\n")
+                    title = fname.replace("_", " ").replace(".md", "")
+                    _export_pdf(writer, case_dir, fname.replace(".md", ".pdf"), content, title, deadline, budget)
+
+        _finish_case(writer, case_dir, deadline, meta)
+        return case_dir, intent_out, triage_out, answer_text
+    except BaseException:
+        writer.discard_case(case_dir)
+        raise
+
+
+def _finish_case(writer: ArtifactWriter, case_dir: Path, deadline: Deadline, meta: Dict[str, Any]) -> None:
+    if deadline.bounded():
+        writer.json(case_dir, "deadline.json", deadline.to_dict())
+    trace = current()
+    if trace is not None and trace.to_case:
+        writer.json(case_dir, "trace.json", trace.to_dict())
+    writer.close_case(case_dir, meta=meta)
+
+
+def case_summary(case_dir: Path, intent_out: IntentOut, triage_out: TriageOut) -> Dict[str, Any]:
+    return {
+        "intent": intent_out.intent,
+        "action": triage_out.action,
+        "risk_score": triage_out.risk_score,
+        "case_dir": str(case_dir),
+    }
+
+
+def run_batch_mode(
+    llm: OllamaClient,
+    rag: Optional[LocalRAG],
+    out_dir: Path,
+    model: Union[str, ModelPlan],
+    capstone: bool,
+    input_path: Path,
+    results_path: Path,
+    workers: int,
+    resume: bool,
+    deadline_s: Optional[float] = None,
+    writer: Optional[ArtifactWriter] = None,
+    run_log: Optional[RunLog] = None,
+    tracer: Optional[Tracer] = None,
+    triage_cache: Optional[TriageCache] = None,
+    sectioned: bool = False,
+) -> None:
+    def handle(case: Dict[str, Any]) -> Dict[str, Any]:
+        with request_context(tenant=case.get("client_id"), deadline_s=case.get("deadline_s") or deadline_s):
+            case_dir, intent_out, triage_out, _answer = run_one(
+                llm=llm,
+                rag=rag,
+                out_dir=out_dir,
+                model=model,
+                user_prompt=case["user_prompt"],
+                capstone=capstone,
+                deadline_s=case.get("deadline_s") or deadline_s,
+                writer=writer,
+                run_log=run_log,
+                tracer=tracer,
+                triage_cache=triage_cache,
+                sectioned=sectioned,
+            )
+        return case_summary(case_dir, intent_out, triage_out)
+
+    def progress(row: Dict[str, Any]) -> None:
+        if row.get("error"):
+            status = colorize("ERROR", ANSI_RED)
+        else:
+            status = colorize(str(row.get("action")), color_for_action(str(row.get("action"))))
+        print(f"[{row['case_id']}] {status} ({row['latency_ms']:.0f} ms)")
+
+    print(f"Batch: {input_path} -> {results_path} ({workers} workers)")
+    report = run_batch(
+        load_cases(input_path),
+        handle,
+        out_path=results_path,
+        workers=workers,
+        resume=resume,
+        on_result=progress,
+    )
+    if writer is not None:
+        writer.flush()
+    summary = report.summary()
+    lat = summary["latency_ms"]
+    print(
+        f"\nDone: {summary['completed']} ok, {summary['failed']} failed, {summary['skipped']} skipped (checkpoint)"
+        f" in {summary['elapsed_s']:.1f}s"
+    )
+    print(f"Throughput: {summary['throughput_per_s']:.2f} cases/s")
+    print(f"Latency ms: p50={lat['p50']:.0f} p90={lat['p90']:.0f} p99={lat['p99']:.0f} max={lat['max']:.0f}")
+    if writer is not None and writer.pdf_cache is not None:
+        pc = writer.pdf_cache.stats()
+        print(f"PDF cache: {pc['hits']} hits / {pc['misses']} misses (hit rate {pc['hit_rate']:.0%}), {pc['evictions']} evicted")
+    print_stage_split()
+    if triage_cache is not None:
+        tc = triage_cache.stats()
+        print(f"Triage cache: {tc['hits']} BLOCK reuses / {tc['lookups']} lookups, {tc['false_reuse']} false reuses of {tc['verified']} verified")
+    repair = REPAIR_STATS.snapshot()
+    print(f"JSON: {repair['parsed']} clean, {repair['repaired']} repaired locally (model calls saved), {repair['failed']} sent to LLM repair")
+
+
+def print_stage_split() -> None:
+    """Calls, tokens and model time per stage and model, from this process's counters."""
+    calls = {(l["stage"], l["model"]): v for l, v in METRICS.series("stage_llm_calls_total")}
+    tokens = {(l["stage"], l["model"]): v for l, v in METRICS.series("stage_tokens_total")}
+    ms = {(l["stage"], l["model"]): v for l, v in METRICS.series("stage_llm_ms_total")}
+    if not calls:
+        return
+    escalations = sum(v for _l, v in METRICS.series("escalations_total"))
+    print("Model split:" + (f" ({escalations:g} escalations)" if escalations else ""))
+    for stage, model in sorted(calls, key=lambda k: (STAGE_ORDER.index(k[0]) if k[0] in STAGE_ORDER else 99, k[1])):
+        key = (stage, model)
+        n = calls[key]
+        print(f"  {stage:<10} {model:<20} {n:>6g} calls {tokens.get(key, 0):>9g} tokens {ms.get(key, 0) / n:>8.0f} ms/call")
+
+
+def make_runner(
+    llm: OllamaClient,
+    rag: Optional[LocalRAG],
+    out_dir: Path,
+    model: Union[str, ModelPlan],
+    capstone: bool,
+    deadline_s: Optional[float] = None,
+    writer: Optional[ArtifactWriter] = None,
+    run_log: Optional[RunLog] = None,
+    tracer: Optional[Tracer] = None,
+    triage_cache: Optional[TriageCache] = None,
+    sectioned: bool = False,
+) -> Callable[[Dict[str, Any], Optional[Callable[[str], None]]], Dict[str, Any]]:
+    """Request body (user_prompt, client_id, deadline_s, capstone, sectioned) -> run_one summary; shared by --serve and --warm."""
+
+    def runner(body: Dict[str, Any], on_token: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        user_prompt = str(body.get("user_prompt") or body.get("prompt") or "").strip()
+        if not user_prompt:
+            raise RequestError("'user_prompt' is required")
+        request_deadline = body.get("deadline_s", deadline_s)
+        if request_deadline is not None and (not isinstance(request_deadline, (int, float)) or request_deadline <= 0):
+            raise RequestError("'deadline_s' must be a positive number of seconds")
+        try:
+            with request_context(tenant=body.get("client_id"), deadline_s=request_deadline):
+                case_dir, intent_out, triage_out, answer_text = run_one(
+                    llm=llm,
+                    rag=rag,
+                    out_dir=out_dir,
+                    model=model,
+                    user_prompt=user_prompt,
+                    capstone=bool(body.get("capstone", capstone)),
+                    on_token=on_token,
+                    deadline_s=request_deadline,
+                    writer=writer,
+                    run_log=run_log,
+                    tracer=tracer,
+                    triage_cache=triage_cache,
+                    sectioned=bool(body.get("sectioned", sectioned)),
+                )
+        except AdmissionRejected as e:
+            raise Overloaded(str(e)) from e
+        out = case_summary(case_dir, intent_out, triage_out)
+        out["confidence"] = intent_out.confidence
+        out["answer"] = answer_text
+        # Artifacts may still be rendering; manifest.json flips to "complete" when they exist.
+        out["artifacts"] = (writer or INLINE_WRITER).artifacts(case_dir)
+        if writer is not None and writer.archive is not None:
+            out["case_id"] = case_dir.name  # export with: python case_archive.py export <case_id>
+        else:
+            out["manifest"] = str(case_dir / MANIFEST_NAME)
+        return out
+
+    return runner
+
+
+def run_serve_mode(
+    llm: OllamaClient,
+    rag: Optional[LocalRAG],
+    out_dir: Path,
+    model: Union[str, ModelPlan],
+    capstone: bool,
+    config: ServiceConfig,
+    deadline_s: Optional[float] = None,
+    writer: Optional[ArtifactWriter] = None,
+    run_log: Optional[RunLog] = None,
+    tracer: Optional[Tracer] = None,
+    triage_cache: Optional[TriageCache] = None,
+    sectioned: bool = False,
+) -> None:
+    runner = make_runner(llm, rag, out_dir, model, capstone, deadline_s, writer, run_log, tracer, triage_cache, sectioned)
+
+    def extra_stats() -> Dict[str, Any]:
+        cache = writer.pdf_cache if writer is not None else None
+        out = {"pdf_cache": cache.stats()} if cache is not None else {}
+        if triage_cache is not None:
+            out["triage_cache"] = triage_cache.stats()
+        return out
+
+    service = PipelineService(runner, config, extra_stats=extra_stats, metrics=METRICS.render)
+    print(f"Serving guarded pipeline on {service.address} (POST /run, POST /stream, GET /health, GET /metrics)")
+    service.serve_forever()
+    print("Server stopped.")
+
+
+def warm_up() -> None:
+    """Load what requests otherwise import lazily (HTTP client, PDF renderer) and render once."""
+    import requests  # noqa: F401  (app/llm_client.py imports it on the first call)
+
+    from app.pdfgen import render_pdf_bytes
+
+    render_pdf_bytes("# Warm-up\n\nok\n", title="warm-up")
 
-    return case_dir, intent_out, triage_out, answer_text
+
+def run_warm_mode(
+    llm: OllamaClient,
+    rag: Optional[LocalRAG],
+    out_dir: Path,
+    model: Union[str, ModelPlan],
+    capstone: bool,
+    socket_path: Path,
+    open_outputs: Callable[[], Tuple[ArtifactWriter, Optional[RunLog]]],
+    workers: int = 2,
+    max_requests: int = 0,
+    deadline_s: Optional[float] = None,
+    tracer: Optional[Tracer] = None,
+    triage_cache: Optional[TriageCache] = None,
+    sectioned: bool = False,
+) -> None:
+    """
+    Pre-forked warm workers on a unix socket (app/prefork.py). This process has already
+    loaded the index and model config; after warm_up() it forks `workers` children that
+    share them. Each child opens its own artifact writer and run log (threads and locks
+    do not survive a fork) and serves requests from `python -m app.prefork PROMPT`.
+    A triage cache is per worker: BLOCK verdicts are not shared between children.
+    """
+    warm_up()
+
+    def setup() -> Tuple[Callable[..., Dict[str, Any]], Callable[[], None]]:
+        writer, run_log = open_outputs()
+        runner = make_runner(llm, rag, out_dir, model, capstone, deadline_s, writer, run_log, tracer, triage_cache, sectioned)
+
+        def close() -> None:
+            writer.shutdown()
+            if run_log is not None:
+                run_log.close()
+
+        return runner, close
+
+    print(f"Warm workers ({workers}) on {socket_path}: python -m app.prefork --socket {socket_path} \"PROMPT\"")
+    try:
+        PreforkServer(socket_path, setup, workers=workers, max_requests=max_requests).serve_forever()
+    except RuntimeError as e:  # workers keep failing at startup; their tracebacks are above
+        raise SystemExit(f"error: {e}")
+    print("Workers stopped.")
+
+
+def _parse_pairs(items: List[str], cast: Callable[[str], Any]) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    for item in items:
+        key, sep, value = item.rpartition("=")
+        if not sep or not key:
+            raise SystemExit(f"Expected NAME=VALUE, got {item!r}")
+        out[key] = cast(value)
+    return out
 
 
 def main() -> None:
     ap = argparse.ArgumentParser(description="Secure Guarded LLM Demo")
     ap.add_argument("--interactive", action="store_true", help="Interactive mode")
+    ap.add_argument("--batch", type=str, default="", help="Run every prompt in a JSONL file (rows: case_id, user_prompt)")
+    ap.add_argument("--batch-out", type=str, default="", help="Results JSONL for --batch (default: <out>/batch_results.jsonl)")
+    ap.add_argument("--workers", type=int, default=4, help="Worker threads for --batch")
+    ap.add_argument("--no-resume", action="store_true", help="Ignore the --batch checkpoint and rerun every case")
+    ap.add_argument("--serve", action="store_true", help="Run as a long-lived HTTP service")
+    ap.add_argument("--warm", type=str, default="", metavar="SOCKET", help="Serve from pre-forked warm workers on a unix socket")
+    ap.add_argument("--warm-workers", type=int, default=2, help="Worker processes for --warm")
+    ap.add_argument("--warm-max-requests", type=int, default=0, help="Recycle a --warm worker after N requests (0: never)")
+    ap.add_argument("--host", type=str, default="127.0.0.1", help="Bind address for --serve")
+    ap.add_argument("--port", type=int, default=8080, help="Port for --serve")
+    ap.add_argument("--max-concurrency", type=int, default=4, help="Concurrent pipeline runs for --serve")
+    ap.add_argument("--max-queue", type=int, default=16, help="Waiting requests before --serve answers 429")
+    ap.add_argument("--sync-artifacts", action="store_true", help="Write artifacts/PDFs before returning each answer")
+    ap.add_argument("--artifact-workers", type=int, default=2, help="Background artifact/PDF workers")
+    ap.add_argument("--artifact-processes", action="store_true", help="Render artifacts in worker processes instead of threads")
+    ap.add_argument("--pdf-cache", type=str, default="", help="PDF cache directory (default: <out>/.pdf_cache)")
+    ap.add_argument("--pdf-cache-mb", type=int, default=256, help="Size bound for the PDF cache")
+    ap.add_argument("--no-pdf-cache", action="store_true", help="Always render PDFs from scratch")
+    ap.add_argument("--archive", action="store_true", help="Append cases to segment files in <out>/archive instead of one folder each")
+    ap.add_argument("--segment-mb", type=int, default=64, help="Archive segment size before rolling over")
+    ap.add_argument("--run-log", type=str, default="out/run_log.jsonl", help="Structured run log (rotated + gzipped)")
+    ap.add_argument("--no-run-log", action="store_true", help="Do not write the run log")
+    ap.add_argument("--record", type=str, default="", metavar="FILE", help="Store every LLM request/response in a transcript (.jsonl or .jsonl.gz)")
+    ap.add_argument("--replay", type=str, default="", metavar="FILE", help="Serve LLM responses from a recorded transcript, no network")
+    ap.add_argument("--trace", action="store_true", help="Write span timings to trace.json in every case")
+    ap.add_argument("--trace-collector", type=str, default="", metavar="FILE", help="Also append every trace to this JSONL file")
+    ap.add_argument("--profile", action="store_true", help="cProfile each request into <out>/profiles")
+    ap.add_argument("--triage-cache", action="store_true", help="Reuse BLOCK verdicts for near-duplicate prompts")
+    ap.add_argument("--triage-cache-similarity", type=float, default=0.6, help="Minimum estimated similarity for reuse")
+    ap.add_argument("--triage-cache-size", type=int, default=10_000, help="Cached BLOCK verdicts kept")
+    ap.add_argument("--triage-cache-ttl", type=float, default=24 * 3600, help="Seconds a cached verdict stays valid")
+    ap.add_argument("--triage-cache-verify", type=float, default=0.05, help="Share of cache hits re-checked by the model")
+    ap.add_argument("--deadline", type=float, default=None, help="Overall seconds per request, split into stage budgets")
+    ap.add_argument("--scheduler", action="store_true", help="Fair-queue LLM calls across clients (batch/serve)")
+    ap.add_argument("--backend-cap", action="append", default=[], metavar="MODEL=N", help="Concurrent calls per model")
+    ap.add_argument("--tenant-weight", action="append", default=[], metavar="CLIENT=W", help="Fair-queuing weight per client_id")
     ap.add_argument("--rag", type=str, default="", help="Knowledge base directory (markdown files)")
+    ap.add_argument("--rag-index", action="store_true", help="Retrieve from <rag>/.index (synced at start, reloaded live)")
+    ap.add_argument("--rag-risk", choices=RISK_POLICIES, default="flag", help="Handling of passages flagged at index time")
     ap.add_argument("--out", type=str, default="out", help="Output directory")
-    ap.add_argument("--model", type=str, default="llama3.1", help="Ollama model name")
+    ap.add_argument("--model", type=str, default="llama3.1", help="Ollama model name (generation, and any stage not set below)")
+    ap.add_argument("--small-model", type=str, default="", help="Model for intent, triage and JSON repair (escalates to --model)")
+    ap.add_argument("--intent-model", type=str, default="", help="Override the intent model")
+    ap.add_argument("--triage-model", type=str, default="", help="Override the triage model")
+    ap.add_argument("--repair-model", type=str, default="", help="Override the JSON-repair model")
+    ap.add_argument("--escalate-band", type=str, default="25,80", metavar="LO,HI", help="Triage risk scores re-checked by --model")
     ap.add_argument("--capstone", action="store_true", help="Enable capstone requirements (ASSESSMENT_GEN only)")
+    ap.add_argument("--sectioned", action="store_true", help="ASSESSMENT_GEN: one concurrent call per artifact")
     args = ap.parse_args()
+    if args.record and args.replay:
+        ap.error("--record and --replay are mutually exclusive")
+    if args.warm and (args.archive or args.record):
+        ap.error("--warm workers cannot share an --archive or a --record transcript")
+    try:
+        plan = ModelPlan.from_args(
+            args.model, args.small_model, args.intent_model, args.triage_model, args.repair_model, args.escalate_band
+        )
+    except ValueError as e:
+        ap.error(str(e))
 
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    llm = OllamaClient()
+    transcript: Optional[Transcript] = None
+    if args.record or args.replay:
+        transcript = Transcript(Path(args.replay or args.record), "replay" if args.replay else "record")
+    llm: Any = OllamaClient(transcript=transcript)
+    if args.scheduler:
+        llm = ScheduledClient(
+            llm,
+            FairScheduler(
+                backend_caps=_parse_pairs(args.backend_cap, int),
+                tenant_weights=_parse_pairs(args.tenant_weight, float),
+            ),
+        )
 
     rag: Optional[LocalRAG] = None
     if args.rag:
         kb = Path(args.rag)
-        if kb.exists() and kb.is_dir():
-            rag = LocalRAG(kb_dir=kb, max_chars=2000)
-
-    print("Secure Guarded LLM Demo")
-    print(colorize("Type 'exit' to quit.\n", ANSI_DIM))
-
-    if args.interactive:
-        while True:
-            try:
-                user_prompt = input("> ").strip()
-            except (EOFError, KeyboardInterrupt):
-                print("\nBye.")
-                break
-            if not user_prompt:
-                continue
-            if user_prompt.lower() in ("exit", "quit"):
-                break
+        if kb.exists() and kb.is_dir() and args.rag_index:
+            print(f"[rag] index {Index(kb / INDEX_DIR).sync_dir(kb)}")
+            rag = LocalRAG.from_index(kb / INDEX_DIR, max_chars=2000, risk_policy=args.rag_risk)
+        elif kb.exists() and kb.is_dir():
+            rag = LocalRAG(kb_dir=kb, max_chars=2000, risk_policy=args.rag_risk)
+
+    def open_outputs() -> Tuple[ArtifactWriter, Optional[RunLog]]:
+        pdf_cache: Optional[PDFCache] = None
+        if not args.no_pdf_cache:
+            pdf_cache = PDFCache(
+                Path(args.pdf_cache) if args.pdf_cache else out_dir / ".pdf_cache",
+                max_bytes=args.pdf_cache_mb * 1024 * 1024,
+            )
+        writer = ArtifactWriter(
+            workers=args.artifact_workers,
+            background=not args.sync_artifacts,
+            processes=args.artifact_processes,
+            pdf_cache=pdf_cache,
+            archive=CaseArchive(out_dir / "archive", segment_bytes=args.segment_mb * 1024 * 1024) if args.archive else None,
+        )
+        return writer, None if args.no_run_log else RunLog(Path(args.run_log))
+
+    tracer: Optional[Tracer] = None
+    if args.trace or args.trace_collector or args.profile:
+        tracer = Tracer(
+            case_traces=args.trace,
+            collector=TraceCollector(Path(args.trace_collector)) if args.trace_collector else None,
+            profile_dir=out_dir / "profiles" if args.profile else None,
+        )
+    triage_cache: Optional[TriageCache] = None
+    if args.triage_cache:
+        triage_cache = TriageCache(
+            threshold=args.triage_cache_similarity,
+            max_entries=args.triage_cache_size,
+            ttl_s=args.triage_cache_ttl,
+            verify_rate=args.triage_cache_verify,
+        )
 
-            try:
-                case_dir, intent_out, triage_out, answer_text = run_one(
-                    llm=llm,
-                    rag=rag,
-                    out_dir=out_dir,
-                    model=args.model,
-                    user_prompt=user_prompt,
-                    capstone=args.capstone,
-                )
+    if args.warm:
+        try:
+            run_warm_mode(
+                llm=llm,
+                rag=rag,
+                out_dir=out_dir,
+                model=plan,
+                capstone=args.capstone,
+                socket_path=Path(args.warm),
+                open_outputs=open_outputs,
+                workers=args.warm_workers,
+                max_requests=args.warm_max_requests,
+                deadline_s=args.deadline,
+                tracer=tracer,
+                triage_cache=triage_cache,
+                sectioned=args.sectioned,
+            )
+        finally:
+            if transcript is not None:
+                transcript.close()
+        return
+
+    writer, run_log = open_outputs()
+    try:
+        if args.serve:
+            run_serve_mode(
+                llm=llm,
+                rag=rag,
+                out_dir=out_dir,
+                model=plan,
+                capstone=args.capstone,
+                config=ServiceConfig(
+                    host=args.host,
+                    port=args.port,
+                    max_concurrency=args.max_concurrency,
+                    max_queue=args.max_queue,
+                ),
+                deadline_s=args.deadline,
+                writer=writer,
+                run_log=run_log,
+                tracer=tracer,
+                triage_cache=triage_cache,
+                sectioned=args.sectioned,
+            )
+            return
+
+        if args.batch:
+            run_batch_mode(
+                llm=llm,
+                rag=rag,
+                out_dir=out_dir,
+                model=plan,
+                capstone=args.capstone,
+                input_path=Path(args.batch),
+                results_path=Path(args.batch_out) if args.batch_out else out_dir / "batch_results.jsonl",
+                workers=args.workers,
+                resume=not args.no_resume,
+                deadline_s=args.deadline,
+                writer=writer,
+                run_log=run_log,
+                tracer=tracer,
+                triage_cache=triage_cache,
+                sectioned=args.sectioned,
+            )
+            return
 
-                enquiry_label = "Enquiry Type"
-                decision_color = color_for_action(triage_out.action)
-                risk_color = color_for_risk(triage_out.risk_score)
+        print("Secure Guarded LLM Demo")
+        print(colorize("Type 'exit' to quit.\n", ANSI_DIM))
 
-                print(f"\n{enquiry_label}: {intent_out.intent} (conf={intent_out.confidence:.2f})")
-                print(
-                    "Decision: "
-                    + colorize(triage_out.action, decision_color)
-                    + " | Risk: "
-                    + colorize(str(triage_out.risk_score), risk_color)
-                )
+        if args.interactive:
+            while True:
+                try:
+                    user_prompt = input("> ").strip()
+                except (EOFError, KeyboardInterrupt):
+                    print("\nBye.")
+                    break
+                if not user_prompt:
+                    continue
+                if user_prompt.lower() in ("exit", "quit"):
+                    break
 
-                # Retrieval debug
                 try:
-                    rj = json.loads((case_dir / "retrieval.json").read_text(encoding="utf-8"))
-                    retrieval_line = f"Retrieval: {rj.get('confidence')} | sources={rj.get('sources')}"
-                    print(colorize(retrieval_line, ANSI_DIM))
-                except Exception:
-                    pass
-
-                print()
-                preview = answer_text.strip().splitlines()
-                preview_text = "\n".join(preview[:8]).strip()
-                if preview_text:
-                    print(preview_text)
-                print(f"\nArtifacts saved in:\n  {case_dir}\n")
-
-            except ValidationError as ve:
-                print("\nThe model returned JSON but it did not match schema.")
-                print(str(ve))
-            except Exception as e:
-                print("\nThe assistant could not produce a valid output. Please retry or simplify the request.")
-                print(f"Error: {e}\n")
-    else:
-        print("Run with --interactive for interactive demo.")
+                    case_dir, intent_out, triage_out, answer_text = run_one(
+                        llm=llm,
+                        rag=rag,
+                        out_dir=out_dir,
+                        model=plan,
+                        user_prompt=user_prompt,
+                        capstone=args.capstone,
+                        deadline_s=args.deadline,
+                        writer=writer,
+                        run_log=run_log,
+                        tracer=tracer,
+                        triage_cache=triage_cache,
+                        sectioned=args.sectioned,
+                    )
+
+                    enquiry_label = "Enquiry Type"
+                    decision_color = color_for_action(triage_out.action)
+                    risk_color = color_for_risk(triage_out.risk_score)
+
+                    print(f"\n{enquiry_label}: {intent_out.intent} (conf={intent_out.confidence:.2f})")
+                    print(
+                        "Decision: "
+                        + colorize(triage_out.action, decision_color)
+                        + " | Risk: "
+                        + colorize(str(triage_out.risk_score), risk_color)
+                    )
+
+                    # Retrieval debug
+                    try:
+                        writer.wait_artifact(case_dir, "retrieval.json", timeout=2.0)
+                        rj = json.loads(writer.read_text(case_dir, "retrieval.json"))
+                        retrieval_line = f"Retrieval: {rj.get('confidence')} | sources={rj.get('sources')}"
+                        print(colorize(retrieval_line, ANSI_DIM))
+                    except Exception:
+                        pass
+
+                    print()
+                    preview = answer_text.strip().splitlines()
+                    preview_text = "\n".join(preview[:8]).strip()
+                    if preview_text:
+                        print(preview_text)
+                    print(f"\nArtifacts saved in:\n  {case_dir}\n")
+
+                except ValidationError as ve:
+                    print("\nThe model returned JSON but it did not match schema.")
+                    print(str(ve))
+                except Exception as e:
+                    print("\nThe assistant could not produce a valid output. Please retry or simplify the request.")
+                    print(f"Error: {e}\n")
+        else:
+            print("Run with --interactive for interactive demo, or --batch <file.jsonl>.")
+
+    finally:
+        writer.shutdown()  # waits for queued artifacts and finalises their manifests
+        if writer.archive is not None:
+            writer.archive.close()
+        if run_log is not None:
+            run_log.close()
+        if transcript is not None:
+            transcript.close()
+            ts = transcript.stats()
+            if transcript.mode == "replay":
+                print(f"Transcript {transcript.path}: {ts['hits']} replayed, {ts['misses']} missing")
+            else:
+                print(f"Transcript {transcript.path}: {ts['recorded']} responses recorded")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,15 @@
 import argparse
 import re
+import sys
+import time
 from pathlib import Path
+from typing import List
 from urllib.parse import urlparse
 
-import requests
+from app.dedup import open_index
+from app.fetch import FetchCache, Fetcher
+from app.html2md import convert_stream, iter_chunks
+from app.index import INDEX_DIR, Index
 
 
 def slugify(s: str, max_len: int = 60) -> str:
@@ -11,40 +17,106 @@ def slugify(s: str, max_len: int = 60) -> str:
     return s[:max_len] if s else "doc"
 
 
+def base_name(url: str) -> str:
+    parsed = urlparse(url)
+    host = parsed.netloc.replace(":", "_")
+    path = parsed.path.strip("/").replace("/", "_")
+    return slugify(f"{host}_{path}") or "page"
+
+
+def write_page(out_dir: Path, url: str, html: str) -> Path:
+    base = base_name(url)
+    # Save raw HTML for traceability
+    (out_dir / f"{base}.html").write_text(html, encoding="utf-8")
+    # Full document as markdown (headings kept for chunking), converted in one streaming pass.
+    md_path = out_dir / f"{base}.md"
+    with md_path.open("w", encoding="utf-8") as f:
+        f.write(f"# Source: {url}\n\n")
+        convert_stream(iter_chunks(html), f.write)
+        f.write("\n")
+    return md_path
+
+
+def read_url_list(path: Path) -> List[str]:
+    urls = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            urls.append(line)
+    return urls
+
+
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("url", help="URL to ingest into knowledge base")
+    ap.add_argument("url", nargs="?", help="URL to ingest into knowledge base")
+    ap.add_argument("--urls", default="", help="File with one URL per line (bulk mode; '#' comments)")
     ap.add_argument("--out", default="knowledge_base", help="KB folder")
     ap.add_argument("--timeout", type=int, default=20)
+    ap.add_argument("--workers", type=int, default=16, help="Concurrent fetches")
+    ap.add_argument("--per-host", type=int, default=4, help="Concurrent fetches per host")
+    ap.add_argument("--cache", default="", help="Fetch cache (default: <out>/.fetch_cache.sqlite)")
+    ap.add_argument("--force", action="store_true", help="Ignore stored ETag/Last-Modified and re-download")
+    ap.add_argument("--dup-threshold", type=float, default=0.8, help="Near-duplicate similarity (estimated Jaccard)")
+    ap.add_argument("--keep-duplicates", action="store_true", help="Ingest pages even if they duplicate a KB document")
+    ap.add_argument("--index", default="", help=f"Retrieval index updated per page (default: <out>/{INDEX_DIR})")
+    ap.add_argument("--no-index", action="store_true", help="Only write files; do not update the retrieval index")
     args = ap.parse_args()
 
+    urls = ([args.url] if args.url else []) + (read_url_list(Path(args.urls)) if args.urls else [])
+    if not urls:
+        ap.error("give a URL or --urls FILE")
+
     out_dir = Path(args.out)
     out_dir.mkdir(parents=True, exist_ok=True)
 
-    r = requests.get(args.url, timeout=args.timeout, headers={"User-Agent": "llm-demo-ingestor/1.0"})
-    r.raise_for_status()
-
-    # Save raw HTML for traceability
-    parsed = urlparse(args.url)
-    host = parsed.netloc.replace(":", "_")
-    path = parsed.path.strip("/").replace("/", "_")
-    base = slugify(f"{host}_{path}") or "page"
-
-    html_path = out_dir / f"{base}.html"
-    html_path.write_text(r.text, encoding="utf-8")
-
-    # Also save a crude text version (strip tags lightly)
-    text = re.sub(r"(?is)<script.*?>.*?</script>", "", r.text)
-    text = re.sub(r"(?is)<style.*?>.*?</style>", "", text)
-    text = re.sub(r"(?is)<[^>]+>", "\n", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    text = text.strip()
-
-    md_path = out_dir / f"{base}.md"
-    md_path.write_text(f"# Source: {args.url}\n\n{text[:8000]}\n", encoding="utf-8")
+    cache = FetchCache(Path(args.cache) if args.cache else out_dir / ".fetch_cache.sqlite")
+    fetcher = Fetcher(cache, max_workers=args.workers, per_host=args.per_host, timeout=args.timeout)
+    # Only trust validators when the processed page is still on disk.
+    conditional = {u: not args.force and (out_dir / f"{base_name(u)}.md").exists() for u in urls}
 
+    # Exact / near-duplicate pages (mirrors, re-hosted copies) are not added to the KB.
+    sigs = open_index(out_dir, args.dup_threshold)
+    # Each ingested page becomes a new index generation; running services pick it up live.
+    search_index = None if args.no_index else Index(Path(args.index) if args.index else out_dir / INDEX_DIR)
+    counts = {"fetched": 0, "not_modified": 0, "unchanged": 0, "error": 0, "duplicate": 0}
+    started = time.monotonic()
+    try:
+        for res in fetcher.fetch_many(urls, conditional):
+            counts[res.status] += 1
+            if res.changed:
+                md_path = write_page(out_dir, res.url, res.text)
+                md_text = md_path.read_text(encoding="utf-8")
+                dups = sigs.matches(md_text, exclude=md_path.name)
+                if dups and not args.keep_duplicates:
+                    md_path.unlink()
+                    md_path.with_suffix(".html").unlink(missing_ok=True)
+                    if search_index is not None:
+                        search_index.delete([md_path.name])
+                    counts["fetched"] -= 1
+                    counts["duplicate"] += 1
+                    print(f"duplicate  {res.url} ({dups[0].kind} match of {dups[0].doc_id}, similarity {dups[0].similarity:.2f})")
+                    continue
+                sigs.add(md_path.name, md_text)
+                gen = search_index.update({md_path.name: md_text}) if search_index is not None else None
+                indexed = f", index generation {gen}" if gen is not None else ""
+                print(f"ingested   {res.url} -> {md_path} ({res.elapsed_ms:.0f} ms{indexed})")
+            elif res.status == "error":
+                print(f"error      {res.url}: {res.error}", file=sys.stderr)
+            elif len(urls) == 1:
+                print(f"{res.status:<10} {res.url}")
+    finally:
+        fetcher.close()
+        cache.close()
+        sigs.close()
 
-    print(f"Ingested:\n- {md_path}\n- {html_path}")
+    secs = time.monotonic() - started
+    print(
+        f"{len(set(urls))} URLs in {secs:.1f}s: {counts['fetched']} ingested, "
+        f"{counts['not_modified']} not modified (304), {counts['unchanged']} unchanged, "
+        f"{counts['duplicate']} duplicates skipped, {counts['error']} errors"
+    )
+    if counts["error"]:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
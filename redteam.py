@@ -2,50 +2,81 @@ import argparse
 import json
 from pathlib import Path
 
-def load_jsonl(path: Path):
-    rows = []
-    with path.open("r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if line:
-                rows.append(json.loads(line))
-    return rows
+from app.analytics import STATE_VERSION, RunAnalytics, scan_log
+
+
+def load_state(path: Path):
+    """Aggregates + checkpoint from the previous report, or (None, None) to start over."""
+    try:
+        state = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None, None
+    if state.get("checkpoint", {}).get("version") != STATE_VERSION:
+        return None, None
+    return RunAnalytics.from_state(state["aggregates"]), state["checkpoint"]
+
+
+def fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def group_table(title, groups):
+    md = [f"## By {title}\n", "| Group | Runs | ALLOW | BLOCK | Risk p50 | Risk p90 | Latency p50 ms | Latency p95 ms | Latency p99 ms |"]
+    md.append("|---|---:|---:|---:|---:|---:|---:|---:|---:|")
+    for key, g in groups.items():
+        risk, lat = g["risk_score"], g["latency_ms"]
+        md.append(
+            f"| {key} | {g['runs']} | {g['allow']} | {g['block']} | {fmt(risk.get('p50'), '.0f')} | {fmt(risk.get('p90'), '.0f')} "
+            f"| {fmt(lat.get('p50'), '.0f')} | {fmt(lat.get('p95'), '.0f')} | {fmt(lat.get('p99'), '.0f')} |"
+        )
+    md.append("")
+    return md
+
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("--runs", default="logs/run_log.jsonl")
+    ap.add_argument("--runs", default="out/run_log.jsonl", help="Run log; rotated .jsonl.gz segments next to it are read too")
     ap.add_argument("--out", default="out_eval")
+    ap.add_argument("--incremental", action="store_true", help="Only read records added since the last report")
     args = ap.parse_args()
 
-    runs = load_jsonl(Path(args.runs))
     outdir = Path(args.out); outdir.mkdir(parents=True, exist_ok=True)
+    state_path = outdir / "eval_state.json"
+
+    analytics, checkpoint = (load_state(state_path) if args.incremental else (None, None))
+    if analytics is None:
+        analytics = RunAnalytics()
+    before = analytics.overall.runs
+    checkpoint = scan_log(Path(args.runs), analytics, checkpoint)
 
-    total = len(runs)
+    report = analytics.report()
+    total = report["total_runs"]
     if total == 0:
         raise SystemExit("No runs found. Run demo.py first.")
-
-    blocks = sum(1 for r in runs if r["action"] == "BLOCK")
-    allows = sum(1 for r in runs if r["action"] in ("ALLOW", "ALLOW_WITH_GUARDRAILS"))
-    avg_risk = sum(r["risk_score"] for r in runs) / total
-
-    report = {
-        "total_runs": total,
-        "allow_count": allows,
-        "block_count": blocks,
-        "avg_risk_score": avg_risk,
-    }
+    report["new_runs"] = total - before
 
     (outdir / "eval_report.json").write_text(json.dumps(report, indent=2), encoding="utf-8")
+    tmp = state_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps({"checkpoint": checkpoint, "aggregates": analytics.to_state()}), encoding="utf-8")
+    tmp.replace(state_path)
 
     md = []
     md.append("# Evaluation Report\n")
-    md.append(f"- Total runs: {total}")
-    md.append(f"- ALLOW(+guardrails): {allows}")
-    md.append(f"- BLOCK: {blocks}")
-    md.append(f"- Avg risk score: {avg_risk:.1f}\n")
+    md.append(f"- Total runs: {total} ({report['new_runs']} new)")
+    md.append(f"- ALLOW(+guardrails): {report['allow_count']}")
+    md.append(f"- BLOCK: {report['block_count']}")
+    md.append(f"- Avg risk score: {fmt(report['avg_risk_score'])}")
+    lat = report["overall"]["latency_ms"]
+    md.append(f"- Latency ms: p50={fmt(lat.get('p50'), '.0f')} p95={fmt(lat.get('p95'), '.0f')} p99={fmt(lat.get('p99'), '.0f')}")
+    if report["bad_lines"] or report["missing_action"]:
+        md.append(f"- Skipped malformed lines: {report['bad_lines']}; rows without action: {report['missing_action']}")
+    md.append("")
+    md += group_table("intent", report["by_intent"])
+    md += group_table("action", report["by_action"])
+    md += group_table("day", report["by_day"])
     (outdir / "eval_report.md").write_text("\n".join(md), encoding="utf-8")
 
     print("Wrote", outdir / "eval_report.md")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
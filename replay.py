@@ -0,0 +1,230 @@
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.artifacts import ArtifactWriter
+from app.cascade import ModelPlan
+from app.batch import run_batch
+from app.evaluation import compute_metrics, diff_metrics, load_dataset
+from app.index import INDEX_DIR, Index
+from app.llm_client import OllamaClient
+from app.rag import RISK_POLICIES, LocalRAG
+from app.runlog import MemoryRunLog
+from app.scheduler import request_context
+from app.standin import StandInConfig, StandInServer
+from app.transcript import Transcript
+from app.triage_cache import TriageCache
+from demo import run_one
+
+RESULT_FIELDS = (
+    "intent",
+    "action",
+    "risk_score",
+    "total_ms",
+    "stage_ms",
+    "llm_calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "json_calls",
+    "json_valid",
+    "repair_calls",
+    "sources",
+    "cited",
+    "degraded",
+    "triage_cache_similarity",
+    "stage_usage",
+    "escalated",
+)
+
+
+def load_results(path: Path) -> List[Dict[str, Any]]:
+    """
+    Result rows keyed by case_id; a later successful row replaces an earlier failure.
+    Lines that do not parse (a row torn by a crash) are skipped, as in load_checkpoint.
+    """
+    rows: Dict[str, Dict[str, Any]] = {}
+    with path.open("r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(row, dict) and row.get("case_id") and (not row.get("error") or row["case_id"] not in rows):
+                rows[row["case_id"]] = row
+    return list(rows.values())
+
+
+def load_metrics(path: Path) -> Dict[str, Any]:
+    if path.is_dir():
+        path = path / "metrics.json"
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def fmt(v: Optional[float]) -> str:
+    return "-" if v is None else f"{v:g}"
+
+
+def cmd_run(args: argparse.Namespace) -> None:
+    try:
+        plan = ModelPlan.from_args(args.model, args.small_model, band=args.escalate_band)
+    except ValueError as e:
+        raise SystemExit(f"--escalate-band: {e}")
+    out_dir = Path(args.out)
+    results_path = out_dir / "results.jsonl"
+    if results_path.exists() and not args.resume:
+        results_path.unlink()
+
+    transcript: Optional[Transcript] = None
+    if args.record or args.replay:
+        transcript = Transcript(Path(args.replay or args.record), "replay" if args.replay else "record")
+
+    standin: Optional[StandInServer] = None
+    base_url = args.base_url
+    if args.standin and not args.replay:
+        standin = StandInServer(
+            config=StandInConfig(
+                latency_ms=args.standin_latency_ms,
+                malformed_rate=args.standin_malformed_rate,
+                broken_rate=args.standin_broken_rate,
+            )
+        ).start()
+        base_url = standin.base_url
+    llm = OllamaClient(base_url=base_url, transcript=transcript)
+
+    rag: Optional[LocalRAG] = None
+    if args.rag and Path(args.rag).is_dir() and args.rag_index:
+        Index(Path(args.rag) / INDEX_DIR).sync_dir(Path(args.rag))
+        rag = LocalRAG.from_index(Path(args.rag) / INDEX_DIR, max_chars=2000, risk_policy=args.rag_risk)
+    elif args.rag and Path(args.rag).is_dir():
+        rag = LocalRAG(kb_dir=Path(args.rag), max_chars=2000, risk_policy=args.rag_risk)
+    writer = ArtifactWriter(workers=2)
+    triage_cache = TriageCache(threshold=args.triage_cache_similarity) if args.triage_cache else None
+    labels = {}
+
+    def handle(case: Dict[str, Any]) -> Dict[str, Any]:
+        log = MemoryRunLog()
+        with request_context(tenant=case.get("client_id"), deadline_s=args.deadline):
+            run_one(
+                llm=llm,
+                rag=rag,
+                out_dir=out_dir / "cases",
+                model=plan,
+                user_prompt=case["user_prompt"],
+                capstone=False,
+                deadline_s=args.deadline,
+                writer=writer,
+                run_log=log,
+                triage_cache=triage_cache,
+            )
+        record = log.records[0].to_dict()
+        return {"expected_action": case["expected_action"], **{k: record[k] for k in RESULT_FIELDS}}
+
+    def cases():
+        for case in load_dataset(Path(args.dataset)):
+            labels[case["case_id"]] = case["expected_action"]
+            yield case
+
+    try:
+        report = run_batch(cases(), handle, out_path=results_path, workers=args.workers, resume=args.resume)
+    finally:
+        writer.shutdown()
+        if standin is not None:
+            standin.stop()
+        if transcript is not None:
+            transcript.close()
+
+    rows = load_results(results_path)
+    for row in rows:
+        row.setdefault("expected_action", labels.get(row["case_id"]))
+    metrics = compute_metrics(rows)
+    metrics["backend"] = f"replay:{args.replay}" if args.replay else "stand-in" if args.standin else base_url
+    metrics["model"] = args.model
+    metrics["models"] = plan.to_dict()
+    metrics["throughput_per_s"] = report.summary()["throughput_per_s"]
+    (out_dir / "metrics.json").write_text(json.dumps(metrics, indent=2), encoding="utf-8")
+
+    print(f"Replayed {metrics['cases']} cases ({metrics['errors']} errors) -> {out_dir / 'metrics.json'}")
+    for name in ("attack_success_rate", "false_block_rate", "json_validity_rate", "citation_coverage"):
+        print(f"  {name:<22} {fmt(metrics[name])}")
+    if triage_cache is not None:
+        print(f"  triage cache           {metrics['triage_cache_hits']} BLOCK reuses, false reuse rate {fmt(metrics['triage_cache_false_reuse_rate'])}")
+    print(f"  {'repair_calls':<22} {metrics['repair_calls']}")
+    if plan.can_escalate("triage"):
+        print(f"  {'escalation_rate':<22} {fmt(metrics['escalation_rate'])}")
+    if transcript is not None:
+        ts = transcript.stats()
+        if args.replay:
+            print(f"  transcript             {ts['hits']} replayed, {ts['misses']} missing (see errors in results.jsonl)")
+        else:
+            print(f"  transcript             {ts['recorded']} responses recorded -> {transcript.path}")
+    for stage, p in metrics["latency_ms"].items():
+        print(f"  latency {stage:<14} p50={p['p50']:.0f} p95={p['p95']:.0f} p99={p['p99']:.0f} ms")
+    for stage, models in metrics["stage_models"].items():
+        for name, agg in models.items():
+            print(f"  model   {stage:<14} {name:<16} {agg['calls']} calls {agg['tokens']} tokens {agg['ms']:.0f} ms")
+
+
+def cmd_diff(args: argparse.Namespace) -> None:
+    d = diff_metrics(
+        load_metrics(Path(args.base)),
+        load_metrics(Path(args.new)),
+        rate_tolerance=args.rate_tolerance,
+        latency_tolerance=args.latency_tolerance,
+    )
+    print(f"{'metric':<32} {'base':>10} {'new':>10} {'delta':>10}")
+    for row in d["metrics"]:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"{row['metric']:<32} {fmt(row['base']):>10} {fmt(row['new']):>10} {fmt(row['delta']):>10}{flag}")
+    if d["new_mismatches"]:
+        print("\nNewly misclassified: " + ", ".join(d["new_mismatches"]))
+    if d["fixed_mismatches"]:
+        print("Fixed: " + ", ".join(d["fixed_mismatches"]))
+    if d["regressions"]:
+        raise SystemExit(f"\n{len(d['regressions'])} regression(s): " + ", ".join(d["regressions"]))
+    print("\nNo regressions.")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay a red-team dataset through run_one and compare runs")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    run = sub.add_parser("run", help="Replay a dataset and write results.jsonl + metrics.json")
+    run.add_argument("--dataset", default="logs/redteam_dataset.jsonl")
+    run.add_argument("--out", default="out_eval/replay")
+    run.add_argument("--workers", type=int, default=4)
+    run.add_argument("--resume", action="store_true", help="Keep finished cases from a previous run into --out")
+    run.add_argument("--model", default="llama3.1")
+    run.add_argument("--small-model", default="", help="Model for intent / triage / repair (escalates to --model)")
+    run.add_argument("--escalate-band", default="25,80", help="Small-model triage risk_score range re-asked of --model")
+    run.add_argument("--base-url", default="http://localhost:11434", help="Ollama (or compatible) endpoint")
+    run.add_argument("--standin", action="store_true", help="Use the built-in rule-based stand-in model")
+    run.add_argument("--standin-latency-ms", type=float, default=0.0)
+    run.add_argument("--standin-malformed-rate", type=float, default=0.0)
+    run.add_argument("--standin-broken-rate", type=float, default=0.0)
+    run.add_argument("--rag", default="", help="Knowledge base directory")
+    run.add_argument("--rag-index", action="store_true", help="Retrieve from the KB's persistent index (synced first)")
+    run.add_argument("--rag-risk", choices=RISK_POLICIES, default="flag", help="Handling of passages flagged at index time")
+    run.add_argument("--deadline", type=float, default=None)
+    run.add_argument("--triage-cache", action="store_true", help="Reuse BLOCK verdicts for near-duplicate prompts")
+    run.add_argument("--triage-cache-similarity", type=float, default=0.6)
+    run.add_argument("--record", default="", metavar="FILE", help="Store every LLM request/response in a transcript")
+    run.add_argument("--replay", default="", metavar="FILE", help="Serve LLM responses from a transcript, no network")
+
+    diff = sub.add_parser("diff", help="Compare two runs (directories or metrics.json files)")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    diff.add_argument("--rate-tolerance", type=float, default=0.0, help="Allowed absolute worsening of a rate")
+    diff.add_argument("--latency-tolerance", type=float, default=0.10, help="Allowed relative latency growth")
+
+    args = ap.parse_args()
+    if args.cmd == "run" and args.record and args.replay:
+        ap.error("--record and --replay are mutually exclusive")
+    if args.cmd == "run":
+        cmd_run(args)
+    else:
+        cmd_diff(args)
+
+
+if __name__ == "__main__":
+    main()
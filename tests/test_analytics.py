@@ -0,0 +1,57 @@
+import gzip
+import json
+import random
+
+from app.analytics import RunAnalytics, scan_log
+from app.sketch import QuantileSketch
+
+
+def test_sketch_quantiles_are_within_relative_error_and_merge():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(5, 1) for _ in range(20000)]
+    a, b = QuantileSketch(0.01), QuantileSketch(0.01)
+    a.extend(values[:10000])
+    b.extend(values[10000:])
+    a.merge(QuantileSketch.from_dict(json.loads(json.dumps(b.to_dict()))))
+
+    exact = sorted(values)
+    for q in (0.5, 0.95, 0.99):
+        truth = exact[int(q * (len(exact) - 1))]
+        assert abs(a.quantile(q) - truth) / truth <= 0.02
+    assert a.count == 20000
+
+
+def _line(**row):
+    return json.dumps(row) + "\n"
+
+
+def test_scan_reads_gz_segments_tolerates_bad_rows_and_resumes(tmp_path):
+    log = tmp_path / "run_log.jsonl"
+    with gzip.open(tmp_path / "run_log-20240101-000000-1-0001.jsonl.gz", "wt") as f:
+        f.write(_line(timestamp="20240101_101010", action="BLOCK", risk_score=90))
+        f.write(_line(timestamp="2024-01-01T11:00:00", intent="GENERIC_QA", action="ALLOW", risk_score=5, total_ms=120))
+    log.write_text(_line(user_prompt="no action here") + "not json\n" + _line(action="ALLOW", risk_score=0))
+
+    a = RunAnalytics()
+    cp = scan_log(log, a)
+    r = a.report()
+    assert (r["total_runs"], r["block_count"], r["allow_count"]) == (4, 1, 2)
+    assert r["missing_action"] == 1 and r["bad_lines"] == 1
+    assert r["by_day"]["2024-01-01"]["runs"] == 2
+
+    # Incremental: append to the live file, then rotate + gzip it as RunLog would.
+    with log.open("a") as f:
+        f.write(_line(action="BLOCK", risk_score=80) + '{"action": "ALL')  # last line still being written
+    b = RunAnalytics.from_state(json.loads(json.dumps(a.to_state())))
+    cp = scan_log(log, b, cp)
+    assert b.report()["total_runs"] == 5
+
+    with log.open("a") as f:
+        f.write('OW"}\n')
+    rotated = tmp_path / "run_log-20240102-000000-1-0002.jsonl.gz"
+    with gzip.open(rotated, "wb") as f:
+        f.write(log.read_bytes())
+    log.unlink()
+    cp = scan_log(log, b, cp)
+    assert b.report()["total_runs"] == 6
+    assert scan_log(log, b, cp) == cp and b.report()["total_runs"] == 6
@@ -0,0 +1,97 @@
+import json
+
+import pytest
+
+from app.archive import ArchiveError, CaseArchive
+from app.artifacts import MANIFEST_NAME, ArtifactWriter
+
+
+def test_append_get_query_and_roll(tmp_path):
+    archive = CaseArchive(tmp_path / "archive", segment_bytes=300)
+    for i in range(5):
+        action = "BLOCK" if i % 2 else "ALLOW"
+        archive.append(f"case{i}", {"answer.md": f"# Answer {i}\n".encode()}, meta={"intent": "GENERIC_QA", "action": action})
+
+    assert len(archive.segments()) > 1
+    assert archive.get("case3").files["answer.md"] == b"# Answer 3\n"
+    assert [r["case_id"] for r in archive.query(action="block")] == ["case3", "case1"]
+    assert archive.reserve("case1") == "case1_2"
+
+    out = archive.export("case3", tmp_path / "exported")
+    assert (out / "answer.md").read_text() == "# Answer 3\n"
+    assert json.loads((out / MANIFEST_NAME).read_text())["status"] == "complete"
+    archive.close()
+
+
+def test_recovers_unindexed_records_and_torn_tail(tmp_path):
+    root = tmp_path / "archive"
+    archive = CaseArchive(root)
+    archive.append("a", {"x.json": b"{}"})
+    archive.append("b", {"x.json": b"[]"})
+    archive.close()
+
+    (root / "index.sqlite").unlink()
+    for extra in root.glob("index.sqlite-*"):
+        extra.unlink()
+    seg = archive.segments()[-1]
+    with seg.open("ab") as f:
+        f.write(b"CAR1\x00\x01")  # crash mid-append
+
+    reopened = CaseArchive(root)
+    assert reopened.get("b").files["x.json"] == b"[]"
+    assert reopened.stats()["cases"] == 2
+    reopened.append("c", {"x.json": b"1"})
+    assert reopened.reindex() == 3
+    reopened.close()
+
+
+def test_readonly_open_leaves_a_partial_tail_alone(tmp_path):
+    root = tmp_path / "archive"
+    writer = CaseArchive(root)
+    writer.append("a", {"x.json": b"{}"})
+    seg = writer.segments()[-1]
+    with seg.open("ab") as f:
+        f.write(b"CAR1\x00\x01")  # a record another process is still writing
+    size = seg.stat().st_size
+
+    reader = CaseArchive(root, readonly=True)
+    assert reader.get("a").files["x.json"] == b"{}"
+    assert reader.stats()["cases"] == 1
+    with pytest.raises(ArchiveError):
+        reader.append("b", {"x.json": b"[]"})
+    reader.close()
+    assert seg.stat().st_size == size
+    writer.close()
+
+    with pytest.raises(ArchiveError):
+        CaseArchive(tmp_path / "missing", readonly=True)
+
+
+def test_writer_appends_one_record_per_case(tmp_path):
+    archive = CaseArchive(tmp_path / "archive")
+    writer = ArtifactWriter(workers=2, archive=archive)
+    case = tmp_path / "20240101_000000_hello_GENERIC_QA_ALLOW"
+    writer.json(case, "retrieval.json", {"confidence": "low"})
+    writer.text(case, "answer.md", "# Answer\n\nhello\n")
+    writer.pdf(case, "answer.pdf", "# Answer\n\nhello\n", "Answer")
+    assert json.loads(writer.read_text(case, "retrieval.json")) == {"confidence": "low"}
+    writer.close_case(case, meta={"intent": "GENERIC_QA", "action": "ALLOW"})
+    assert writer.wait_case(case, timeout=10)
+    writer.shutdown()
+
+    assert not case.exists()
+    stored = archive.get(case.name)
+    assert stored.meta["action"] == "ALLOW"
+    assert stored.files["answer.pdf"].startswith(b"%PDF")
+    assert json.loads(writer.read_text(case, "retrieval.json")) == {"confidence": "low"}
+    archive.close()
+
+
+def test_discarded_case_releases_its_reserved_id(tmp_path):
+    archive = CaseArchive(tmp_path / "archive")
+    writer = ArtifactWriter(background=False, archive=archive)
+    case = tmp_path / archive.reserve("case")
+    writer.json(case, "intent.json", {"intent": "GENERIC_QA"})
+    writer.discard_case(case)
+    assert archive.reserve("case") == "case"
+    archive.close()
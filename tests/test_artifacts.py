@@ -0,0 +1,69 @@
+import json
+import threading
+
+import pytest
+
+from app.artifacts import MANIFEST_NAME, ArtifactWriter
+
+
+def test_background_writer_completes_manifest(tmp_path):
+    gate = threading.Event()
+
+    def slow_write(path, text):
+        gate.wait(5)
+        path.write_text(text, encoding="utf-8")
+
+    writer = ArtifactWriter(workers=2)
+    case = tmp_path / "case"
+    case.mkdir()
+    writer.text(case, "answer.md", "# Answer\n")
+    writer.submit(case, "answer.pdf", slow_write, case / "answer.pdf", "pdf")
+    writer.close_case(case)
+
+    assert writer.wait_artifact(case, "answer.md", timeout=5)
+    manifest = json.loads((case / MANIFEST_NAME).read_text())
+    assert manifest["status"] == "pending"
+
+    gate.set()
+    assert writer.wait_case(case, timeout=5)
+    manifest = json.loads((case / MANIFEST_NAME).read_text())
+    assert manifest["status"] == "complete"
+    assert set(manifest["artifacts"]) == {"answer.md", "answer.pdf"}
+    writer.shutdown()
+
+
+def test_failed_job_marks_manifest_failed(tmp_path):
+    def boom(*_):
+        raise OSError("disk full")
+
+    writer = ArtifactWriter(workers=1)
+    writer.submit(tmp_path, "answer.pdf", boom)
+    writer.close_case(tmp_path)
+    writer.shutdown()
+    manifest = json.loads((tmp_path / MANIFEST_NAME).read_text())
+    assert manifest["status"] == "failed"
+    assert "disk full" in manifest["artifacts"]["answer.pdf"]["error"]
+
+
+class _FailsInGeneration:
+    replies = ['{"intent": "GENERIC_QA", "confidence": 0.9}', '{"action": "ALLOW", "risk_score": 5, "risk_rationale": "ok"}']
+
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, messages, model, temperature, max_tokens, on_token=None, **kwargs):
+        from app.llm_client import LLMResponse
+
+        self.calls += 1
+        if self.calls > len(self.replies):
+            raise RuntimeError("backend went away")
+        return LLMResponse(text=self.replies[self.calls - 1], raw={})
+
+
+def test_inline_writer_forgets_a_case_whose_pipeline_raised(tmp_path):
+    from app.artifacts import INLINE
+    from demo import run_one
+
+    with pytest.raises(RuntimeError, match="backend went away"):
+        run_one(_FailsInGeneration(), None, tmp_path, "m", "What is RAG?", False)
+    assert not any(case.parent == tmp_path for case in INLINE._cases)
@@ -0,0 +1,49 @@
+import json
+
+from app.batch import load_cases, percentile, run_batch
+from replay import load_results
+
+
+def test_percentile_interpolates():
+    assert percentile([], 50) == 0.0
+    assert percentile([10, 20, 30, 40], 50) == 25.0
+    assert percentile([5], 99) == 5.0
+
+
+def test_run_batch_resumes_from_checkpoint(tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text(
+        "\n".join(json.dumps({"case_id": f"c{i}", "user_prompt": f"q{i}"}) for i in range(6)) + "\n",
+        encoding="utf-8",
+    )
+    out = tmp_path / "out.jsonl"
+    seen = []
+
+    def flaky(case):
+        seen.append(case["case_id"])
+        if case["case_id"] == "c3":
+            raise RuntimeError("boom")
+        return {"action": "ALLOW"}
+
+    first = run_batch(load_cases(src), flaky, out_path=out, workers=3)
+    assert (first.completed, first.failed) == (5, 1)
+
+    seen.clear()
+    second = run_batch(load_cases(src), lambda c: seen.append(c["case_id"]) or {"action": "ALLOW"}, out_path=out, workers=3)
+    assert seen == ["c3"]
+    assert (second.skipped, second.completed) == (5, 1)
+
+
+def test_resume_after_a_torn_last_line(tmp_path):
+    src = tmp_path / "in.jsonl"
+    src.write_text("\n".join(json.dumps({"case_id": c, "user_prompt": c}) for c in "ab") + "\n", encoding="utf-8")
+    out = tmp_path / "out.jsonl"
+    out.write_text(json.dumps({"case_id": "a", "user_prompt": "a", "action": "ALLOW"}) + '\n{"case_id":"b","ok"', encoding="utf-8")
+
+    report = run_batch(load_cases(src), lambda c: {"action": "ALLOW"}, out_path=out, workers=2)
+    assert (report.skipped, report.completed) == (1, 1)
+    rows = [json.loads(line) for line in out.read_text(encoding="utf-8").splitlines()]
+    assert [r["case_id"] for r in rows] == ["a", "b"]
+
+    out.write_text(out.read_text(encoding="utf-8") + '{"case_id":"c"', encoding="utf-8")
+    assert [r["case_id"] for r in load_results(out)] == ["a", "b"]
@@ -0,0 +1,64 @@
+import pytest
+
+from app.artifacts import ArtifactWriter
+from app.cascade import ModelPlan
+from app.llm_client import LLMResponse, OllamaClient
+from app.runlog import MemoryRunLog
+from app.standin import StandInServer
+from demo import run_one
+
+
+def test_plan_falls_back_to_generation_model_and_escalates_outside_clear_ranges():
+    single = ModelPlan.single("big")
+    assert single.to_dict() == {"intent": "big", "triage": "big", "repair": "big", "generation": "big"}
+    assert single.triage_escalation("ALLOW", 50) is None
+
+    plan = ModelPlan.from_args("big", "small", repair="mid")
+    assert plan.to_dict() == {"intent": "small", "triage": "small", "repair": "mid", "generation": "big"}
+    assert plan.triage_escalation("ALLOW", 10) is None and plan.triage_escalation("BLOCK", 95) is None
+    assert plan.triage_escalation("ALLOW_WITH_GUARDRAILS", 50) == "ambiguous_risk"
+    assert plan.triage_escalation("BLOCK", 5) == "inconsistent_verdict"
+    with pytest.raises(ValueError):
+        ModelPlan.from_args("big", "small", band="50")
+
+
+def test_run_one_attributes_usage_per_stage_and_model(tmp_path):
+    plan = ModelPlan.from_args("big", "small", band="0,100")  # every small-model triage verdict is re-asked
+    log = MemoryRunLog()
+    with StandInServer() as server:
+        run_one(OllamaClient(base_url=server.base_url), None, tmp_path, plan, "What is RAG?", False,
+                writer=ArtifactWriter(background=False), run_log=log)
+
+    record = log.records[0]
+    assert record.model == "big" and record.escalated == "triage:ambiguous_risk"
+    assert {stage: sorted(models) for stage, models in record.stage_usage.items()} == {
+        "intent": ["small"],
+        "triage": ["big", "small"],
+        "generation": ["big"],
+    }
+    assert sum(m["calls"] for models in record.stage_usage.values() for m in models.values()) == record.llm_calls
+
+
+class _GarbageLargeModel:
+    """Small-model calls go to the stand-in; the large model only ever answers with prose."""
+
+    def __init__(self, inner):
+        self.inner = inner
+
+    def chat(self, messages, model, temperature, max_tokens, on_token=None, **kwargs):
+        if model == "big" and on_token is None:
+            return LLMResponse(text="I think this request is probably fine.", raw={})
+        return self.inner.chat(messages, model, temperature=temperature, max_tokens=max_tokens, on_token=on_token, **kwargs)
+
+
+def test_failed_triage_escalation_keeps_the_small_model_verdict(tmp_path):
+    plan = ModelPlan.from_args("big", "small", band="0,100")
+    log = MemoryRunLog()
+    with StandInServer() as server:
+        _, _, triage_out, _ = run_one(
+            _GarbageLargeModel(OllamaClient(base_url=server.base_url)), None, tmp_path, plan, "What is RAG?", False,
+            writer=ArtifactWriter(background=False), run_log=log,
+        )
+
+    assert triage_out.action == "ALLOW"
+    assert log.records[0].escalated == "triage:ambiguous_risk,triage:escalation_failed"
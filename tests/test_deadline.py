@@ -0,0 +1,60 @@
+import math
+import time
+
+from app.artifacts import ArtifactWriter
+from app.deadline import Deadline
+from app.llm_client import OllamaClient
+from app.runlog import MemoryRunLog
+from app.standin import StandInConfig, StandInServer
+from demo import run_one
+
+
+class FakeClock:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_unused_budget_rolls_forward():
+    clock = FakeClock()
+    d = Deadline(total_s=10.0, clock=clock)
+    with d.stage("intent") as b:
+        assert math.isclose(b.budget_s, 1.0)
+        clock.t += 0.2
+    # 9.8s left, shared by the remaining stages in proportion to their shares
+    with d.stage("retrieval") as b:
+        assert math.isclose(b.budget_s, 9.8 * 0.05 / 0.90)
+    assert d.misses == []
+
+
+def test_overrun_is_recorded_and_unbounded_never_misses():
+    clock = FakeClock()
+    d = Deadline(total_s=1.0, clock=clock)
+    with d.stage("intent"):
+        clock.t += 0.5
+    assert d.misses[0]["stage"] == "intent" and d.misses[0]["fallback"] == "over_budget"
+    assert d.to_dict()["stages"]["intent"]["over_budget"] is True
+
+    free = Deadline(total_s=math.inf, clock=clock)
+    with free.stage("generation") as b:
+        clock.t += 1000
+        assert not b.bounded() and not b.expired()
+    assert free.misses == []
+
+
+def test_streamed_generation_is_cut_off_at_its_budget(tmp_path):
+    log = MemoryRunLog()
+    question = "What does the policy say about " + "late submissions and extensions, " * 12
+    with StandInServer(config=StandInConfig(ms_per_token=100)) as server:
+        started = time.monotonic()
+        _, _, _, answer = run_one(
+            OllamaClient(base_url=server.base_url), None, tmp_path, "m", question, False,
+            deadline_s=2.0, writer=ArtifactWriter(background=False), run_log=log,
+        )
+        elapsed = time.monotonic() - started
+
+    assert elapsed < 4.0  # the stand-in takes ~10s to stream the whole answer
+    assert "generation:safe_response" in log.records[0].deadline_misses
+    assert "stand-in answer" not in answer
@@ -0,0 +1,45 @@
+import random
+
+from app.dedup import SignatureIndex
+from app.rag import LocalRAG
+
+WORDS = "policy student integrity assessment turnitin appeal extension rubric evidence misconduct referencing".split()
+
+
+def _doc(seed, n=400):
+    rnd = random.Random(seed)
+    return " ".join(rnd.choice(WORDS) + str(rnd.randint(0, 50)) for _ in range(n))
+
+
+def test_exact_and_near_duplicates_survive_reopen(tmp_path):
+    base = _doc(1)
+    index = SignatureIndex(tmp_path / "sig.sqlite")
+    index.add("a.md", "# Source: https://a.example/p\n\n" + base)
+    for i in range(20):
+        index.add(f"other{i}.md", _doc(100 + i))
+    index.close()
+
+    index = SignatureIndex(tmp_path / "sig.sqlite")
+    mirror = "# Source: https://mirror.example/p\n\n" + base.upper().replace(" ", "  ")
+    assert [(d.doc_id, d.kind) for d in index.matches(mirror)] == [("a.md", "exact")]
+
+    edited = base.split()
+    edited[200:203] = ["changed", "words", "here"]
+    (near,) = index.matches(" ".join(edited))
+    assert near.doc_id == "a.md" and near.kind == "near" and near.similarity >= 0.8
+
+    assert index.matches(_doc(999)) == []
+    assert index.matches(base, exclude="a.md") == []
+    assert index.retain(["a.md"]) == 20 and len(index) == 1
+
+
+def test_local_rag_indexes_mirrored_files_once(tmp_path):
+    text = "Late submissions need an approved extension. " * 40
+    (tmp_path / "policy_extensions.md").write_text("# Source: https://uni.example/ext\n\n" + text)
+    (tmp_path / "policy_extensions_mirror.md").write_text("# Source: https://mirror.example/ext\n\n" + text)
+    (tmp_path / "turnitin_guidance.md").write_text("Turnitin similarity reports are indicative only. " * 40)
+
+    rag = LocalRAG(tmp_path)
+    assert rag.doc_names == ["policy_extensions.md", "turnitin_guidance.md"]
+    assert rag.duplicates == {"policy_extensions_mirror.md": "policy_extensions.md"}
+    assert len(LocalRAG(tmp_path, dedup=False).doc_names) == 3
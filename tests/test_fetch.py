@@ -0,0 +1,65 @@
+import hashlib
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.fetch import FetchCache, Fetcher
+
+PAGES = {f"/p{i}": f"<html><body><h1>Page {i}</h1><p>policy text {i}</p></body></html>" for i in range(8)}
+
+
+class _Site:
+    def __init__(self):
+        self.statuses = []
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with site.lock:
+                    site.active += 1
+                    site.peak = max(site.peak, site.active)
+                time.sleep(0.02)
+                body = PAGES[self.path].encode()
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                status = 304 if self.headers.get("If-None-Match") == etag else 200
+                with site.lock:
+                    site.active -= 1
+                    site.statuses.append(status)
+                self.send_response(status)
+                self.send_header("ETag", etag)
+                self.send_header("Content-Length", "0" if status == 304 else str(len(body)))
+                self.end_headers()
+                if status == 200:
+                    self.wfile.write(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self.base = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+
+def test_bulk_fetch_respects_per_host_limit_and_revalidates(tmp_path):
+    site = _Site()
+    urls = [site.base + p for p in PAGES]
+    cache = FetchCache(tmp_path / "fetch.sqlite")
+    try:
+        fetcher = Fetcher(cache, max_workers=8, per_host=2)
+        first = list(fetcher.fetch_many(urls))
+        assert sorted(r.status for r in first) == ["fetched"] * 8 and site.peak <= 2
+
+        PAGES["/p3"] += "<p>amended</p>"
+        second = {r.url: r.status for r in Fetcher(cache, per_host=4).fetch_many(urls)}
+        assert second.pop(site.base + "/p3") == "fetched"
+        assert set(second.values()) == {"not_modified"}
+        assert site.statuses.count(304) == 7
+
+        # Without trusting validators (e.g. the page's output was deleted) the body comes back.
+        assert fetcher.fetch(urls[0], conditional=False).changed
+    finally:
+        cache.close()
+        site.httpd.shutdown()
@@ -0,0 +1,41 @@
+from app.html2md import convert_stream, html_to_markdown, iter_chunks
+
+PAGE = (
+    "<html><head><title>Policy &amp; Guide</title><style>p{color:red}</style></head><body>"
+    "<nav>Home | About</nav><h1>Academic  Integrity</h1><p>Use <b>AI</b> tools &lt;responsibly&gt;.<br>Cite them.</p>"
+    "<ul><li>Disclose use<ul><li>in the appendix</li></ul></li><li>Keep drafts</li></ul>"
+    "<table><tr><th>Tool</th><th>Allowed</th></tr><tr><td>Grammar</td><td>Yes</td></tr></table>"
+    "<script>if (a < b) { steal(); }</script><pre>x = 1\n  y = 2</pre><footer>(c) Uni</footer></body></html>"
+)
+
+
+def test_structure_is_preserved_and_chrome_dropped():
+    assert html_to_markdown(PAGE) == (
+        "# Academic Integrity\n\n"
+        "Use AI tools <responsibly>.\nCite them.\n\n"
+        "- Disclose use\n  - in the appendix\n- Keep drafts\n\n"
+        "| Tool | Allowed |\n| Grammar | Yes |\n\n"
+        "```\nx = 1\n  y = 2\n```"
+    )
+
+
+def test_block_elements_inside_list_items_and_headings():
+    html = (
+        "<ul><li><p>Item one</p></li><li><p>Item two</p></li><li></li></ul>"
+        "<ol><li><div>First</div></li><li>Second</li></ol>"
+        "<h2><span>Ti</span><div>tle</div></h2><p>Body</p>"
+    )
+    assert html_to_markdown(html) == (
+        "- Item one\n- Item two\n\n"
+        "1. First\n2. Second\n\n"
+        "## Ti tle\n\nBody"
+    )
+
+
+def test_chunk_boundaries_do_not_change_output_and_nothing_is_truncated():
+    page = "<body>" + "".join(f"<h2>Part {i}</h2><p>{'word ' * 50}</p>" for i in range(400)) + "</body>"
+    out = []
+    title = convert_stream(iter_chunks(PAGE + page, size=7), out.append)
+    assert title == "Policy & Guide"
+    assert "".join(out) == html_to_markdown(PAGE + page)
+    assert len("".join(out)) > 100_000 and "## Part 399" in "".join(out)
@@ -0,0 +1,64 @@
+import pytest
+from pydantic import BaseModel
+
+from app.jsonrepair import STATS, JSONRepairError, extract_json_object, repair_json
+from app.postprocess import parse_or_repair
+
+
+def test_extract_first_object_not_greedy():
+    assert extract_json_object('x {"a": "}"} y {"b": 2}') == '{"a": "}"}'
+
+
+@pytest.mark.parametrize(
+    "raw, expected",
+    [
+        ('```json\n{"a": 1}\n```', {"a": 1}),
+        ("{'intent': 'GENERIC_QA', 'confidence': 0.9,}", {"intent": "GENERIC_QA", "confidence": 0.9}),
+        ('{"text": "line1\nline2", "x": [1, 2,]}', {"text": "line1\nline2", "x": [1, 2]}),
+        ('{"action": "BLOCK", "threats": [{"evidence": "ign', {"action": "BLOCK", "threats": [{"evidence": "ign"}]}),
+        ('{"a": 1, "b":', {"a": 1, "b": None}),
+    ],
+)
+def test_repairs_common_failures(raw, expected):
+    assert repair_json(raw) == expected
+
+
+def test_unrepairable_raises():
+    with pytest.raises(JSONRepairError):
+        repair_json("I cannot help with that.")
+
+
+class _Out(BaseModel):
+    a: int
+
+
+def test_parse_or_repair_skips_llm_when_local_repair_works():
+    calls = []
+    before = STATS.saved_calls
+    out = parse_or_repair("{'a': 1,}", _Out, lambda raw, err: calls.append(err) or '{"a": 2}')
+    assert out.a == 1 and calls == []
+    assert STATS.saved_calls == before + 1
+
+
+class _Scripted:
+    def __init__(self, *texts):
+        self.texts, self.prompts = list(texts), []
+
+    def chat(self, messages, model, temperature, max_tokens, **kwargs):
+        from app.llm_client import LLMResponse
+
+        self.prompts.append(messages[-1]["content"])
+        return LLMResponse(text=self.texts.pop(0), raw={})
+
+
+def test_truncated_triage_goes_to_llm_repair_instead_of_failing_open():
+    from demo import TriageOut, llm_json
+
+    cut = '{"risk_score": 95, "risk_rationale": "exfiltration", "action": "BL'
+    full = '{"action": "block", "risk_score": 95, "risk_rationale": "exfiltration"}'
+    llm = _Scripted(cut, full)
+    data = llm_json(llm, "m", [{"role": "user", "content": "triage"}], "{...}", 420, out_cls=TriageOut)
+    assert TriageOut(**data).action == "BLOCK"
+    assert len(llm.prompts) == 2 and "BAD_OUTPUT" in llm.prompts[1]
+    with pytest.raises(ValueError):
+        TriageOut(action="BL", risk_score=95, risk_rationale="x")
@@ -0,0 +1,40 @@
+import os
+
+from app.artifacts import ArtifactWriter
+from app.pdfcache import PDFCache
+
+
+def test_hit_is_linked_not_rendered(tmp_path):
+    cache = PDFCache(tmp_path / "cache")
+    a = tmp_path / "a" / "answer.pdf"
+    b = tmp_path / "b" / "answer.pdf"
+
+    assert cache.materialize("# Blocked\n\nNo.", a, title="Safe response") is False
+    assert cache.materialize("# Blocked\n\nNo.", b, title="Safe response") is True
+    assert os.stat(a).st_ino == os.stat(b).st_ino
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # A different title is different content.
+    assert cache.materialize("# Blocked\n\nNo.", tmp_path / "c.pdf", title="Other") is False
+
+
+def test_writer_uses_cache_and_completes_manifest(tmp_path):
+    cache = PDFCache(tmp_path / "cache")
+    writer = ArtifactWriter(workers=2, pdf_cache=cache)
+    for name in ("one", "two"):
+        case = tmp_path / name
+        writer.pdf(case, "answer.pdf", "same body", "Title")
+        writer.close_case(case)
+        assert writer.wait_case(case, timeout=10)
+    writer.shutdown()
+    assert (tmp_path / "two" / "answer.pdf").read_bytes().startswith(b"%PDF")
+    assert cache.stats()["hits"] == 1
+
+
+def test_eviction_keeps_linked_copies(tmp_path):
+    cache = PDFCache(tmp_path / "cache", max_bytes=1, evict_every=1)
+    dest = tmp_path / "case" / "answer.pdf"
+    cache.materialize("first", dest)
+    cache.materialize("second", tmp_path / "case" / "other.pdf")
+    assert cache.stats()["evictions"] >= 1
+    assert dest.read_bytes().startswith(b"%PDF")
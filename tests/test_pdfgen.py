@@ -0,0 +1,22 @@
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from app.pdfgen import render_pdf_bytes, text_width, wrap_words
+
+
+def test_cached_widths_match_reportlab():
+    s = "Marking rubric — HD/D/C/P criteria"
+    assert abs(text_width(s, "Helvetica", 11) - stringWidth(s, "Helvetica", 11)) < 1e-6
+
+
+def test_wrap_fits_width_and_keeps_words():
+    text = "alpha beta gamma delta " * 40
+    lines = wrap_words(text, "Helvetica", 11, 200)
+    assert all(stringWidth(line, "Helvetica", 11) <= 200 for line in lines)
+    assert " ".join(lines).split() == text.split()
+
+
+def test_long_word_is_split_and_pdf_renders():
+    url = "https://example.org/" + "x" * 400
+    lines = wrap_words(url, "Helvetica", 11, 200)
+    assert len(lines) > 1 and "".join(lines) == url
+    assert render_pdf_bytes("# Title\n\n- " + url, title="T").startswith(b"%PDF")
@@ -0,0 +1,75 @@
+import os
+import signal
+import time
+
+import pytest
+
+from app.prefork import PreforkServer, request
+
+
+def _setup():
+    def handle(body, on_token):
+        if body["user_prompt"] == "boom":
+            raise ValueError("bad prompt")
+        if on_token:
+            for piece in ("Hel", "lo"):
+                on_token(piece)
+        return {"pid": os.getpid(), "answer": "Hello"}
+
+    return handle, lambda: None
+
+
+def test_prefork_workers_stream_recycle_and_clean_up(tmp_path):
+    path = tmp_path / "warm.sock"
+    server = PreforkServer(path, _setup, workers=2, max_requests=1)
+    pid = os.fork()
+    if pid == 0:
+        try:
+            server.serve_forever()
+        finally:
+            os._exit(0)
+    try:
+        deadline = time.monotonic() + 5
+        while not path.exists() and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        pieces = []
+        first = request(path, {"user_prompt": "hi"}, on_token=pieces.append, timeout=5)
+        assert first["answer"] == "Hello" and pieces == ["Hel", "lo"]
+        with pytest.raises(RuntimeError, match="ValueError: bad prompt"):
+            request(path, {"user_prompt": "boom"}, timeout=5)
+        # max_requests=1: every request is served by a fresh worker forked by the parent.
+        pids = {request(path, {"user_prompt": str(i)}, timeout=5)["pid"] for i in range(3)}
+        assert len(pids) == 3 and first["pid"] not in pids
+    finally:
+        os.kill(pid, signal.SIGTERM)
+        os.waitpid(pid, 0)
+    assert not path.exists()
+
+
+def _failing_setup():
+    raise OSError("model config missing")
+
+
+def test_workers_failing_in_setup_stop_the_server(tmp_path):
+    path = tmp_path / "warm.sock"
+    server = PreforkServer(path, _failing_setup, workers=2, max_fast_failures=4)
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            server.serve_forever()
+        except RuntimeError:
+            code = 3
+        finally:
+            os._exit(code)
+    deadline = time.monotonic() + 10
+    done, status = 0, 0
+    while not done and time.monotonic() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        time.sleep(0.01)
+    if not done:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    assert done and os.waitstatus_to_exitcode(status) == 3
+    assert not path.exists()
@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from app.llm_client import LLMResponse
+from app.runlog import MemoryRunLog, RunLog, RunRecord, iter_segments, note_usage, open_segment, usage_scope
+
+
+def _record(i: int) -> RunRecord:
+    return RunRecord(
+        case_id=f"case{i}",
+        case_ref=f"out/case{i}",
+        user_prompt="hello " * 20,
+        model="llama3.1",
+        intent="GENERIC_QA",
+        intent_confidence=0.9,
+        action="ALLOW",
+        risk_score=5,
+    )
+
+
+def _read_all(path):
+    rows = []
+    for seg in iter_segments(path):
+        with open_segment(seg) as f:
+            rows.extend(json.loads(line) for line in f if line.strip())
+    return rows
+
+
+def test_buffers_until_flush_and_keeps_schema(tmp_path):
+    path = tmp_path / "run_log.jsonl"
+    log = RunLog(path, flush_bytes=1 << 20, flush_interval_s=0)
+    log.write(_record(1))
+    assert not path.exists() or path.stat().st_size == 0
+    log.close()
+    (row,) = _read_all(path)
+    assert set(row) == set(_record(0).to_dict())
+
+
+def test_rotates_by_size_and_day_and_compresses(tmp_path):
+    path = tmp_path / "run_log.jsonl"
+    log = RunLog(path, flush_bytes=1, flush_interval_s=0, rotate_bytes=1000)
+    for i in range(10):
+        log.write(_record(i))
+    yesterday = time.time() - 86400
+    os.utime(path, (yesterday, yesterday))
+    log.write(_record(10))
+    log.close()
+
+    segments = iter_segments(path)
+    assert log.rotations >= 2
+    assert all(p.suffix == ".gz" for p in segments[:-1])
+    assert [r["case_id"] for r in _read_all(path)] == [f"case{i}" for i in range(11)]
+
+
+def _worker(path, start):
+    log = RunLog(path, flush_bytes=2000, flush_interval_s=0, rotate_bytes=20000)
+    for i in range(start, start + 100):
+        log.write(_record(i))
+    log.close()
+
+
+def test_concurrent_processes_do_not_interleave(tmp_path):
+    path = tmp_path / "run_log.jsonl"
+    ctx = multiprocessing.get_context("fork")
+    procs = [ctx.Process(target=_worker, args=(path, n * 100)) for n in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(30)
+    rows = _read_all(path)
+    assert sorted(r["case_id"] for r in rows) == sorted(f"case{i}" for i in range(400))
+
+
+def test_usage_scope_collects_token_counts():
+    with usage_scope() as usage:
+        note_usage({"prompt_eval_count": 20, "eval_count": 7})
+        note_usage({"prompt_eval_count": 5})
+    note_usage({"eval_count": 100})  # outside any scope: ignored
+    assert (usage.calls, usage.prompt_tokens, usage.completion_tokens) == (2, 25, 7)
+
+
+class _FailsAfterIntent:
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, messages, model, temperature, max_tokens, on_token=None, **kwargs):
+        self.calls += 1
+        if self.calls > 1:
+            raise RuntimeError("backend went away")
+        return LLMResponse(text='{"intent": "GENERIC_QA", "confidence": 0.9}', raw={"prompt_eval_count": 12, "eval_count": 4})
+
+
+def test_failed_run_still_writes_a_record(tmp_path):
+    from demo import run_one
+
+    log = MemoryRunLog()
+    with pytest.raises(RuntimeError, match="backend went away"):
+        run_one(_FailsAfterIntent(), None, tmp_path, "m", "What is RAG?", False, run_log=log)
+    [rec] = log.records
+    assert rec.action == "ERROR"
+    assert rec.error == "RuntimeError: backend went away"
+    assert rec.case_id.startswith("failed-")
+    assert rec.prompt_tokens == 12
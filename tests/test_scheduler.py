@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from app.scheduler import LANE_BULK, LANE_INTERACTIVE, AdmissionRejected, FairScheduler, _Ticket
+
+
+def _run_queued(sched, jobs):
+    """Hold the single slot, queue `jobs` behind it, then record dispatch order."""
+    order = []
+    gate = threading.Event()
+
+    def hold():
+        with sched.slot("m", cost=1, lane=LANE_BULK, tenant="holder"):
+            gate.wait(5)
+
+    def job(name, cost, lane, tenant):
+        with sched.slot("m", cost=cost, lane=lane, tenant=tenant):
+            order.append(name)
+
+    threads = [threading.Thread(target=hold)]
+    threads[0].start()
+    time.sleep(0.05)
+    for spec in jobs:
+        t = threading.Thread(target=job, args=spec)
+        t.start()
+        threads.append(t)
+        time.sleep(0.02)
+    gate.set()
+    for t in threads:
+        t.join(5)
+    return order
+
+
+def test_priority_lane_dispatches_before_bulk():
+    sched = FairScheduler(default_cap=1)
+    order = _run_queued(sched, [("gen", 1800, LANE_BULK, "a"), ("triage", 420, LANE_INTERACTIVE, "b")])
+    assert order == ["triage", "gen"]
+
+
+def test_weighted_fair_queuing_interleaves_tenants():
+    sched = FairScheduler(default_cap=1)
+    jobs = [(f"bulk{i}", 1800, LANE_BULK, "bulk") for i in range(3)] + [("qa", 650, LANE_BULK, "student")]
+    order = _run_queued(sched, jobs)
+    assert order.index("qa") < order.index("bulk2")
+
+
+def test_deadline_aware_rejection():
+    sched = FairScheduler(default_cap=1)
+    sched._service_ewma[("m", LANE_BULK)] = 5.0
+    with pytest.raises(AdmissionRejected):
+        with sched.slot("m", cost=1800, lane=LANE_BULK, deadline=time.monotonic() + 1.0):
+            pass
+    assert sched.rejected == 1
+
+
+def test_cancelled_tickets_do_not_count_towards_the_wait_estimate():
+    sched = FairScheduler(default_cap=1)
+    sched._service_ewma[("m", LANE_BULK)] = 2.0
+    queue = sched._queues.setdefault(("m", LANE_BULK), [])
+    for i in range(3):
+        queue.append(_Ticket(i, i, 0.0, LANE_BULK, "t", "m", 1, 0.0, None, cancelled=i > 0))
+    assert sched._estimate_wait("m", LANE_BULK) == 2.0
@@ -0,0 +1,71 @@
+import time
+
+from app.llm_client import LLMResponse, OllamaClient
+from app.prompts import build_assessment_section_messages
+from app.runlog import MemoryRunLog
+from app.standin import StandInServer
+from demo import generate_sections, run_one
+
+PROMPT = "Design a capstone assessment on prompt injection"
+
+
+def test_sectioned_assessment_writes_each_call_to_its_artifact(tmp_path):
+    log, streamed = MemoryRunLog(), []
+    with StandInServer() as server:
+        case_dir, _, _, answer = run_one(
+            OllamaClient(base_url=server.base_url), None, tmp_path, "m", PROMPT, False,
+            on_token=streamed.append, run_log=log, sectioned=True,
+        )
+
+    assert (case_dir / "rubric.md").read_text() == "# Marking Rubric\n- Analysis (40%)\n- Implementation (40%)\n- Reflection (20%)\n"
+    assert (case_dir / "submission_checklist.md").read_text().startswith("# Submission Checklist\n- Report")
+    assert (case_dir / "assessment_brief.md").read_text().startswith(f"# Assessment Brief\nStand-in brief for: {PROMPT}")
+    text = "".join(streamed)
+    assert text.index("# Assessment Brief") < text.index("# Marking Rubric") < text.index("# Submission Checklist")
+    assert answer.startswith("# Assessment Brief") and log.records[0].stage_usage["generation"]["m"]["calls"] == 3
+
+
+class _LeakyClient:
+    """The rubric call leaks a key straight away; the others stream slowly until cancelled."""
+
+    def __init__(self):
+        self.pieces = 0
+
+    def chat(self, messages, model, temperature, max_tokens, on_token=None, **kwargs):
+        if "Marking Rubric" in messages[-1]["content"]:
+            on_token("# Marking Rubric\nkey AKIA" + "A" * 16 + "\n")
+        for _ in range(50):
+            time.sleep(0.01)
+            on_token("word ")
+            self.pieces += 1
+        return LLMResponse(text="word " * 50, raw={})
+
+
+def test_first_section_abort_cancels_the_others():
+    sections = {name: build_assessment_section_messages(PROMPT, name) for name in ("assessment_brief.md", "rubric.md", "submission_checklist.md")}
+    llm = _LeakyClient()
+    texts, aborted = generate_sections(llm, "m", sections, 0.2, None, [])
+    assert aborted is not None and aborted.kind == "secret"
+    assert llm.pieces < 20 and "rubric.md" not in texts
+
+
+class _LeaksAfterHeldText(_LeakyClient):
+    """The rubric streams a held-back intro before its key; the brief streams live."""
+
+    def chat(self, messages, model, temperature, max_tokens, on_token=None, **kwargs):
+        if "Marking Rubric" in messages[-1]["content"]:
+            time.sleep(0.05)
+            on_token("# Marking Rubric\n" + "Rubric intro text. " * 10)
+            time.sleep(0.05)
+            on_token("key AKIA" + "A" * 16 + "\n")
+        return super().chat(messages, model, temperature, max_tokens, on_token=on_token, **kwargs)
+
+
+def test_cancelled_sections_stream_nothing_more():
+    sections = {name: build_assessment_section_messages(PROMPT, name) for name in ("assessment_brief.md", "rubric.md", "submission_checklist.md")}
+    streamed = []
+    texts, aborted = generate_sections(_LeaksAfterHeldText(), "m", sections, 0.2, None, [], on_token=streamed.append)
+    assert aborted is not None and aborted.kind == "secret"
+    text = "".join(streamed)
+    assert "Rubric" not in text and "AKIA" not in text
+    assert set(text.split()) <= {"word"}
@@ -0,0 +1,83 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+
+from app.server import Overloaded, PipelineService, RequestError, ServiceConfig
+
+
+def _post(url, body):
+    req = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=5) as r:
+        return r.status, r.read().decode()
+
+
+def _service(runner, **kw):
+    svc = PipelineService(runner, ServiceConfig(port=0, **kw))
+    threading.Thread(target=svc.serve_forever, kwargs={"install_signals": False}, daemon=True).start()
+    return svc
+
+
+def test_run_and_stream_endpoints():
+    def runner(body, on_token):
+        if on_token:
+            for piece in ("Hel", "lo"):
+                on_token(piece)
+        return {"answer": "Hello", "prompt": body["user_prompt"]}
+
+    svc = _service(runner)
+    try:
+        status, text = _post(svc.address + "/run", {"user_prompt": "hi"})
+        assert status == 200 and json.loads(text)["answer"] == "Hello"
+
+        _, text = _post(svc.address + "/stream", {"user_prompt": "hi"})
+        events = [json.loads(line) for line in text.splitlines()]
+        assert [e["text"] for e in events if e["event"] == "token"] == ["Hel", "lo"]
+        assert events[-1]["event"] == "result"
+    finally:
+        assert svc.shutdown()
+
+
+def test_sheds_load_with_429_when_queue_full():
+    release = threading.Event()
+    entered = threading.Event()
+
+    def runner(body, on_token):
+        entered.set()
+        release.wait(5)
+        return {"ok": True}
+
+    svc = _service(runner, max_concurrency=1, max_queue=0)
+    try:
+        t = threading.Thread(target=_post, args=(svc.address + "/run", {"user_prompt": "slow"}))
+        t.start()
+        assert entered.wait(5)
+        try:
+            _post(svc.address + "/run", {"user_prompt": "fast"})
+            raise AssertionError("expected 429")
+        except urllib.error.HTTPError as e:
+            assert e.code == 429
+        release.set()
+        t.join(5)
+    finally:
+        release.set()
+        svc.shutdown()
+
+
+def test_stream_rejections_before_the_first_token_keep_their_status():
+    def runner(body, on_token):
+        if not body.get("user_prompt"):
+            raise RequestError("'user_prompt' is required")
+        raise Overloaded("m: estimated 9.0s exceeds remaining 1.0s")
+
+    svc = _service(runner)
+    try:
+        for body, code in (({}, 400), ({"user_prompt": "hi"}, 429)):
+            try:
+                _post(svc.address + "/stream", body)
+                raise AssertionError(f"expected {code}")
+            except urllib.error.HTTPError as e:
+                assert e.code == code
+                assert code != 429 or e.headers["Retry-After"] == "1"
+    finally:
+        assert svc.shutdown()
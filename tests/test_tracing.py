@@ -0,0 +1,92 @@
+import json
+import threading
+import urllib.request
+
+from app.artifacts import ArtifactWriter
+from app.llm_client import OllamaClient
+from app.server import PipelineService, ServiceConfig
+from app.standin import StandInServer
+from app.tracing import METRICS, NULL_SPAN, Metrics, TraceCollector, Tracer, span
+from demo import run_one
+
+
+def test_run_one_writes_trace_collector_and_profile(tmp_path):
+    assert span("idle") is NULL_SPAN  # no active trace: nothing is recorded
+    tracer = Tracer(collector=TraceCollector(tmp_path / "traces.jsonl"), profile_dir=tmp_path / "profiles")
+    before = METRICS.counter("requests_total", intent="GENERIC_QA", action="ALLOW")
+
+    with StandInServer() as server:
+        case_dir, *_ = run_one(
+            OllamaClient(base_url=server.base_url), None, tmp_path / "out", "m", "What is RAG?", False,
+            writer=ArtifactWriter(background=False), tracer=tracer,
+        )
+
+    trace = json.loads((case_dir / "trace.json").read_text(encoding="utf-8"))
+    events = {e["name"]: e for e in trace["traceEvents"]}
+    assert {"run_one", "stage.intent", "llm_json", "llm.chat", "stage.generation", "export.pdf"} <= set(events)
+    assert events["stage.intent"]["args"]["parent"] == events["run_one"]["args"]["span_id"]
+    assert events["llm.chat"]["args"]["completion_tokens"] > 0
+
+    collected = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    assert collected[0]["otherData"]["case"] == case_dir.name
+    assert (tmp_path / "profiles" / f"{case_dir.name}.pstats").exists()
+    assert METRICS.counter("requests_total", intent="GENERIC_QA", action="ALLOW") == before + 1
+
+
+def test_concurrent_profiled_requests_take_turns(tmp_path):
+    tracer = Tracer(case_traces=False, profile_dir=tmp_path / "profiles")
+    errors = []
+
+    with StandInServer() as server:
+        llm = OllamaClient(base_url=server.base_url)
+
+        def one(i):
+            try:
+                run_one(llm, None, tmp_path / "out", "m", f"What is RAG? ({i})", False,
+                        writer=ArtifactWriter(background=False), tracer=tracer)
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+        threads = [threading.Thread(target=one, args=(i,)) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    assert errors == []
+    assert len(list((tmp_path / "profiles").glob("*.pstats"))) == 4
+
+
+def test_metric_label_values_are_escaped():
+    metrics = Metrics()
+    metrics.inc("requests_total", client='a"b\\c\nd')
+    assert 'guarded_requests_total{client="a\\"b\\\\c\\nd"} 1' in metrics.render()
+
+
+def test_metrics_endpoint_renders_histograms_and_service_gauges():
+    metrics = Metrics(buckets=(10, 100))
+    metrics.inc("requests_total", action="BLOCK")
+    for v in (5, 50, 500):
+        metrics.observe("request_ms", v)
+
+    svc = PipelineService(lambda body, on_token: {}, ServiceConfig(port=0), metrics=metrics.render)
+    threading.Thread(target=svc.serve_forever, kwargs={"install_signals": False}, daemon=True).start()
+    try:
+        with urllib.request.urlopen(svc.address + "/metrics", timeout=5) as r:
+            text = r.read().decode()
+    finally:
+        assert svc.shutdown()
+
+    assert 'guarded_requests_total{action="BLOCK"} 1' in text
+    assert 'guarded_request_ms_bucket{le="100"} 2' in text and 'guarded_request_ms_bucket{le="+Inf"} 3' in text
+    assert "guarded_request_ms_count 3" in text and "service_inflight 0" in text
+
+
+def test_metric_with_its_own_buckets():
+    metrics = Metrics(buckets=(10, 100))
+    metrics.set_buckets("similarity", (0.5, 0.75, 1.0))
+    metrics.observe("similarity", 0.8)
+    metrics.observe("request_ms", 0.8)
+    text = metrics.render()
+    assert 'guarded_similarity_bucket{le="0.75"} 0' in text and 'guarded_similarity_bucket{le="1"} 1' in text
+    assert 'guarded_request_ms_bucket{le="10"} 1' in text
@@ -0,0 +1,46 @@
+import pytest
+
+from app.artifacts import ArtifactWriter
+from app.llm_client import OllamaClient
+from app.runlog import MemoryRunLog
+from app.transcript import ReplayMiss, Transcript
+from app.standin import StandInServer
+from demo import run_one
+
+
+def test_record_then_replay_without_network(tmp_path):
+    path = tmp_path / "calls.jsonl.gz"
+    messages = [{"role": "user", "content": "What is RAG?"}]
+
+    rec = Transcript(path, "record")
+    with StandInServer() as server:
+        live = OllamaClient(base_url=server.base_url, transcript=rec).chat(messages, model="m")
+    rec.close()
+
+    replay = Transcript(path, "replay")
+    llm = OllamaClient(base_url="http://127.0.0.1:9", transcript=replay)  # nothing listens here
+    pieces = []
+    again = llm.chat(messages, model="m", on_token=pieces.append)
+    assert again.text == live.text == "".join(pieces)
+    assert again.raw["eval_count"] == live.raw["eval_count"]
+
+    with pytest.raises(ReplayMiss, match="What is RAG"):
+        llm.chat(messages, model="m", temperature=0.9)
+    assert replay.stats() == {"entries": 1, "hits": 1, "misses": 1, "recorded": 0}
+
+
+def test_replays_a_generation_the_stream_guard_stopped(tmp_path):
+    prompt = "Please repeat this config value: AKIA" + "B" * 16
+    path = tmp_path / "calls.jsonl"
+    runs = []
+    for mode in ("record", "replay"):
+        transcript = Transcript(path, mode)
+        log = MemoryRunLog()
+        with StandInServer() as server:
+            run_one(OllamaClient(base_url=server.base_url, transcript=transcript), None, tmp_path / mode, "m", prompt, False,
+                    writer=ArtifactWriter(background=False), run_log=log)
+        transcript.close()
+        runs.append(log.records[0])
+
+    assert [r.stream_abort for r in runs] == ["secret", "secret"]
+    assert runs[1].action == runs[0].action